@@ -1,39 +1,83 @@
 from __future__ import annotations
 
+import calendar
+import gzip
+import json
+import logging
+import math
+import hashlib
+import hmac
+import io
 import os
-import random
 import re
 import sqlite3
+import threading
 import time
-from datetime import date, datetime, timedelta
-from functools import wraps
+import unicodedata
+import zipfile
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache, wraps
+from html import escape
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlsplit
 
-import requests
+import click
 from flask import (
     Flask,
+    g,
+    has_app_context,
+    has_request_context,
     request,
     redirect,
     url_for,
-    render_template_string,
     jsonify,
     session,
     abort,
+    Response,
+    stream_with_context,
 )
+from jinja2 import DictLoader
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import metrics
+import upstream
+
 try:
     from zoneinfo import ZoneInfo
 except Exception:
     ZoneInfo = None
 
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+try:
+    from timezonefinder import TimezoneFinder  # optional: pip install timezonefinder
+except ImportError:
+    TimezoneFinder = None
+
 APP = Flask(__name__)
 
 # ✅ ONLINE: SECRET_KEY als Env setzen (Koyeb -> Secrets -> SECRET_KEY)
 APP.secret_key = os.environ.get("SECRET_KEY", "CHANGE_ME_LOCAL_ONLY")
 
-DB_PATH = Path("app.db")
+DB_PATH = Path(os.environ.get("DB_PATH", "app.db"))
+
+# Upstream-Basis-URLs (per Env z.B. auf bench/fake_upstream.py umbiegbar)
+ALADHAN_API = os.environ.get("ALADHAN_API", "https://api.aladhan.com/v1")
+NOMINATIM_API = os.environ.get("NOMINATIM_API", "https://nominatim.openstreetmap.org")
+QURAN_SEARCH_API = os.environ.get("QURAN_SEARCH_API", "https://alquran-api.pages.dev/api/quran")
+
+# /admin/metrics: Admin-Session oder "Authorization: Bearer $METRICS_TOKEN" (für Prometheus)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 
 # Admin seed
 ADMIN_USERNAME = "i3mad"
@@ -46,14 +90,20 @@ RATE_LIMITS = {
     "city_search": (40, 60),   # 40 / 1 min
     "favorite": (60, 60),
     "track_done": (40, 60),
+    "prayer_prefetch": (20, 60),  # global, alle Worker zusammen
+    "calendar_export": (10, 60),
 }
 
-_RATE_BUCKET: dict[tuple[str, str], list[float]] = {}
-_FAILED_LOGINS: dict[tuple[str, str], dict[str, float]] = {}
 LOCKOUT_FAILS = 8
 LOCKOUT_WINDOW = 600
 LOCKOUT_TIME = 600
 
+# Limiter-Zustand liegt in SQLite (rate_buckets / login_failures), damit alle
+# gunicorn-Worker dieselben Grenzen sehen. Token-Bucket: ein UPSERT pro Prüfung.
+RATE_SWEEP_INTERVAL = 60
+RATE_MAX_KEYS = 50000
+_RATE_LAST_SWEEP = 0.0
+
 
 def client_ip() -> str:
     xff = request.headers.get("X-Forwarded-For", "")
@@ -62,33 +112,67 @@ def client_ip() -> str:
     return request.remote_addr or "unknown"
 
 
+def _rate_sweep(cur: sqlite3.Cursor, now: float):
+    global _RATE_LAST_SWEEP
+    if now - _RATE_LAST_SWEEP < RATE_SWEEP_INTERVAL:
+        return
+    _RATE_LAST_SWEEP = now
+    # ein Bucket, der ein ganzes Fenster lang ruhte, ist wieder voll -> Zeile überflüssig
+    max_win = max(win for _, win in RATE_LIMITS.values())
+    cur.execute("DELETE FROM rate_buckets WHERE updated_at<?", (now - max_win,))
+    cur.execute("DELETE FROM login_failures WHERE locked_until<? AND first<?", (now, now - LOCKOUT_WINDOW))
+    for table in ("rate_buckets", "login_failures"):
+        cur.execute(f"SELECT count(*) FROM {table}")
+        excess = cur.fetchone()[0] - RATE_MAX_KEYS
+        if excess > 0:
+            cur.execute(
+                f"DELETE FROM {table} WHERE k IN (SELECT k FROM {table} ORDER BY updated_at ASC LIMIT ?)",
+                (excess,),
+            )
+
+
+def rate_allow(endpoint_name: str, ip: str) -> bool:
+    max_req, win = RATE_LIMITS.get(endpoint_name, (999999, 1))
+    rate = max_req / win
+    now = time.time()
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO rate_buckets(k, tokens, updated_at) VALUES(?,?,?) "
+        "ON CONFLICT(k) DO UPDATE SET tokens=MIN(?, tokens + (? - updated_at) * ?) - 1, updated_at=? "
+        "WHERE MIN(?, tokens + (? - updated_at) * ?) >= 1",
+        (f"{endpoint_name}|{ip}", max_req - 1, now, max_req, now, rate, now, max_req, now, rate),
+    )
+    allowed = cur.rowcount == 1
+    _rate_sweep(cur, now)
+    conn.commit()
+    return allowed
+
+
 def rate_limit(endpoint_name: str):
     def deco(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            ip = client_ip()
-            key = (endpoint_name, ip)
-            now = time.time()
-            max_req, win = RATE_LIMITS.get(endpoint_name, (999999, 1))
-            bucket = _RATE_BUCKET.get(key, [])
-            bucket = [t for t in bucket if now - t <= win]
-            if len(bucket) >= max_req:
+            if not rate_allow(endpoint_name, client_ip()):
                 return ("Too many requests. Please wait a bit.", 429)
-            bucket.append(now)
-            _RATE_BUCKET[key] = bucket
             return fn(*args, **kwargs)
         return wrapper
     return deco
 
 
+def _lockout_key(username: str) -> str:
+    return f"{client_ip()}|{username.lower()}"
+
+
 def lockout_check(username: str) -> Optional[str]:
-    ip = client_ip()
-    key = (ip, username.lower())
     now = time.time()
-    state = _FAILED_LOGINS.get(key)
-    if not state:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT locked_until FROM login_failures WHERE k=?", (_lockout_key(username),))
+    row = cur.fetchone()
+    if not row:
         return None
-    locked_until = state.get("locked_until", 0.0)
+    locked_until = row["locked_until"]
     if locked_until and now < locked_until:
         remaining = int(locked_until - now)
         return f"Locked for {remaining}s due to too many failed logins."
@@ -96,26 +180,29 @@ def lockout_check(username: str) -> Optional[str]:
 
 
 def lockout_fail(username: str):
-    ip = client_ip()
-    key = (ip, username.lower())
+    key = _lockout_key(username)
     now = time.time()
-    state = _FAILED_LOGINS.get(key, {"count": 0, "first": now, "locked_until": 0})
-    if now - state.get("first", now) > LOCKOUT_WINDOW:
-        state = {"count": 0, "first": now, "locked_until": 0}
-
-    state["count"] = state.get("count", 0) + 1
-    if state["count"] >= LOCKOUT_FAILS:
-        state["locked_until"] = now + LOCKOUT_TIME
-        state["count"] = 0
-        state["first"] = now
-    _FAILED_LOGINS[key] = state
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO login_failures(k, count, first, locked_until, updated_at) VALUES(?,1,?,0,?) "
+        "ON CONFLICT(k) DO UPDATE SET "
+        "count=CASE WHEN ? - first > ? THEN 1 ELSE count + 1 END, "
+        "first=CASE WHEN ? - first > ? THEN ? ELSE first END, updated_at=?",
+        (key, now, now, now, LOCKOUT_WINDOW, now, LOCKOUT_WINDOW, now, now),
+    )
+    cur.execute(
+        "UPDATE login_failures SET locked_until=?, count=0, first=? WHERE k=? AND count>=?",
+        (now + LOCKOUT_TIME, now, key, LOCKOUT_FAILS),
+    )
+    conn.commit()
 
 
 def lockout_success(username: str):
-    ip = client_ip()
-    key = (ip, username.lower())
-    if key in _FAILED_LOGINS:
-        del _FAILED_LOGINS[key]
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM login_failures WHERE k=?", (_lockout_key(username),))
+    conn.commit()
 
 
 LANGS = [
@@ -176,12 +263,17 @@ T: dict[str, dict[str, str]] = {
         "search": "Suche",
         "search_placeholder": "Suche z.B. barmherzig / mercy / rahma",
         "no_results": "Keine Treffer gefunden.",
+        "results": "Treffer",
+        "prev": "Zurück",
+        "next": "Weiter",
         "surah": "Sura",
         "surahs": "Suren",
         "arabic": "Arabisch",
         "translation": "Übersetzung",
+        "side_by_side": "Nebeneinander",
         "back": "Zurück",
-        "showing_first_60": "Aktuell: erste 60 Verse (Paging kommt später).",
+        "verses": "Verse",
+        "all_verses": "Alle Verse",
         "verse_of_day": "Vers des Tages",
         "quick_actions": "Schnellzugriff",
         "open_settings": "Einstellungen öffnen",
@@ -213,6 +305,8 @@ T: dict[str, dict[str, str]] = {
         "invite_codes": "Invite Codes (Komma getrennt)",
         "yes": "Ja",
         "no": "Nein",
+        "month_view": "Monatsansicht",
+        "calendar_export": "Kalender (.ics)",
         "change_admin_pass": "Admin Passwort ändern",
         "new_password": "Neues Passwort",
         "update": "Update",
@@ -269,12 +363,17 @@ T: dict[str, dict[str, str]] = {
         "search": "Search",
         "search_placeholder": "Search e.g. mercy / rahma",
         "no_results": "No results found.",
+        "results": "results",
+        "prev": "Previous",
+        "next": "Next",
         "surah": "Surah",
         "surahs": "Surahs",
         "arabic": "Arabic",
         "translation": "Translation",
+        "side_by_side": "Side by side",
         "back": "Back",
-        "showing_first_60": "Currently: first 60 verses (paging later).",
+        "verses": "Verses",
+        "all_verses": "All verses",
         "verse_of_day": "Verse of the day",
         "quick_actions": "Quick actions",
         "open_settings": "Open settings",
@@ -306,6 +405,8 @@ T: dict[str, dict[str, str]] = {
         "invite_codes": "Invite codes (comma separated)",
         "yes": "Yes",
         "no": "No",
+        "month_view": "Month view",
+        "calendar_export": "Calendar (.ics)",
         "change_admin_pass": "Change admin password",
         "new_password": "New password",
         "update": "Update",
@@ -331,20 +432,226 @@ def tr(lang: str, key: str) -> str:
     return T[lang].get(key, T["en"].get(key, key))
 
 
-def db():
-    conn = sqlite3.connect(DB_PATH)
+# Eine Verbindung pro Request (auf g), WAL + NORMAL, damit Leser nicht auf Schreiber warten
+DB_BUSY_TIMEOUT_MS = 5000
+DB_STATEMENT_CACHE = 256
+
+
+# SQL-Trace (SQL_TRACE=1): Dauer pro Statement (normalisiert), langsame Statements ins
+# rotierende Log, und Warnung bei N+1 (dasselbe Statement SQL_NPLUS1-mal in einem Request).
+# Rotation ist nicht prozesssicher, daher eine Datei pro Worker: sql-slow.<pid>.log
+SQL_TRACE = os.environ.get("SQL_TRACE", "0") == "1"
+SQL_SLOW_MS = float(os.environ.get("SQL_SLOW_MS", "50"))
+SQL_NPLUS1 = int(os.environ.get("SQL_NPLUS1", "5"))
+SQL_SLOW_LOG = os.environ.get("SQL_SLOW_LOG", "sql-slow.log")
+SQL_TOP_N = 15
+
+_SQL_NORM_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SQL_LOG_PID: dict[str, int] = {}
+_SQL_LOG_LOCK = threading.Lock()
+
+
+def _sql_log() -> logging.Logger:
+    # Handler erst im Worker anlegen (nach dem Fork, auch bei preload_app)
+    log = logging.getLogger("islam_app.sql")
+    pid = os.getpid()
+    if _SQL_LOG_PID.get("pid") == pid:
+        return log
+    with _SQL_LOG_LOCK:
+        if _SQL_LOG_PID.get("pid") != pid:
+            for h in list(log.handlers):
+                log.removeHandler(h)
+            base, ext = os.path.splitext(SQL_SLOW_LOG)
+            h = RotatingFileHandler(f"{base}.{pid}{ext or '.log'}", maxBytes=5 * 1024 * 1024, backupCount=3,
+                                    encoding="utf-8", delay=True)
+            h.setFormatter(logging.Formatter("%(asctime)s pid=%(process)d %(message)s"))
+            log.addHandler(h)
+            log.setLevel(logging.INFO)
+            log.propagate = False
+            _SQL_LOG_PID["pid"] = pid
+    return log
+
+
+@lru_cache(maxsize=1024)
+def _sql_norm(sql: str) -> str:
+    # IN (?,?,?) -> IN (?…), Whitespace zusammenfassen, damit gleiche Statements zusammenfallen
+    return _SQL_NORM_RE.sub("(?…)", " ".join(sql.split()))[:300]
+
+
+def _sql_route() -> str:
+    return (request.endpoint or "unknown") if has_request_context() else "background"
+
+
+# zählt ausgeführte Statements pro Verbindung (für /admin/metrics), mit SQL_TRACE auch die Dauer
+class _Cursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        self.connection.queries += 1
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.connection.timed(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        self.connection.queries += 1
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self.connection.timed(sql, time.perf_counter() - t0)
+
+
+class _Connection(sqlite3.Connection):
+    queries = 0
+    seen: Optional[dict] = None
+
+    def timed(self, sql: str, seconds: float):
+        metrics.add_span("db", seconds)
+        if SQL_TRACE:
+            self.trace(sql, seconds)
+
+    def trace(self, sql: str, seconds: float):
+        norm = _sql_norm(sql)
+        if self.seen is None:
+            self.seen = {}
+        self.seen[norm] = self.seen.get(norm, 0) + 1
+        metrics.inc("sql_statement_calls_total", {"sql": norm})
+        metrics.inc("sql_statement_seconds_total", {"sql": norm}, seconds)
+        if seconds * 1000 >= SQL_SLOW_MS:
+            _sql_log().info("slow %.1fms route=%s sql=%s", seconds * 1000, _sql_route(), norm)
+
+    def check_nplus1(self, route: str):
+        for norm, n in (self.seen or {}).items():
+            if n >= SQL_NPLUS1:
+                metrics.inc("sql_nplus1_total", {"route": route, "sql": norm})
+                _sql_log().warning("n+1 %dx route=%s sql=%s", n, route, norm)
+        self.seen = None
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, cached_statements=DB_STATEMENT_CACHE,
+                           factory=_Connection)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
     return conn
 
 
+def db() -> sqlite3.Connection:
+    # innerhalb von Request/CLI/Hintergrundjob (App-Kontext) immer dieselbe Verbindung;
+    # geschlossen wird sie in close_db beim Teardown
+    if not has_app_context():
+        raise RuntimeError("db() needs an app context (use APP.app_context())")
+    if "db" not in g:
+        g.db = _connect()
+    return g.db
+
+
+@APP.teardown_appcontext
+def close_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        if conn.queries:
+            # Requests zählen schon in _metrics_end, hier bleibt CLI/Hintergrund
+            metrics.inc("db_queries_total", {"route": "background"}, conn.queries)
+        conn.close()
+
+
+# Metriken: Latenz pro Route/Status. Gemessen wird bis zum Teardown, bei gestreamten
+# Seiten also bis zum letzten Chunk (stream_with_context hält den Kontext so lange offen).
+# Dazu Spans (db, *_upstream, render, ...) als Server-Timing-Header und optional als
+# JSON-Zeile im Log (REQUEST_LOG=1).
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+REQUEST_LOG = os.environ.get("REQUEST_LOG", "0") == "1"
+_REQUEST_LOG = logging.getLogger("islam_app.request")
+if REQUEST_LOG and not _REQUEST_LOG.handlers:
+    _REQUEST_LOG.addHandler(logging.StreamHandler())
+    _REQUEST_LOG.setLevel(logging.INFO)
+    _REQUEST_LOG.propagate = False
+
+
+@APP.before_request
+def _metrics_start():
+    g._t0 = time.perf_counter()
+    g._spans = metrics.start_spans()
+
+
+@APP.after_request
+def _metrics_status(resp):
+    g._status = resp.status_code
+    spans = g.get("_spans")
+    if SERVER_TIMING and spans is not None:
+        # bei gestreamten Seiten fehlt hier der Großteil von render (kommt erst danach)
+        resp.headers["Server-Timing"] = metrics.server_timing(spans, time.perf_counter() - g._t0)
+    return resp
+
+
+@APP.teardown_request
+def _metrics_end(exc):
+    t0 = g.get("_t0")
+    if t0 is None:
+        return
+    route = request.endpoint or "unknown"
+    status = 500 if exc is not None else g.get("_status", 500)
+    seconds = time.perf_counter() - t0
+    metrics.observe("http_request_duration_seconds", seconds,
+                    {"route": route, "method": request.method, "status": str(status)})
+    spans = g.get("_spans")
+    metrics.stop_spans()
+    if REQUEST_LOG and spans is not None:
+        _REQUEST_LOG.info(json.dumps({
+            "ts": round(time.time(), 3), "method": request.method, "path": request.path, "route": route,
+            "status": status, "ms": round(seconds * 1000, 1),
+            "spans": {k: {"ms": round(v[0] * 1000, 1), "n": int(v[1])} for k, v in spans.items()},
+        }))
+    conn = g.get("db")
+    queries = conn.queries if conn is not None else 0
+    metrics.observe("db_queries_per_request", queries, {"route": route})
+    if queries:
+        metrics.inc("db_queries_total", {"route": route}, queries)
+        conn.queries = 0
+        conn.check_nplus1(route)
+    metrics.flush()
+
+
+@lru_cache(maxsize=None)
+def _upstream_span(host: str) -> str:
+    # Span-Name nach API; teilen sich mehrere APIs einen Host (Fake-Upstream), gewinnt die erste
+    for name, base in (("prayer_upstream", ALADHAN_API), ("quran_upstream", QURAN_API),
+                       ("search_upstream", QURAN_SEARCH_API), ("geo_upstream", NOMINATIM_API)):
+        if urlsplit(base).netloc == host:
+            return name
+    return "upstream"
+
+
+def _upstream_metrics(host: str, seconds: float, outcome: str):
+    if outcome != "rejected":
+        metrics.observe("upstream_request_duration_seconds", seconds, {"host": host})
+        metrics.add_span(_upstream_span(host), seconds)
+    metrics.inc("upstream_requests_total", {"host": host, "outcome": outcome})
+
+
+upstream.add_listener(_upstream_metrics)
+
+
 def _table_columns(conn: sqlite3.Connection, table: str) -> set[str]:
     cur = conn.cursor()
     cur.execute(f"PRAGMA table_info({table})")
     return {row[1] for row in cur.fetchall()}
 
 
-def init_db():
-    conn = db()
+# Schema-Migrationen: Version steht in PRAGMA user_version, jede Migration läuft
+# genau einmal in einer eigenen Transaktion (auch bei mehreren Workern gleichzeitig).
+def _migrate_base_schema(conn: sqlite3.Connection):
     cur = conn.cursor()
 
     cur.execute("""
@@ -396,6 +703,225 @@ def init_db():
       )
     """)
 
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS prayer_cache (
+        city TEXT NOT NULL,
+        country TEXT NOT NULL,
+        method TEXT NOT NULL,
+        day TEXT NOT NULL,
+        timings TEXT NOT NULL,
+        tz TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY(city, country, method, day)
+      )
+    """)
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS geo_cache (
+        city TEXT NOT NULL,
+        country TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        tz TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY(city, country)
+      )
+    """)
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS quran_surahs (
+        number INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        english_name TEXT NOT NULL,
+        english_name_translation TEXT NOT NULL DEFAULT '',
+        number_of_ayahs INTEGER NOT NULL,
+        revelation_type TEXT NOT NULL DEFAULT ''
+      )
+    """)
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS quran_ayahs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        edition TEXT NOT NULL,
+        number INTEGER NOT NULL,
+        surah INTEGER NOT NULL,
+        number_in_surah INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        UNIQUE(edition, surah, number_in_surah)
+      )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_quran_ayahs_number ON quran_ayahs(edition, number)")
+
+    # Volltextindex (rowid = quran_ayahs.id); ohne FTS5 fällt die Suche auf die Online-API zurück
+    try:
+        cur.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS quran_fts USING fts5("
+            "terms, edition UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except sqlite3.OperationalError:
+        pass
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS rate_buckets (
+        k TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+      )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated ON rate_buckets(updated_at)")
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS login_failures (
+        k TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        first REAL NOT NULL,
+        locked_until REAL NOT NULL,
+        updated_at REAL NOT NULL
+      )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_login_failures_updated ON login_failures(updated_at)")
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS prayer_days (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        mask INTEGER NOT NULL,
+        PRIMARY KEY(user_id, day)
+      )
+    """)
+
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS user_streaks (
+        user_id INTEGER PRIMARY KEY,
+        streak INTEGER NOT NULL,
+        last_day TEXT NOT NULL
+      )
+    """)
+
+
+def _migrate_prayer_constraints(conn: sqlite3.Connection):
+    # alte Doppelklicks entfernen, danach ist (user, day, prayer) eindeutig
+    cur = conn.cursor()
+    cur.execute("DELETE FROM prayers WHERE id NOT IN (SELECT MIN(id) FROM prayers GROUP BY user_id, day, prayer)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_prayers_user_day_prayer ON prayers(user_id, day, prayer)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_prayers_user_recent ON prayers(user_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_favorites_user_recent ON favorites(user_id, id)")
+
+
+def _migrate_prayer_rollup(conn: sqlite3.Connection):
+    rebuild_prayer_rollup(conn.cursor())
+
+
+def _migrate_gazetteer(conn: sqlite3.Connection):
+    cur = conn.cursor()
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS gazetteer (
+        geonameid INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        ascii_name TEXT NOT NULL,
+        country_code TEXT NOT NULL,
+        country TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        population INTEGER NOT NULL,
+        tz TEXT NOT NULL,
+        name_key TEXT NOT NULL,
+        ascii_key TEXT NOT NULL,
+        country_key TEXT NOT NULL
+      )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_gazetteer_ascii ON gazetteer(ascii_name COLLATE NOCASE)")
+
+
+def _migrate_prefetch(conn: sqlite3.Connection):
+    cur = conn.cursor()
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS job_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+      )
+    """)
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS prefetch_status (
+        city TEXT NOT NULL,
+        country TEXT NOT NULL,
+        method TEXT NOT NULL,
+        tz TEXT,
+        last_day TEXT,
+        last_ok_at REAL,
+        last_error TEXT,
+        last_error_at REAL,
+        fails INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY(city, country, method)
+      )
+    """)
+
+
+def _migrate_data_version(conn: sqlite3.Connection):
+    # Zähler pro User, steigt bei jeder Änderung an Tracker/Favoriten (ETag der JSON-API)
+    if "data_version" not in _table_columns(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+
+
+def _migrate_prayer_month(conn: sqlite3.Connection):
+    conn.execute("""
+      CREATE TABLE IF NOT EXISTS prayer_month (
+        city TEXT NOT NULL,
+        country TEXT NOT NULL,
+        method TEXT NOT NULL,
+        month TEXT NOT NULL,
+        days TEXT NOT NULL,
+        tz TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY(city, country, method, month)
+      )
+    """)
+
+
+MIGRATIONS = [
+    (1, _migrate_base_schema),
+    (2, _migrate_prayer_constraints),
+    (3, _migrate_prayer_rollup),
+    (4, _migrate_gazetteer),
+    (5, _migrate_prefetch),
+    (6, _migrate_data_version),
+    (7, _migrate_prayer_month),
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    cur = conn.cursor()
+    cur.execute("PRAGMA user_version")
+    version = cur.fetchone()[0]
+    for target, fn in MIGRATIONS:
+        if target <= version:
+            continue
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("PRAGMA user_version")
+        version = cur.fetchone()[0]
+        if target <= version:
+            conn.rollback()
+            continue
+        try:
+            fn(conn)
+            cur.execute(f"PRAGMA user_version={target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+def init_db():
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL").fetchone()
+    migrate(conn)
+
     # Settings defaults
     cur.execute("INSERT OR IGNORE INTO site_settings(k,v) VALUES('allow_register','1')")
     cur.execute("INSERT OR IGNORE INTO site_settings(k,v) VALUES('invite_codes','i3mad2026')")
@@ -415,7 +941,6 @@ def init_db():
         )
 
     conn.commit()
-    conn.close()
 
 
 def get_site_setting(k: str, default: str) -> str:
@@ -423,7 +948,6 @@ def get_site_setting(k: str, default: str) -> str:
     cur = conn.cursor()
     cur.execute("SELECT v FROM site_settings WHERE k=?", (k,))
     row = cur.fetchone()
-    conn.close()
     return row["v"] if row else default
 
 
@@ -435,24 +959,35 @@ def set_site_setting(k: str, v: str):
         (k, v),
     )
     conn.commit()
-    conn.close()
 
 
 def current_user() -> Optional[sqlite3.Row]:
+    # pro Request nur einmal laden (Decorator, Route und render_page teilen sich das Ergebnis)
+    if "user" in g:
+        return g.user
     uid = session.get("user_id")
-    if not uid:
-        return None
-    conn = db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE id=?", (uid,))
-    u = cur.fetchone()
-    conn.close()
-    if u and u["is_blocked"] == 1:
-        session.pop("user_id", None)
-        return None
+    u = None
+    if uid:
+        conn = db()
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM users WHERE id=?", (uid,))
+        u = cur.fetchone()
+        if u and u["is_blocked"] == 1:
+            session.pop("user_id", None)
+            u = None
+    g.user = u
     return u
 
 
+def set_session_user(uid: Optional[int]):
+    if uid:
+        session["user_id"] = uid
+    else:
+        session.pop("user_id", None)
+    g.pop("user", None)
+    g.pop("user_settings", None)
+
+
 def login_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -484,12 +1019,18 @@ DEFAULT_USER_SETTINGS = {
 
 
 def get_user_settings(uid: Optional[int]) -> dict[str, str]:
+    cache = g.setdefault("user_settings", {})
+    if uid not in cache:
+        cache[uid] = _load_user_settings(uid)
+    return dict(cache[uid])
+
+
+def _load_user_settings(uid: Optional[int]) -> dict[str, str]:
     if uid:
         conn = db()
         cur = conn.cursor()
         cur.execute("SELECT k,v FROM user_settings WHERE user_id=?", (uid,))
         rows = cur.fetchall()
-        conn.close()
         s = {r["k"]: r["v"] for r in rows}
         for k, v in DEFAULT_USER_SETTINGS.items():
             s.setdefault(k, v)
@@ -510,11 +1051,11 @@ def set_user_setting(uid: Optional[int], k: str, v: str):
             (uid, k, v),
         )
         conn.commit()
-        conn.close()
     else:
         s = session.get("anon_settings") or {}
         s[k] = v
         session["anon_settings"] = s
+    g.get("user_settings", {}).pop(uid, None)
 
 
 PRAYERS = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
@@ -533,129 +1074,1221 @@ def parse_hhmm(s: str):
     return int(m.group(1)), int(m.group(2))
 
 
-def fetch_prayer_times(city: str, country: str, method: str):
-    url = "https://api.aladhan.com/v1/timingsByCity"
-    params = {"city": city, "country": country, "method": method}
-    r = requests.get(url, params=params, timeout=15)
-    r.raise_for_status()
-    data = r.json()["data"]
-    timings = data["timings"]
-    meta = data.get("meta") or {}
-    tz = meta.get("timezone") or "Europe/Vienna"
-    out = {k: timings.get(k) for k in PRAYERS}
-    return out, tz
+# Gebetszeiten-Cache: SQLite (überlebt Restarts, für alle Worker) + LRU im Prozess.
+# Ein Eintrag gilt bis Mitternacht in der Zeitzone, die aladhan für den Ort liefert.
+PRAYER_CACHE_SIZE = 512
+PRAYER_CACHE_KEEP_DAYS = 7
+_PRAYER_LRU: "OrderedDict[tuple[str, str, str, str], tuple[dict[str, str], str, float]]" = OrderedDict()
+_PRAYER_TZ: dict[tuple[str, str, str], str] = {}
+_PRAYER_LOCK = threading.Lock()
 
 
-def compute_next_prayer(city: str, country: str, method: str):
-    timings, tz_name = fetch_prayer_times(city, country, method)
-    if ZoneInfo:
-        tz = ZoneInfo(tz_name)
-        now = datetime.now(tz)
-    else:
-        tz = None
-        now = datetime.now()
+def _prayer_key(city: str, country: str, method: str) -> tuple[str, str, str]:
+    return (city or "").strip().lower(), (country or "").strip().lower(), str(method or "").strip()
 
-    today = now.date()
-    candidates = []
-    for p in PRAYERS:
-        hhmm = parse_hhmm(timings.get(p, ""))
-        if not hhmm:
-            continue
-        h, m = hhmm
-        dt = datetime(today.year, today.month, today.day, h, m, tzinfo=tz) if tz else datetime(today.year, today.month, today.day, h, m)
-        candidates.append((p, dt))
-    candidates.sort(key=lambda x: x[1])
 
-    for p, dt in candidates:
-        if dt > now:
-            return timings, tz_name, p, dt.isoformat()
+def _tz_now(tz_name: str) -> datetime:
+    if ZoneInfo:
+        try:
+            return datetime.now(ZoneInfo(tz_name))
+        except Exception:
+            pass
+    return datetime.now()
 
-    hhmm = parse_hhmm(timings.get("Fajr", ""))
-    if hhmm:
-        h, m = hhmm
-        tomorrow = today + timedelta(days=1)
-        dt = datetime(tomorrow.year, tomorrow.month, tomorrow.day, h, m, tzinfo=tz) if tz else datetime(tomorrow.year, tomorrow.month, tomorrow.day, h, m)
-        return timings, tz_name, "Fajr", dt.isoformat()
 
-    return timings, tz_name, None, None
+def _local_midnight_after(day: str, tz_name: str) -> float:
+    d = date.fromisoformat(day) + timedelta(days=1)
+    tz = None
+    if ZoneInfo:
+        try:
+            tz = ZoneInfo(tz_name)
+        except Exception:
+            tz = None
+    return datetime(d.year, d.month, d.day, tzinfo=tz).timestamp()
 
 
-def done_today_set(uid: int) -> set[str]:
+def _prayer_cache_get(key: tuple[str, str, str], day: str):
+    now = time.time()
+    with _PRAYER_LOCK:
+        hit = _PRAYER_LRU.get(key + (day,))
+        if hit:
+            if hit[2] > now:
+                _PRAYER_LRU.move_to_end(key + (day,))
+                metrics.inc("cache_requests_total", {"cache": "prayer_lru", "result": "hit"})
+                return dict(hit[0]), hit[1]
+            del _PRAYER_LRU[key + (day,)]
+    metrics.inc("cache_requests_total", {"cache": "prayer_lru", "result": "miss"})
+
     conn = db()
     cur = conn.cursor()
-    cur.execute("SELECT prayer FROM prayers WHERE user_id=? AND day=? GROUP BY prayer", (uid, today_str()))
-    s = {r["prayer"] for r in cur.fetchall()}
-    conn.close()
-    return s
+    cur.execute(
+        "SELECT timings, tz, expires_at FROM prayer_cache WHERE city=? AND country=? AND method=? AND day=? AND expires_at>?",
+        key + (day, now),
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    timings = json.loads(row["timings"])
+    _prayer_lru_put(key, day, timings, row["tz"], row["expires_at"])
+    return dict(timings), row["tz"]
 
 
-def compute_streak(uid: int) -> int:
-    today_d = date.today()
-    start = (today_d - timedelta(days=180)).isoformat()
-    conn = db()
-    cur = conn.cursor()
-    cur.execute("SELECT day, prayer FROM prayers WHERE user_id=? AND day>=? ORDER BY day ASC", (uid, start))
-    rows = cur.fetchall()
-    conn.close()
+def _prayer_lru_put(key: tuple[str, str, str], day: str, timings: dict[str, str], tz_name: str, expires_at: float):
+    with _PRAYER_LOCK:
+        _PRAYER_TZ[key] = tz_name
+        _PRAYER_LRU[key + (day,)] = (dict(timings), tz_name, expires_at)
+        _PRAYER_LRU.move_to_end(key + (day,))
+        while len(_PRAYER_LRU) > PRAYER_CACHE_SIZE:
+            _PRAYER_LRU.popitem(last=False)
 
-    m: dict[str, set[str]] = {}
-    for r in rows:
-        m.setdefault(r["day"], set()).add(r["prayer"])
 
-    streak = 0
-    d = today_d
-    while True:
-        ds = d.isoformat()
-        if ds in m and all(p in m[ds] for p in PRAYERS):
-            streak += 1
-            d = d - timedelta(days=1)
-        else:
-            break
-    return streak
+def _prayer_cache_put(key: tuple[str, str, str], day: str, timings: dict[str, str], tz_name: str):
+    now = time.time()
+    expires_at = _local_midnight_after(day, tz_name)
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO prayer_cache(city,country,method,day,timings,tz,expires_at,fetched_at) VALUES(?,?,?,?,?,?,?,?) "
+        "ON CONFLICT(city,country,method,day) DO UPDATE SET timings=excluded.timings, tz=excluded.tz, "
+        "expires_at=excluded.expires_at, fetched_at=excluded.fetched_at",
+        key + (day, json.dumps(timings), tz_name, expires_at, now),
+    )
+    cur.execute("DELETE FROM prayer_cache WHERE expires_at<?", (now - PRAYER_CACHE_KEEP_DAYS * 86400,))
+    conn.commit()
+    _prayer_lru_put(key, day, timings, tz_name, expires_at)
 
 
-def get_favorites_set(uid: int) -> set[str]:
+def _prayer_cache_tz(key: tuple[str, str, str]) -> Optional[str]:
+    with _PRAYER_LOCK:
+        tz_name = _PRAYER_TZ.get(key)
+    if tz_name:
+        return tz_name
     conn = db()
     cur = conn.cursor()
-    cur.execute("SELECT verse_key FROM favorites WHERE user_id=?", (uid,))
-    s = {r["verse_key"] for r in cur.fetchall()}
-    conn.close()
-    return s
+    cur.execute(
+        "SELECT tz FROM prayer_cache WHERE city=? AND country=? AND method=? ORDER BY fetched_at DESC LIMIT 1",
+        key,
+    )
+    row = cur.fetchone()
+    if row:
+        with _PRAYER_LOCK:
+            _PRAYER_TZ[key] = row["tz"]
+        return row["tz"]
+    return None
 
 
-def toggle_favorite(uid: int, verse_key: str):
+def _prayer_cache_latest(key: tuple[str, str, str]):
+    # Notfall bei aladhan-Ausfall: letzter bekannter Stand, auch wenn abgelaufen;
+    # vorgeladene Tage (morgen) nicht als heute ausgeben
+    today = _tz_now(_prayer_cache_tz(key) or DEFAULT_TZ).date().isoformat()
     conn = db()
     cur = conn.cursor()
-    cur.execute("SELECT 1 FROM favorites WHERE user_id=? AND verse_key=?", (uid, verse_key))
-    exists = cur.fetchone() is not None
-    if exists:
-        cur.execute("DELETE FROM favorites WHERE user_id=? AND verse_key=?", (uid, verse_key))
-    else:
-        cur.execute(
-            "INSERT OR IGNORE INTO favorites(user_id, verse_key, added_at) VALUES(?,?,?)",
-            (uid, verse_key, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-        )
-    conn.commit()
-    conn.close()
+    cur.execute(
+        "SELECT timings, tz FROM prayer_cache WHERE city=? AND country=? AND method=? AND day<=? "
+        "ORDER BY day DESC LIMIT 1",
+        key + (today,),
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return json.loads(row["timings"]), row["tz"]
 
 
-def search_city_nominatim(q: str):
-    if not q or len(q.strip()) < 2:
-        return []
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {"q": q, "format": "json", "addressdetails": 1, "limit": 8}
-    headers = {"User-Agent": "IslamWebApp/1.0 (public demo)"}
-    r = requests.get(url, params=params, headers=headers, timeout=15)
+def _fetch_prayer_times_upstream(city: str, country: str, method: str, day: Optional[date] = None):
+    url = f"{ALADHAN_API}/timingsByCity"
+    if day is not None:
+        url += "/" + day.strftime("%d-%m-%Y")
+    params = {"city": city, "country": country, "method": method}
+    r = upstream.get(url, params=params, timeout=15)
     r.raise_for_status()
-    data = r.json()
-    out = []
-    for it in data:
-        addr = it.get("address") or {}
-        city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality") or it.get("display_name", "").split(",")[0]
-        country = addr.get("country") or ""
-        label = it.get("display_name") or f"{city}, {country}"
-        if city and country:
-            out.append({"city": city, "country": country, "label": label})
+    data = r.json()["data"]
+    timings = data["timings"]
+    meta = data.get("meta") or {}
+    tz = meta.get("timezone") or "Europe/Vienna"
+    out = {k: timings.get(k) for k in PRAYERS}
+    try:
+        geo_remember(city, country, float(meta["latitude"]), float(meta["longitude"]), tz)
+    except Exception:
+        pass
+    try:
+        day = datetime.strptime(data["date"]["gregorian"]["date"], "%d-%m-%Y").date().isoformat()
+    except Exception:
+        day = _tz_now(tz).date().isoformat()
+    return out, tz, day
+
+
+# Lokale Berechnung (ohne Netzwerk), kompatibel zu den aladhan "method"-Nummern.
+# Quelle wählbar: PRAYER_SOURCE=aladhan (Standard, lokal als Fallback) oder PRAYER_SOURCE=local.
+PRAYER_SOURCE = os.environ.get("PRAYER_SOURCE", "aladhan").strip().lower()
+PRAYER_FALLBACK = os.environ.get("PRAYER_FALLBACK", "1") == "1"
+DEFAULT_TZ = "Europe/Vienna"
+
+# fajr/isha: Sonnenwinkel unter dem Horizont; isha_min: feste Minuten nach Maghrib;
+# maghrib: Winkel statt Sonnenuntergang; maghrib_min: Minuten nach Sonnenuntergang
+CALC_METHODS: dict[str, dict[str, float]] = {
+    "0": {"fajr": 16, "isha": 14, "maghrib": 4},             # Shia Ithna-Ashari (Jafari)
+    "1": {"fajr": 18, "isha": 18},                           # Karachi
+    "2": {"fajr": 15, "isha": 15},                           # ISNA
+    "3": {"fajr": 18, "isha": 17},                           # Muslim World League
+    "4": {"fajr": 18.5, "isha_min": 90},                     # Umm al-Qura, Makkah
+    "5": {"fajr": 19.5, "isha": 17.5},                       # Egypt
+    "7": {"fajr": 17.7, "isha": 14, "maghrib": 4.5},         # Tehran
+    "8": {"fajr": 19.5, "isha_min": 90},                     # Gulf Region
+    "9": {"fajr": 18, "isha": 17.5},                         # Kuwait
+    "10": {"fajr": 18, "isha_min": 90},                      # Qatar
+    "11": {"fajr": 20, "isha": 18},                          # Singapore
+    "12": {"fajr": 12, "isha": 12},                          # France (UOIF)
+    "13": {"fajr": 18, "isha": 17},                          # Turkey (Diyanet)
+    "14": {"fajr": 16, "isha": 15},                          # Russia
+    "15": {"fajr": 18, "isha": 18},                          # Moonsighting Committee
+    "16": {"fajr": 18.2, "isha": 18.2},                      # Dubai
+    "17": {"fajr": 20, "isha": 18},                          # Malaysia (JAKIM)
+    "18": {"fajr": 18, "isha": 18},                          # Tunisia
+    "19": {"fajr": 18, "isha": 17},                          # Algeria
+    "20": {"fajr": 20, "isha": 18},                          # Indonesia (KEMENAG)
+    "21": {"fajr": 19, "isha": 17},                          # Morocco
+    "22": {"fajr": 18, "isha_min": 77, "maghrib_min": 3},    # Portugal
+    "23": {"fajr": 18, "isha": 18, "maghrib_min": 5},        # Jordan
+}
+
+# Hohe Breitengrade: 1 = Mitte der Nacht, 2 = ein Siebtel, 3 = winkelbasiert (aladhan-Standard)
+HIGH_LAT_RULE = int(os.environ.get("HIGH_LAT_RULE", "3"))
+ASR_FACTOR = 1  # 1 = Shafi (aladhan school=0), 2 = Hanafi
+
+
+def _dsin(d: float) -> float:
+    return math.sin(math.radians(d))
+
+
+def _dcos(d: float) -> float:
+    return math.cos(math.radians(d))
+
+
+def _fix(a: float, b: float) -> float:
+    a = a - b * math.floor(a / b)
+    return a + b if a < 0 else a
+
+
+def _sun_position(jd: float) -> tuple[float, float]:
+    d = jd - 2451545.0
+    g = _fix(357.529 + 0.98560028 * d, 360)
+    q = _fix(280.459 + 0.98564736 * d, 360)
+    lam = _fix(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g), 360)
+    e = 23.439 - 0.00000036 * d
+    ra = _fix(math.degrees(math.atan2(_dcos(e) * _dsin(lam), _dcos(lam))) / 15, 24)
+    eqt = q / 15 - ra
+    decl = math.degrees(math.asin(_dsin(e) * _dsin(lam)))
+    return decl, eqt
+
+
+def _julian(d: date) -> float:
+    y, m = d.year, d.month
+    if m <= 2:
+        y -= 1
+        m += 12
+    a = y // 100
+    b = 2 - a + a // 4
+    return math.floor(365.25 * (y + 4716)) + math.floor(30.6001 * (m + 1)) + d.day + b - 1524.5
+
+
+def _tz_offset_hours(tz_name: str, d: date) -> float:
+    if ZoneInfo:
+        try:
+            off = datetime(d.year, d.month, d.day, 12, tzinfo=ZoneInfo(tz_name)).utcoffset()
+            if off is not None:
+                return off.total_seconds() / 3600
+        except Exception:
+            pass
+    off = datetime.now().astimezone().utcoffset()
+    return off.total_seconds() / 3600 if off else 0.0
+
+
+def compute_prayer_times_local(lat: float, lon: float, tz_name: str, day: date, method: str) -> dict[str, str]:
+    params = CALC_METHODS.get(str(method).strip(), CALC_METHODS["3"])
+    jd = _julian(day) - lon / (15 * 24)
+
+    def mid_day(t: float) -> float:
+        return _fix(12 - _sun_position(jd + t)[1], 24)
+
+    def raw_times(lat: float) -> tuple[float, ...]:
+        def angle_time(angle: float, t: float, ccw: bool = False) -> float:
+            decl = _sun_position(jd + t)[0]
+            cos_h = (-_dsin(angle) - _dsin(decl) * _dsin(lat)) / (_dcos(decl) * _dcos(lat))
+            if cos_h < -1 or cos_h > 1:
+                return math.nan
+            h = math.degrees(math.acos(cos_h)) / 15
+            return mid_day(t) + (-h if ccw else h)
+
+        def asr_time(t: float) -> float:
+            decl = _sun_position(jd + t)[0]
+            angle = -math.degrees(math.atan(1 / (ASR_FACTOR + math.tan(math.radians(abs(lat - decl))))))
+            return angle_time(angle, t)
+
+        # eine Iteration ausgehend von groben Startwerten (wie PrayTimes/aladhan)
+        fajr = angle_time(params["fajr"], 5 / 24, ccw=True)
+        sunrise = angle_time(0.833, 6 / 24, ccw=True)
+        dhuhr = mid_day(12 / 24)
+        asr = asr_time(13 / 24)
+        sunset = angle_time(0.833, 18 / 24)
+        maghrib = angle_time(params["maghrib"], 18 / 24) if "maghrib" in params else sunset
+        isha = angle_time(params["isha"], 18 / 24) if "isha" in params else math.nan
+        return fajr, sunrise, dhuhr, asr, sunset, maghrib, isha
+
+    # Polarnacht / Mitternachtssonne: ohne Sonnenauf- oder -untergang gelten die Zeiten der
+    # nächsten Breite (in 0,5°-Schritten Richtung Äquator), an der es beides gibt
+    times = raw_times(lat)
+    eff_lat = lat
+    while any(math.isnan(t) for t in times[1:6]) and abs(eff_lat) > 0.5:
+        eff_lat -= math.copysign(0.5, eff_lat)
+        times = raw_times(eff_lat)
+    fajr, sunrise, dhuhr, asr, sunset, maghrib, isha = times
+
+    shift = _tz_offset_hours(tz_name, day) - lon / 15
+    fajr, sunrise, dhuhr, asr, sunset, maghrib, isha = (
+        t + shift for t in (fajr, sunrise, dhuhr, asr, sunset, maghrib, isha)
+    )
+
+    night = _fix(sunrise - sunset, 24)
+
+    def portion(angle: float) -> float:
+        if HIGH_LAT_RULE == 1:
+            return night / 2
+        if HIGH_LAT_RULE == 2:
+            return night / 7
+        return night * angle / 60
+
+    if math.isnan(fajr) or _fix(sunrise - fajr, 24) > portion(params["fajr"]):
+        fajr = sunrise - portion(params["fajr"])
+    if "isha" in params and (math.isnan(isha) or _fix(isha - sunset, 24) > portion(params["isha"])):
+        isha = sunset + portion(params["isha"])
+
+    if "maghrib_min" in params:
+        maghrib = sunset + params["maghrib_min"] / 60
+    if "isha_min" in params:
+        isha = maghrib + params["isha_min"] / 60
+
+    def hhmm(t: float) -> str:
+        t = _fix(t + 0.5 / 60, 24)
+        h = int(t)
+        return f"{h:02d}:{int((t - h) * 60):02d}"
+
+    return {"Fajr": hhmm(fajr), "Dhuhr": hhmm(dhuhr), "Asr": hhmm(asr), "Maghrib": hhmm(maghrib), "Isha": hhmm(isha)}
+
+
+def geo_remember(city: str, country: str, lat: float, lon: float, tz_name: str):
+    c, k, _ = _prayer_key(city, country, "")
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO geo_cache(city,country,lat,lon,tz,updated_at) VALUES(?,?,?,?,?,?) "
+        "ON CONFLICT(city,country) DO UPDATE SET lat=excluded.lat, lon=excluded.lon, tz=excluded.tz, "
+        "updated_at=excluded.updated_at",
+        (c, k, lat, lon, tz_name, time.time()),
+    )
+    conn.commit()
+
+
+def geo_lookup(city: str, country: str):
+    c, k, _ = _prayer_key(city, country, "")
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT lat, lon, tz FROM geo_cache WHERE city=? AND country=?", (c, k))
+    row = cur.fetchone()
+    if row:
+        return row["lat"], row["lon"], row["tz"]
+
+    found = gazetteer_lookup(city, country)
+    if found:
+        geo_remember(city, country, *found)
+        return found
+
+    # Weder aladhan noch Gazetteer kennen den Ort: geocodieren. Nominatim liefert keine
+    # Zeitzone; ohne timezonefinder wird nicht geraten (falscher UTC-Offset bliebe im Cache)
+    url = f"{NOMINATIM_API}/search"
+    params = {"city": city, "country": country, "format": "json", "limit": 1}
+    r = upstream.get(url, params=params, timeout=15)
+    r.raise_for_status()
+    data = r.json()
+    if not data:
+        raise ValueError(f"Unknown location: {city}, {country}")
+    lat, lon = float(data[0]["lat"]), float(data[0]["lon"])
+    tz_name = _timezone_at(lat, lon)
+    if not tz_name:
+        raise ValueError(f"Unknown time zone for {city}, {country}")
+    geo_remember(city, country, lat, lon, tz_name)
+    return lat, lon, tz_name
+
+
+_TZ_FINDER: dict[str, object] = {}
+
+
+def _timezone_at(lat: float, lon: float) -> Optional[str]:
+    if TimezoneFinder is None:
+        return None
+    finder = _TZ_FINDER.get("tf")
+    if finder is None:
+        finder = _TZ_FINDER["tf"] = TimezoneFinder()
+    try:
+        return finder.timezone_at(lat=lat, lng=lon)
+    except Exception:
+        return None
+
+
+def _fetch_prayer_times_local(city: str, country: str, method: str):
+    lat, lon, tz = geo_lookup(city, country)
+    day = _tz_now(tz).date()
+    return compute_prayer_times_local(lat, lon, tz, day, method), tz, day.isoformat()
+
+
+@metrics.timed("fetch_prayer_times")
+def fetch_prayer_times(city: str, country: str, method: str):
+    key = _prayer_key(city, country, method)
+    tz_name = _prayer_cache_tz(key)
+    if tz_name:
+        hit = _prayer_cache_get(key, _tz_now(tz_name).date().isoformat())
+        if hit:
+            metrics.inc("cache_requests_total", {"cache": "prayer_times", "result": "hit"})
+            return hit
+    metrics.inc("cache_requests_total", {"cache": "prayer_times", "result": "miss"})
+
+    sources = [_fetch_prayer_times_upstream, _fetch_prayer_times_local]
+    if PRAYER_SOURCE == "local":
+        sources.reverse()
+    if not PRAYER_FALLBACK:
+        sources = sources[:1]
+
+    err: Optional[Exception] = None
+    for source in sources:
+        try:
+            out, tz, day = source(city, country, method)
+        except Exception as e:
+            err = err or e
+            continue
+        # lokal berechnete Zeiten kosten nichts -> nicht cachen, aladhan beim nächsten Aufruf erneut versuchen
+        if source is _fetch_prayer_times_upstream:
+            _prayer_cache_put(key, day, out, tz)
+        return out, tz
+
+    stale = _prayer_cache_latest(key)
+    if stale:
+        return stale
+    raise err
+
+
+# Monatskalender: ein calendarByCity-Request (oder lokale Berechnung) pro Monat, als Ganzes
+# in prayer_month gecacht. Vergangene Monate ändern sich nicht mehr, die anderen eine Woche.
+PRAYER_MONTH_TTL = 7 * 86400
+PRAYER_MONTH_PAST_TTL = 365 * 86400
+
+
+def _month_add(year: int, month: int, delta: int) -> tuple[int, int]:
+    n = year * 12 + (month - 1) + delta
+    return n // 12, n % 12 + 1
+
+
+def _fetch_prayer_month_upstream(city: str, country: str, method: str, year: int, month: int):
+    params = {"city": city, "country": country, "method": method}
+    r = upstream.get(f"{ALADHAN_API}/calendarByCity/{year}/{month}", params=params, timeout=20)
+    r.raise_for_status()
+    days = []
+    tz = DEFAULT_TZ
+    for d in r.json()["data"]:
+        tz = (d.get("meta") or {}).get("timezone") or tz
+        day = datetime.strptime(d["date"]["gregorian"]["date"], "%d-%m-%Y").date().isoformat()
+        # aladhan liefert hier "05:12 (CET)"
+        timings = {}
+        for p in PRAYERS:
+            hhmm = parse_hhmm(d["timings"].get(p, ""))
+            timings[p] = f"{hhmm[0]:02d}:{hhmm[1]:02d}" if hhmm else None
+        days.append({"day": day, "timings": timings})
+    if not days:
+        raise ValueError(f"No calendar for {city}, {country} {year}-{month:02d}")
+    return days, tz
+
+
+def _fetch_prayer_month_local(city: str, country: str, method: str, year: int, month: int):
+    lat, lon, tz = geo_lookup(city, country)
+    days = []
+    for i in range(1, calendar.monthrange(year, month)[1] + 1):
+        day = date(year, month, i)
+        timings = compute_prayer_times_local(lat, lon, tz, day, method)
+        days.append({"day": day.isoformat(), "timings": {p: timings.get(p) for p in PRAYERS}})
+    return days, tz
+
+
+def prayer_month(city: str, country: str, method: str, year: int, month: int) -> tuple[list[dict], str]:
+    key = _prayer_key(city, country, method)
+    ym = f"{year:04d}-{month:02d}"
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT days, tz, expires_at FROM prayer_month WHERE city=? AND country=? AND method=? AND month=?",
+        key + (ym,),
+    )
+    row = cur.fetchone()
+    if row and row["expires_at"] > time.time():
+        metrics.inc("cache_requests_total", {"cache": "prayer_month", "result": "hit"})
+        return json.loads(row["days"]), row["tz"]
+    metrics.inc("cache_requests_total", {"cache": "prayer_month", "result": "miss"})
+
+    sources = [_fetch_prayer_month_upstream, _fetch_prayer_month_local]
+    if PRAYER_SOURCE == "local":
+        sources.reverse()
+    if not PRAYER_FALLBACK:
+        sources = sources[:1]
+
+    err: Optional[Exception] = None
+    for source in sources:
+        try:
+            days, tz = source(city, country, method, year, month)
+        except Exception as e:
+            err = err or e
+            continue
+        # wie bei den Tageszeiten: nur aladhan-Ergebnisse cachen
+        if source is _fetch_prayer_month_upstream:
+            past = (year, month) < (date.today().year, date.today().month)
+            now = time.time()
+            cur.execute(
+                "INSERT INTO prayer_month(city,country,method,month,days,tz,expires_at,fetched_at) VALUES(?,?,?,?,?,?,?,?) "
+                "ON CONFLICT(city,country,method,month) DO UPDATE SET days=excluded.days, tz=excluded.tz, "
+                "expires_at=excluded.expires_at, fetched_at=excluded.fetched_at",
+                key + (ym, json.dumps(days), tz, now + (PRAYER_MONTH_PAST_TTL if past else PRAYER_MONTH_TTL), now),
+            )
+            conn.commit()
+        return days, tz
+
+    if row:
+        return json.loads(row["days"]), row["tz"]
+    raise err
+
+
+# iCalendar-Export: ein VEVENT pro Gebet, Zeiten in UTC (ohne VTIMEZONE-Block).
+# Gestreamt Tag für Tag, weitere Monate werden erst beim Schreiben geladen.
+ICS_MAX_MONTHS = 12
+ICS_EVENT_MINUTES = 15
+
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(line: str) -> str:
+    # RFC 5545: Zeilen > 75 Oktette umbrechen, Fortsetzung beginnt mit Leerzeichen
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line + "\r\n"
+    out, cur = [], ""
+    for ch in line:
+        if len((cur + ch).encode("utf-8")) > (75 if not out else 74):
+            out.append(cur)
+            cur = ""
+        cur += ch
+    out.append(cur)
+    return "\r\n ".join(out) + "\r\n"
+
+
+def _ics_time(day: str, hhmm: str, tz) -> str:
+    h, m = parse_hhmm(hhmm)
+    d = date.fromisoformat(day)
+    if tz is None:
+        return f"{d:%Y%m%d}T{h:02d}{m:02d}00"
+    return datetime(d.year, d.month, d.day, h, m, tzinfo=tz).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def ics_stream(city: str, country: str, method: str, year: int, month: int, months: int, first: tuple[list[dict], str]):
+    uid_tag = hashlib.sha1(repr(_prayer_key(city, country, method)).encode("utf-8")).hexdigest()[:12]
+    location = _ics_escape(f"{city}, {country}")
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "".join(_ics_fold(x) for x in (
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Islam WebApp//Prayer Times//EN", "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_ics_escape(f'Prayer times {city}')}",
+    ))
+    for i in range(months):
+        y, m = _month_add(year, month, i)
+        days, tz_name = first if i == 0 else prayer_month(city, country, method, y, m)
+        tz = None
+        if ZoneInfo:
+            try:
+                tz = ZoneInfo(tz_name)
+            except Exception:
+                tz = None
+        for d in days:
+            lines = []
+            for p in PRAYERS:
+                hhmm = d["timings"].get(p)
+                if not parse_hhmm(hhmm or ""):
+                    continue
+                lines += [
+                    "BEGIN:VEVENT",
+                    f"UID:{d['day']}-{p.lower()}-{uid_tag}@islam-webapp",
+                    f"DTSTAMP:{stamp}",
+                    f"DTSTART:{_ics_time(d['day'], hhmm, tz)}",
+                    f"DURATION:PT{ICS_EVENT_MINUTES}M",
+                    f"SUMMARY:{p}",
+                    f"LOCATION:{location}",
+                    "TRANSP:TRANSPARENT",
+                    "END:VEVENT",
+                ]
+            yield "".join(_ics_fold(x) for x in lines)
+    yield "END:VCALENDAR\r\n"
+
+
+@metrics.timed("compute_next_prayer")
+def compute_next_prayer(city: str, country: str, method: str):
+    timings, tz_name = fetch_prayer_times(city, country, method)
+    if ZoneInfo:
+        tz = ZoneInfo(tz_name)
+        now = datetime.now(tz)
+    else:
+        tz = None
+        now = datetime.now()
+
+    today = now.date()
+    candidates = []
+    for p in PRAYERS:
+        hhmm = parse_hhmm(timings.get(p, ""))
+        if not hhmm:
+            continue
+        h, m = hhmm
+        dt = datetime(today.year, today.month, today.day, h, m, tzinfo=tz) if tz else datetime(today.year, today.month, today.day, h, m)
+        candidates.append((p, dt))
+    candidates.sort(key=lambda x: x[1])
+
+    for p, dt in candidates:
+        if dt > now:
+            return timings, tz_name, p, dt.isoformat()
+
+    hhmm = parse_hhmm(timings.get("Fajr", ""))
+    if hhmm:
+        h, m = hhmm
+        tomorrow = today + timedelta(days=1)
+        dt = datetime(tomorrow.year, tomorrow.month, tomorrow.day, h, m, tzinfo=tz) if tz else datetime(tomorrow.year, tomorrow.month, tomorrow.day, h, m)
+        return timings, tz_name, "Fajr", dt.isoformat()
+
+    return timings, tz_name, None, None
+
+
+# Tagesstand pro User als Bitmaske (prayer_days) + gespeicherter Streak (user_streaks),
+# beides wird von track_done in derselben Transaktion wie der Eintrag gepflegt.
+PRAYER_BITS = {p: 1 << i for i, p in enumerate(PRAYERS)}
+ALL_PRAYERS_MASK = (1 << len(PRAYERS)) - 1
+
+
+def done_today_set(uid: int) -> set[str]:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT mask FROM prayer_days WHERE user_id=? AND day=?", (uid, today_str()))
+    row = cur.fetchone()
+    mask = row["mask"] if row else 0
+    return {p for p in PRAYERS if mask & PRAYER_BITS[p]}
+
+
+@metrics.timed("compute_streak")
+def compute_streak(uid: int) -> int:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT streak, last_day FROM user_streaks WHERE user_id=?", (uid,))
+    row = cur.fetchone()
+    # wie bisher: der Streak zählt nur, wenn heute schon alle 5 Gebete erledigt sind
+    if row and row["last_day"] == today_str():
+        return row["streak"]
+    return 0
+
+
+def record_prayer_day(cur: sqlite3.Cursor, uid: int, day: str, prayer: str):
+    cur.execute(
+        "INSERT INTO prayer_days(user_id, day, mask) VALUES(?,?,?) "
+        "ON CONFLICT(user_id, day) DO UPDATE SET mask = mask | excluded.mask",
+        (uid, day, PRAYER_BITS[prayer]),
+    )
+    cur.execute("SELECT mask FROM prayer_days WHERE user_id=? AND day=?", (uid, day))
+    if cur.fetchone()["mask"] != ALL_PRAYERS_MASK:
+        return
+
+    cur.execute("SELECT streak, last_day FROM user_streaks WHERE user_id=?", (uid,))
+    row = cur.fetchone()
+    if row and row["last_day"] == day:
+        return
+    prev = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+    streak = row["streak"] + 1 if row and row["last_day"] == prev else 1
+    cur.execute(
+        "INSERT INTO user_streaks(user_id, streak, last_day) VALUES(?,?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET streak=excluded.streak, last_day=excluded.last_day",
+        (uid, streak, day),
+    )
+
+
+def rebuild_prayer_rollup(cur: sqlite3.Cursor):
+    bits = " ".join(f"WHEN '{p}' THEN {b}" for p, b in PRAYER_BITS.items())
+    cur.execute("DELETE FROM prayer_days")
+    cur.execute("DELETE FROM user_streaks")
+    cur.execute(
+        "INSERT INTO prayer_days(user_id, day, mask) "
+        f"SELECT user_id, day, SUM(DISTINCT CASE prayer {bits} ELSE 0 END) FROM prayers GROUP BY user_id, day"
+    )
+    cur.execute("SELECT user_id, day FROM prayer_days WHERE mask=? ORDER BY user_id ASC, day DESC", (ALL_PRAYERS_MASK,))
+    runs: dict[int, tuple[int, str, date]] = {}
+    closed: set[int] = set()
+    for r in cur.fetchall():
+        uid, d = r["user_id"], date.fromisoformat(r["day"])
+        if uid not in runs:
+            runs[uid] = (1, r["day"], d)
+        elif uid not in closed:
+            streak, last_day, oldest = runs[uid]
+            if oldest - d == timedelta(days=1):
+                runs[uid] = (streak + 1, last_day, d)
+            else:
+                closed.add(uid)
+    cur.executemany(
+        "INSERT INTO user_streaks(user_id, streak, last_day) VALUES(?,?,?)",
+        [(uid, streak, last_day) for uid, (streak, last_day, _) in runs.items()],
+    )
+
+
+def bump_data_version(cur: sqlite3.Cursor, uid: int):
+    cur.execute("UPDATE users SET data_version=data_version+1 WHERE id=?", (uid,))
+
+
+def list_favorites(uid: int) -> list[sqlite3.Row]:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT verse_key, added_at FROM favorites WHERE user_id=? ORDER BY id DESC", (uid,))
+    return cur.fetchall()
+
+
+def get_favorites_set(uid: int) -> set[str]:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT verse_key FROM favorites WHERE user_id=?", (uid,))
+    s = {r["verse_key"] for r in cur.fetchall()}
+    return s
+
+
+def toggle_favorite(uid: int, verse_key: str):
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM favorites WHERE user_id=? AND verse_key=?", (uid, verse_key))
+    exists = cur.fetchone() is not None
+    if exists:
+        cur.execute("DELETE FROM favorites WHERE user_id=? AND verse_key=?", (uid, verse_key))
+    else:
+        cur.execute(
+            "INSERT OR IGNORE INTO favorites(user_id, verse_key, added_at) VALUES(?,?,?)",
+            (uid, verse_key, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+    bump_data_version(cur, uid)
+    conn.commit()
+
+
+# Quran-Korpus lokal in SQLite: einmal importieren (flask --app app import-quran),
+# danach lesen /quran und /quran/<n> nur noch aus der DB. Fehlende Suren werden
+# beim ersten Aufruf nachgeladen und gespeichert.
+QURAN_API = os.environ.get("QURAN_API", "https://api.alquran.cloud/v1")
+QURAN_ARABIC = "quran-uthmani"
+QURAN_TRANSLATIONS = {"de": "de.aburida"}
+QURAN_DEFAULT_TRANSLATION = "en.sahih"
+QURAN_EDITIONS = [QURAN_ARABIC, QURAN_DEFAULT_TRANSLATION] + sorted(set(QURAN_TRANSLATIONS.values()))
+EDITION_RE = re.compile(r"^[a-z0-9][a-z0-9._-]{2,39}$")
+SURAH_PAGE_SIZE = 60
+SURAH_MAX_EDITIONS = 4
+SURAH_STREAM_MIN = 100  # ab so vielen Versen wird die Seite gestreamt
+
+_SURAH_LIST: list[dict] = []
+
+
+def translation_edition(lang: str) -> str:
+    return QURAN_TRANSLATIONS.get(lang, QURAN_DEFAULT_TRANSLATION)
+
+
+def _surah_from_row(r) -> dict:
+    return {
+        "number": r["number"],
+        "name": r["name"],
+        "englishName": r["english_name"],
+        "englishNameTranslation": r["english_name_translation"],
+        "numberOfAyahs": r["number_of_ayahs"],
+        "revelationType": r["revelation_type"],
+    }
+
+
+def _store_surahs(cur: sqlite3.Cursor, surahs: list[dict]):
+    cur.executemany(
+        "INSERT INTO quran_surahs(number,name,english_name,english_name_translation,number_of_ayahs,revelation_type) "
+        "VALUES(?,?,?,?,?,?) ON CONFLICT(number) DO UPDATE SET name=excluded.name, english_name=excluded.english_name, "
+        "english_name_translation=excluded.english_name_translation, number_of_ayahs=excluded.number_of_ayahs, "
+        "revelation_type=excluded.revelation_type",
+        [
+            (
+                su["number"],
+                su.get("name", ""),
+                su.get("englishName", ""),
+                su.get("englishNameTranslation", ""),
+                su.get("numberOfAyahs") or len(su.get("ayahs") or []),
+                su.get("revelationType", ""),
+            )
+            for su in surahs
+        ],
+    )
+
+
+def _store_ayahs(cur: sqlite3.Cursor, edition: str, surah_number: int, ayahs: list[dict]):
+    cur.executemany(
+        "INSERT INTO quran_ayahs(edition,number,surah,number_in_surah,text) VALUES(?,?,?,?,?) "
+        "ON CONFLICT(edition,surah,number_in_surah) DO UPDATE SET number=excluded.number, text=excluded.text",
+        [(edition, a["number"], surah_number, a["numberInSurah"], a["text"]) for a in ayahs],
+    )
+    if not ayahs:
+        return
+    nums = [a["numberInSurah"] for a in ayahs]
+    cur.execute(
+        "SELECT id, text FROM quran_ayahs WHERE edition=? AND surah=? AND number_in_surah BETWEEN ? AND ?",
+        (edition, surah_number, min(nums), max(nums)),
+    )
+    _index_ayahs(cur, edition, cur.fetchall())
+
+
+def quran_surah_list() -> list[dict]:
+    global _SURAH_LIST
+    if _SURAH_LIST:
+        return _SURAH_LIST
+
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM quran_surahs ORDER BY number ASC")
+    rows = cur.fetchall()
+    if len(rows) < 114:
+        r = upstream.get(f"{QURAN_API}/surah", timeout=15)
+        r.raise_for_status()
+        _store_surahs(cur, r.json()["data"])
+        conn.commit()
+        cur.execute("SELECT * FROM quran_surahs ORDER BY number ASC")
+        rows = cur.fetchall()
+    _SURAH_LIST = [_surah_from_row(r) for r in rows]
+    return _SURAH_LIST
+
+
+@metrics.timed("quran_surah_editions")
+def quran_surah_editions(number: int, editions: list[str], start: int = 1, count: Optional[int] = None) -> dict:
+    # alle Editionen eines Ausschnitts in einer Abfrage; was lokal fehlt, kommt in einem Upstream-Request
+    if not 1 <= number <= 114:
+        raise ValueError(f"Surah {number} does not exist")
+    for edition in editions:
+        if not EDITION_RE.match(edition or ""):
+            raise ValueError(f"Invalid edition: {edition}")
+
+    meta = next((su for su in quran_surah_list() if su["number"] == number), None)
+    if meta is None:
+        raise ValueError(f"Surah {number} does not exist")
+
+    total = meta["numberOfAyahs"]
+    start = min(max(start, 1), total)
+    end = total if count is None else min(start + max(count, 1) - 1, total)
+
+    conn = db()
+    cur = conn.cursor()
+    sql = (
+        "SELECT edition, number, number_in_surah, text FROM quran_ayahs "
+        f"WHERE surah=? AND number_in_surah BETWEEN ? AND ? AND edition IN ({','.join('?' * len(editions))}) "
+        "ORDER BY number_in_surah ASC"
+    )
+    cur.execute(sql, (number, start, end, *editions))
+    rows = cur.fetchall()
+    have = {e: 0 for e in editions}
+    for r in rows:
+        have[r["edition"]] += 1
+    missing = [e for e in editions if have[e] < end - start + 1]
+    metrics.inc("cache_requests_total", {"cache": "quran_ayahs", "result": "miss" if missing else "hit"})
+    if missing:
+        path = missing[0] if len(missing) == 1 else "editions/" + ",".join(missing)
+        r = upstream.get(
+            f"{QURAN_API}/surah/{number}/{path}",
+            params={"offset": start - 1, "limit": end - start + 1},
+            timeout=20,
+        )
+        r.raise_for_status()
+        data = r.json()["data"]
+        for edition, part in zip(missing, data if isinstance(data, list) else [data]):
+            _store_ayahs(cur, edition, number, part["ayahs"])
+        conn.commit()
+        cur.execute(sql, (number, start, end, *editions))
+        rows = cur.fetchall()
+
+    by_num: dict[int, dict] = {}
+    for r in rows:
+        a = by_num.setdefault(r["number_in_surah"], {"number": r["number"], "numberInSurah": r["number_in_surah"], "texts": {}})
+        a["texts"][r["edition"]] = r["text"]
+
+    out = dict(meta)
+    out["start"] = start
+    out["end"] = end
+    out["editions"] = list(editions)
+    out["ayahs"] = [by_num[n] for n in sorted(by_num)]
+    return out
+
+
+@APP.cli.command("import-quran")
+@click.argument("editions", nargs=-1)
+def import_quran_command(editions):
+    """Quran-Text und Übersetzungen einmalig in die lokale DB laden."""
+    editions = list(editions) or QURAN_EDITIONS
+    conn = db()
+    cur = conn.cursor()
+    for edition in editions:
+        click.echo(f"Importing {edition} ...")
+        r = upstream.get(f"{QURAN_API}/quran/{edition}", timeout=120)
+        r.raise_for_status()
+        surahs = r.json()["data"]["surahs"]
+        _store_surahs(cur, surahs)
+        for su in surahs:
+            _store_ayahs(cur, edition, su["number"], su["ayahs"])
+        conn.commit()
+        click.echo(f"  {sum(len(su['ayahs']) for su in surahs)} ayahs")
+
+
+# Lokale Volltextsuche: Arabisch normalisiert (Tashkeel, Tatweel, Alef-Varianten),
+# Übersetzungen leicht gestemmt. Im Index steht nur die normalisierte Form,
+# angezeigt wird der Originaltext mit <em>-Markierung.
+SEARCH_PAGE_SIZE = 25
+_AR_DIACRITICS_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_AR_MAP = str.maketrans({"\u0622": "\u0627", "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627",
+                         "\u0649": "\u064a", "\u0629": "\u0647"})
+_AR_PREFIXES = ("\u0648\u0627\u0644", "\u0628\u0627\u0644", "\u0643\u0627\u0644", "\u0641\u0627\u0644",
+                "\u0644\u0644", "\u0627\u0644")
+_TOKEN_STRIP = "\"'.,;:!?()[]{}«»„“”‘’-–—…*\u060c\u061b\u061f\u06d4"
+
+
+def _norm_ar(word: str) -> str:
+    word = _AR_DIACRITICS_RE.sub("", word).translate(_AR_MAP)
+    for p in _AR_PREFIXES:
+        if word.startswith(p) and len(word) - len(p) >= 2:
+            return word[len(p):]
+    return word
+
+
+def _stem_en(word: str) -> str:
+    if word.endswith("'s"):
+        word = word[:-2]
+    for suf, rep in (("ies", "y"), ("sses", "ss"), ("ness", ""), ("ment", ""), ("ing", ""), ("ful", ""),
+                     ("ed", ""), ("ly", "")):
+        if word.endswith(suf) and len(word) - len(suf) >= 3:
+            return word[: len(word) - len(suf)] + rep
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _stem_de(word: str) -> str:
+    word = word.replace("ä", "a").replace("ö", "o").replace("ü", "u").replace("ß", "ss")
+    for suf in ("ern", "em", "en", "er", "es", "e", "s", "n"):
+        if word.endswith(suf) and len(word) - len(suf) >= 3:
+            return word[: len(word) - len(suf)]
+    return word
+
+
+_STEMMERS = {"ar": _norm_ar, "en": _stem_en, "de": _stem_de}
+
+
+def edition_lang(edition: str) -> str:
+    return "ar" if edition.startswith("quran-") else edition.split(".", 1)[0]
+
+
+def search_terms(text: str, lang: str) -> list[str]:
+    stem = _STEMMERS.get(lang, lambda w: w)
+    out = []
+    for raw in (text or "").lower().split():
+        w = stem(raw.strip(_TOKEN_STRIP))
+        if w:
+            out.append(w)
+    return out
+
+
+def _index_ayahs(cur: sqlite3.Cursor, edition: str, rows: list):
+    lang = edition_lang(edition)
+    try:
+        cur.executemany("DELETE FROM quran_fts WHERE rowid=?", [(r["id"],) for r in rows])
+        cur.executemany(
+            "INSERT INTO quran_fts(rowid, terms, edition) VALUES(?,?,?)",
+            [(r["id"], " ".join(search_terms(r["text"], lang)), edition) for r in rows],
+        )
+    except sqlite3.OperationalError:
+        pass  # kein FTS5 verfügbar
+
+
+def highlight_terms(text: str, terms: set[str], lang: str) -> str:
+    stem = _STEMMERS.get(lang, lambda w: w)
+    parts = re.split(r"(\s+)", text or "")
+    out = []
+    for part in parts:
+        w = stem(part.lower().strip(_TOKEN_STRIP)) if part and not part.isspace() else ""
+        out.append(f"<em>{escape(part)}</em>" if w and w in terms else escape(part))
+    return Markup("".join(out))
+
+
+def remote_snippet(text: str) -> Markup:
+    # Upstream-HTML nie durchreichen: alles escapen, nur nacktes <em>/</em> zurückholen
+    text = re.sub(r"</?(?!em\b)[a-zA-Z][^>]*>", "", text or "")
+    out = escape(text).replace("&lt;em&gt;", "<em>").replace("&lt;/em&gt;", "</em>")
+    return Markup(out)
+
+
+@metrics.timed("quran_search_local")
+def quran_search_local(q: str, edition: str, page: int = 1):
+    # -> (Trefferanzahl, [(verse_key, html)]) oder None, wenn die Edition nicht indiziert ist
+    lang = edition_lang(edition)
+    terms = search_terms(q, lang)
+    conn = db()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM quran_fts WHERE edition=? LIMIT 1", (edition,))
+        if cur.fetchone() is None:
+            return None
+    except sqlite3.OperationalError:
+        return None
+    if not terms:
+        return 0, []
+
+    match = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+    cur.execute("SELECT count(*) FROM quran_fts WHERE quran_fts MATCH ? AND edition=?", (match, edition))
+    total = cur.fetchone()[0]
+    cur.execute(
+        "SELECT a.surah, a.number_in_surah, a.text FROM quran_fts f JOIN quran_ayahs a ON a.id=f.rowid "
+        "WHERE quran_fts MATCH ? AND f.edition=? ORDER BY f.rank LIMIT ? OFFSET ?",
+        (match, edition, SEARCH_PAGE_SIZE, (max(page, 1) - 1) * SEARCH_PAGE_SIZE),
+    )
+    rows = cur.fetchall()
+    term_set = set(terms)
+    return total, [(f"{r['surah']}:{r['number_in_surah']}", highlight_terms(r["text"], term_set, lang)) for r in rows]
+
+
+def quran_search_remote(q: str, api_lang: str):
+    url = f"{QURAN_SEARCH_API}/search"
+    params = {"q": q, "lang": api_lang}
+    r = upstream.get(url, params=params, timeout=20)
+    r.raise_for_status()
+    data = r.json()
+    candidates = data.get("results") or data.get("data") or data.get("verses") or []
+    if isinstance(candidates, dict):
+        candidates = candidates.get("results") or []
+    out = []
+    for item in candidates[:SEARCH_PAGE_SIZE]:
+        verse_key = item.get("verseKey") or item.get("verse_key") or item.get("key") or item.get("reference") or "?:?"
+        text = item.get("text") or item.get("translation") or item.get("content") or ""
+        out.append((verse_key, remote_snippet(text)))
+    return len(out), out
+
+
+@APP.cli.command("reindex-quran")
+def reindex_quran_command():
+    """Suchindex aus den gespeicherten Quran-Texten neu aufbauen."""
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM quran_fts")
+    cur.execute("SELECT DISTINCT edition FROM quran_ayahs")
+    for edition in [r["edition"] for r in cur.fetchall()]:
+        cur.execute("SELECT id, text FROM quran_ayahs WHERE edition=?", (edition,))
+        rows = cur.fetchall()
+        _index_ayahs(cur, edition, rows)
+        click.echo(f"{edition}: {len(rows)} ayahs")
+    cur.execute("INSERT INTO quran_fts(quran_fts) VALUES('optimize')")
+    conn.commit()
+
+
+# Lokaler Ortsindex (GeoNames cities*.txt, flask --app app import-gazetteer): sortierte Liste
+# gefalteter Namen im Speicher, Präfixsuche per bisect. Nominatim nur noch, wenn lokal nichts passt.
+GAZ_LIMIT = 8
+GAZ_CHECK = 60
+_FOLD_EXTRA = str.maketrans({"ø": "o", "đ": "d", "ł": "l", "æ": "ae", "œ": "oe", "ı": "i", "ð": "d", "þ": "th"})
+_GAZ = {"keys": [], "refs": [], "rows": [], "top2": {}}
+_GAZ_STATE = {"version": None, "checked": 0.0}
+_GAZ_LOCK = threading.Lock()
+
+
+def fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").casefold().translate(_FOLD_EXTRA))
+    return " ".join("".join(ch for ch in text if not unicodedata.combining(ch)).split())
+
+
+def _gaz_load(cur: sqlite3.Cursor):
+    global _GAZ
+    cur.execute("SELECT name, country, name_key, ascii_key, country_key FROM gazetteer ORDER BY population DESC")
+    rows, pairs = [], []
+    for name, country, name_key, ascii_key, country_key in cur.fetchall():
+        i = len(rows)
+        rows.append(({"city": name, "country": country, "label": f"{name}, {country}"}, country_key))
+        pairs.append((name_key, i))
+        if ascii_key != name_key:
+            pairs.append((ascii_key, i))
+    pairs.sort()
+    top2: dict[str, set[int]] = {}
+    for key, i in pairs:
+        top2.setdefault(key[:2], set()).add(i)
+    # Index wird komplett neu gebaut und dann in einem Schritt ausgetauscht
+    _GAZ = {
+        "keys": [k for k, _ in pairs],
+        "refs": [i for _, i in pairs],
+        "rows": rows,
+        # kürzeste Präfixe (2 Zeichen) treffen tausende Orte: Top-Liste vorab berechnen
+        "top2": {k: sorted(v)[:GAZ_LIMIT * 4] for k, v in top2.items()},
+    }
+    _gaz_query.cache_clear()
+
+
+def _gaz_refresh(wait: bool = False):
+    now = time.time()
+    if now - _GAZ_STATE["checked"] < GAZ_CHECK:
+        return
+    # lädt gerade ein anderer Thread, wird bis dahin mit dem alten Index (oder Nominatim) geantwortet
+    if not _GAZ_LOCK.acquire(blocking=wait):
+        return
+    try:
+        if now - _GAZ_STATE["checked"] < GAZ_CHECK:
+            return
+        version = get_site_setting("gazetteer_version", "")
+        if version != _GAZ_STATE["version"]:
+            _gaz_load(db().cursor())
+            _GAZ_STATE["version"] = version
+        _GAZ_STATE["checked"] = now
+    finally:
+        _GAZ_LOCK.release()
+
+
+def _gaz_warm():
+    with APP.app_context():
+        try:
+            _gaz_refresh(wait=True)
+        except sqlite3.Error:
+            pass
+
+
+@lru_cache(maxsize=4096)
+def _gaz_query(q: str) -> tuple:
+    name, _, country = q.partition(",")
+    name, country = name.strip(), country.strip()
+    idx = _GAZ
+    keys, refs, rows = idx["keys"], idx["refs"], idx["rows"]
+    if len(name) == 2 and not country:
+        cand = idx["top2"].get(name, [])
+    else:
+        lo = bisect_left(keys, name)
+        hi = bisect_left(keys, name + "\uffff", lo)
+        # Zeilen sind nach Einwohnern sortiert -> kleinster Index = größter Ort
+        cand = sorted({refs[j] for j in range(lo, hi)})
+    out, seen = [], set()
+    for i in cand:
+        item, country_key = rows[i]
+        if country and not country_key.startswith(country):
+            continue
+        key = (item["city"].lower(), item["country"].lower())
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(item)
+        if len(out) >= GAZ_LIMIT:
+            break
+    return tuple(out)
+
+
+def search_city_local(q: str) -> list[dict]:
+    q = fold(q)
+    if len(q) < 2:
+        return []
+    _gaz_refresh()
+    if not _GAZ["keys"]:
+        return []
+    return [dict(x) for x in _gaz_query(q)]
+
+
+def gazetteer_lookup(city: str, country: str):
+    # exakter Treffer (Name + Land oder Ländercode) -> (lat, lon, tz) oder None
+    cur = db().cursor()
+    try:
+        cur.execute(
+            "SELECT name, ascii_name, lat, lon, tz FROM gazetteer WHERE (country=? COLLATE NOCASE OR country_code=? COLLATE NOCASE) "
+            "AND (name=? COLLATE NOCASE OR ascii_name=? COLLATE NOCASE) ORDER BY population DESC LIMIT 1",
+            (country.strip(), country.strip(), city.strip(), city.strip()),
+        )
+    except sqlite3.OperationalError:
+        return None
+    row = cur.fetchone()
+    return (row["lat"], row["lon"], row["tz"]) if row else None
+
+
+def _open_geonames(path: str):
+    if path.endswith(".zip"):
+        zf = zipfile.ZipFile(path)
+        name = next(n for n in zf.namelist() if n.endswith(".txt") and not n.lower().startswith("readme"))
+        return io.TextIOWrapper(zf.open(name), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+@APP.cli.command("import-gazetteer")
+@click.argument("cities_file")
+@click.option("--countries", "countries_file", default=None, help="GeoNames countryInfo.txt für Ländernamen.")
+@click.option("--min-population", default=0, type=int)
+def import_gazetteer_command(cities_file, countries_file, min_population):
+    """GeoNames-Städteliste (z.B. cities15000.zip) als lokalen Ortsindex importieren."""
+    names = {}
+    if countries_file:
+        with open(countries_file, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                names[cols[0]] = cols[4]
+
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM gazetteer")
+    batch, n = [], 0
+    with _open_geonames(cities_file) as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 19 or cols[6] != "P":
+                continue
+            pop = int(cols[14] or 0)
+            if pop < min_population:
+                continue
+            cc = cols[8]
+            country = names.get(cc, cc)
+            batch.append((
+                int(cols[0]), cols[1], cols[2], cc, country, float(cols[4]), float(cols[5]), pop, cols[17] or DEFAULT_TZ,
+                fold(cols[1]), fold(cols[2]), fold(country),
+            ))
+            if len(batch) >= 5000:
+                cur.executemany("INSERT OR REPLACE INTO gazetteer VALUES(?,?,?,?,?,?,?,?,?,?,?,?)", batch)
+                n += len(batch)
+                batch = []
+    cur.executemany("INSERT OR REPLACE INTO gazetteer VALUES(?,?,?,?,?,?,?,?,?,?,?,?)", batch)
+    n += len(batch)
+    conn.commit()
+    set_site_setting("gazetteer_version", str(int(time.time())))
+    _GAZ_STATE["checked"] = 0.0
+    click.echo(f"{n} places imported")
+
+
+@metrics.timed("search_city")
+def search_city(q: str) -> list[dict]:
+    local = search_city_local(q)
+    metrics.inc("cache_requests_total", {"cache": "gazetteer", "result": "hit" if local else "miss"})
+    return local or search_city_nominatim(q)
+
+
+def search_city_nominatim(q: str):
+    if not q or len(q.strip()) < 2:
+        return []
+    url = f"{NOMINATIM_API}/search"
+    params = {"q": q, "format": "json", "addressdetails": 1, "limit": 8}
+    r = upstream.get(url, params=params, timeout=15)
+    r.raise_for_status()
+    data = r.json()
+    out = []
+    for it in data:
+        addr = it.get("address") or {}
+        city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality") or it.get("display_name", "").split(",")[0]
+        country = addr.get("country") or ""
+        label = it.get("display_name") or f"{city}, {country}"
+        if city and country:
+            out.append({"city": city, "country": country, "label": label})
     seen = set()
     uniq = []
     for x in out:
@@ -666,181 +2299,1181 @@ def search_city_nominatim(q: str):
     return uniq
 
 
-def verse_of_day(lang: str):
-    tr_ed = "en.sahih"
-    if lang == "de":
-        tr_ed = "de.aburida"
-    ayah_num = random.randint(1, 6236)
-    try:
-        a_ar = requests.get(f"https://api.alquran.cloud/v1/ayah/{ayah_num}/quran-uthmani", timeout=15).json()["data"]
-        a_tr = requests.get(f"https://api.alquran.cloud/v1/ayah/{ayah_num}/{tr_ed}", timeout=15).json()["data"]
-        ref = f"{a_ar.get('surah', {}).get('number', '?')}:{a_ar.get('numberInSurah', '?')}"
-        return {"ref": ref, "ar": a_ar.get("text", ""), "tr": a_tr.get("text", "")}
-    except Exception:
-        return {"ref": "-", "ar": "", "tr": ""}
+# Vers des Tages: ein fester Vers pro Kalendertag (für alle Besucher gleich),
+# Text wird im Hintergrund vorab geladen und aus dem Speicher ausgeliefert.
+AYAH_COUNT = 6236
+VOD_REFRESH = 1800
+_VOD: dict[tuple[str, str], dict[str, str]] = {}
+_VOD_LOCK = threading.Lock()
+_VOD_WAKE = threading.Event()
+_BG_STARTED = False
+_BG_LOCK = threading.Lock()
+
+
+def vod_ayah_number(day: date) -> int:
+    h = hashlib.sha256(f"vod:{day.isoformat()}".encode()).hexdigest()
+    return int(h, 16) % AYAH_COUNT + 1
+
+
+def _vod_from_store(day: date, tr_ed: str) -> Optional[dict[str, str]]:
+    num = vod_ayah_number(day)
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT edition, surah, number_in_surah, text FROM quran_ayahs WHERE number=? AND edition IN (?,?)",
+        (num, QURAN_ARABIC, tr_ed),
+    )
+    rows = {r["edition"]: r for r in cur.fetchall()}
+    if QURAN_ARABIC not in rows or tr_ed not in rows:
+        return None
+    ar = rows[QURAN_ARABIC]
+    return {"ref": f"{ar['surah']}:{ar['number_in_surah']}", "ar": ar["text"], "tr": rows[tr_ed]["text"]}
+
+
+def _vod_prefetch(day: date, tr_ed: str):
+    key = (day.isoformat(), tr_ed)
+    with _VOD_LOCK:
+        if key in _VOD:
+            return
+    vod = _vod_from_store(day, tr_ed)
+    if vod is None:
+        num = vod_ayah_number(day)
+        conn = db()
+        cur = conn.cursor()
+        for ed in (QURAN_ARABIC, tr_ed):
+            r = upstream.get(f"{QURAN_API}/ayah/{num}/{ed}", timeout=15)
+            r.raise_for_status()
+            a = r.json()["data"]
+            _store_ayahs(cur, ed, a["surah"]["number"], [a])
+        conn.commit()
+        vod = _vod_from_store(day, tr_ed)
+    if vod:
+        with _VOD_LOCK:
+            _VOD[key] = vod
+
+
+def _vod_worker():
+    while True:
+        today = date.today()
+        ok = True
+        with APP.app_context():
+            for day in (today, today + timedelta(days=1)):
+                for tr_ed in sorted({translation_edition(code) for code, _ in LANGS}):
+                    try:
+                        _vod_prefetch(day, tr_ed)
+                    except Exception:
+                        ok = False
+        with _VOD_LOCK:
+            for key in [k for k in _VOD if k[0] < (today - timedelta(days=1)).isoformat()]:
+                del _VOD[key]
+        _VOD_WAKE.wait(VOD_REFRESH if ok else 60)
+        _VOD_WAKE.clear()
+
+
+# Gebetszeiten-Prefetch: alle gespeicherten Orte (city, country, method) werden im Hintergrund
+# vorgeladen, "heute" sofort und "morgen" kurz vor Mitternacht in der jeweiligen Zeitzone.
+# Nur ein Worker-Prozess arbeitet (Lease in SQLite), das Tempo begrenzt ein globaler Token-Bucket.
+PRAYER_PREFETCH = os.environ.get("PRAYER_PREFETCH", "1") == "1"
+PREFETCH_INTERVAL = 300
+PREFETCH_LEAD = 3 * 3600
+PREFETCH_MAX_BACKOFF = 6 * 3600
+_WORKER_ID: dict[str, object] = {}
+_WORKER_ID_LOCK = threading.Lock()
+
+
+def _worker_id() -> str:
+    # pro Prozess neu bestimmen: bei preload_app erben alle Worker sonst dieselbe ID
+    pid = os.getpid()
+    with _WORKER_ID_LOCK:
+        if _WORKER_ID.get("pid") != pid:
+            _WORKER_ID.update(pid=pid, id=f"{pid}-{os.urandom(4).hex()}")
+        return _WORKER_ID["id"]
+
+
+def lease_acquire(name: str, ttl: float) -> bool:
+    now = time.time()
+    conn = db()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO job_leases(name, owner, expires_at) VALUES(?,?,?) "
+        "ON CONFLICT(name) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at "
+        "WHERE job_leases.owner=excluded.owner OR job_leases.expires_at<?",
+        (name, _worker_id(), now + ttl, now),
+    )
+    ok = cur.rowcount == 1
+    conn.commit()
+    return ok
+
+
+def configured_locations() -> list[tuple[str, str, str]]:
+    conn = db()
+    cur = conn.cursor()
+    cur.execute("""
+      SELECT MAX(CASE WHEN k='city' THEN v END) AS city,
+             MAX(CASE WHEN k='country' THEN v END) AS country,
+             MAX(CASE WHEN k='method' THEN v END) AS method
+      FROM user_settings WHERE k IN ('city','country','method') GROUP BY user_id
+    """)
+    d = DEFAULT_USER_SETTINGS
+    seen = {_prayer_key(d["city"], d["country"], d["method"]): (d["city"], d["country"], d["method"])}
+    for r in cur.fetchall():
+        loc = (r["city"] or d["city"], r["country"] or d["country"], r["method"] or d["method"])
+        seen.setdefault(_prayer_key(*loc), loc)
+    return sorted(seen.values())
+
+
+def _prefetch_record(key: tuple[str, str, str], tz_name: Optional[str], day: Optional[str], err: Optional[Exception]):
+    now = time.time()
+    conn = db()
+    cur = conn.cursor()
+    if err is None:
+        cur.execute(
+            "INSERT INTO prefetch_status(city,country,method,tz,last_day,last_ok_at,fails) VALUES(?,?,?,?,?,?,0) "
+            "ON CONFLICT(city,country,method) DO UPDATE SET tz=excluded.tz, last_day=excluded.last_day, "
+            "last_ok_at=excluded.last_ok_at, fails=0",
+            key + (tz_name, day, now),
+        )
+    else:
+        cur.execute(
+            "INSERT INTO prefetch_status(city,country,method,last_error,last_error_at,fails) VALUES(?,?,?,?,?,1) "
+            "ON CONFLICT(city,country,method) DO UPDATE SET last_error=excluded.last_error, "
+            "last_error_at=excluded.last_error_at, fails=fails+1",
+            key + (str(err)[:300], now),
+        )
+    conn.commit()
+
+
+def _prefetch_backoff(key: tuple[str, str, str]) -> bool:
+    # Orte, die zuletzt fehlschlugen (z.B. Tippfehler im Stadtnamen), exponentiell seltener versuchen
+    cur = db().cursor()
+    cur.execute("SELECT fails, last_error_at FROM prefetch_status WHERE city=? AND country=? AND method=?", key)
+    row = cur.fetchone()
+    if not row or not row["fails"]:
+        return False
+    wait = min(PREFETCH_INTERVAL * 2 ** row["fails"], PREFETCH_MAX_BACKOFF)
+    return time.time() < row["last_error_at"] + wait
+
+
+def _prefetch_wait_token():
+    while not rate_allow("prayer_prefetch", "global"):
+        time.sleep(1.0)
+
+
+def prefetch_prayer_times() -> tuple[int, int]:
+    # -> (geladen, fehlgeschlagen)
+    loaded = failed = 0
+    for city, country, method in configured_locations():
+        key = _prayer_key(city, country, method)
+        if _prefetch_backoff(key):
+            continue
+        tz_name = _prayer_cache_tz(key)
+        days = []
+        if tz_name is None:
+            days.append(None)  # Zeitzone noch unbekannt: aladhan liefert "heute" samt Zeitzone
+        else:
+            today = _tz_now(tz_name).date()
+            if _prayer_cache_get(key, today.isoformat()) is None:
+                days.append(today)
+            if _local_midnight_after(today.isoformat(), tz_name) - time.time() < PREFETCH_LEAD:
+                tomorrow = today + timedelta(days=1)
+                if _prayer_cache_get(key, tomorrow.isoformat()) is None:
+                    days.append(tomorrow)
+        for day in days:
+            _prefetch_wait_token()
+            try:
+                out, tz_name, got = _fetch_prayer_times_upstream(city, country, method, day)
+            except upstream.CircuitOpenError:
+                return loaded, failed + 1  # aladhan gerade nicht erreichbar: nächste Runde
+            except Exception as e:
+                failed += 1
+                _prefetch_record(key, None, None, e)
+                break
+            _prayer_cache_put(key, got, out, tz_name)
+            _prefetch_record(key, tz_name, got, None)
+            loaded += 1
+    return loaded, failed
+
+
+def _prayer_prefetch_worker():
+    while True:
+        try:
+            with APP.app_context():
+                if lease_acquire("prayer_prefetch", PREFETCH_INTERVAL * 2):
+                    prefetch_prayer_times()
+        except Exception:
+            pass
+        time.sleep(PREFETCH_INTERVAL)
+
+
+def start_background_jobs():
+    global _BG_STARTED
+    with _BG_LOCK:
+        if _BG_STARTED:
+            return
+        _BG_STARTED = True
+    threading.Thread(target=_vod_worker, name="vod-prefetch", daemon=True).start()
+    threading.Thread(target=_gaz_warm, name="gazetteer-load", daemon=True).start()
+    if PRAYER_PREFETCH and PRAYER_SOURCE != "local":
+        threading.Thread(target=_prayer_prefetch_worker, name="prayer-prefetch", daemon=True).start()
+
+
+@APP.before_request
+def _ensure_background_jobs():
+    if not _BG_STARTED:
+        start_background_jobs()
+
+
+def verse_of_day(lang: str):
+    today = date.today()
+    tr_ed = translation_edition(lang)
+    key = (today.isoformat(), tr_ed)
+    with _VOD_LOCK:
+        vod = _VOD.get(key)
+    if vod:
+        metrics.inc("cache_requests_total", {"cache": "verse_of_day", "result": "hit"})
+        return dict(vod)
+    # noch nicht vorgeladen: nur lokal nachsehen, nie auf alquran.cloud warten
+    try:
+        vod = _vod_from_store(today, tr_ed)
+    except Exception:
+        vod = None
+    metrics.inc("cache_requests_total", {"cache": "verse_of_day", "result": "hit" if vod else "miss"})
+    if vod:
+        with _VOD_LOCK:
+            _VOD[key] = vod
+        return dict(vod)
+    _VOD_WAKE.set()
+    return {"ref": "-", "ar": "", "tr": ""}
+
+
+# Unabhängige Upstream-Abfragen einer Seite parallel, mit gemeinsamer Deadline.
+# Was zu spät kommt, wird als Fehler gemeldet und die Seite zeigt einen Platzhalter.
+PAGE_DEADLINE = float(os.environ.get("PAGE_DEADLINE", "8"))
+UPSTREAM_THREADS = int(os.environ.get("UPSTREAM_THREADS", "16"))
+_UPSTREAM_POOL = ThreadPoolExecutor(max_workers=UPSTREAM_THREADS, thread_name_prefix="upstream")
+
+
+def _run_in_app_context(fn, *args):
+    with APP.app_context():
+        return fn(*args)
+
+
+def fan_out(tasks: dict[str, tuple]) -> dict[str, Future]:
+    # nur die Spans mitgeben (Server-Timing), nicht den Request-Kontext: späte Tasks
+    # laufen weiter, wenn der Request schon abgebaut ist
+    return {
+        name: _UPSTREAM_POOL.submit(metrics.spans_context().run, _run_in_app_context, *task)
+        for name, task in tasks.items()
+    }
+
+
+def collect(futures: dict[str, Future], deadline: float) -> dict[str, tuple[object, Optional[Exception]]]:
+    out: dict[str, tuple[object, Optional[Exception]]] = {}
+    t0 = time.perf_counter()
+    for name, fut in futures.items():
+        try:
+            out[name] = (fut.result(timeout=max(0.0, deadline - time.monotonic())), None)
+        except FutureTimeout:
+            # nicht abbrechen: der Task läuft weiter und füllt den Cache für den nächsten Aufruf
+            out[name] = (None, TimeoutError(f"{name}: no answer within {PAGE_DEADLINE:g}s"))
+        except Exception as e:
+            out[name] = (None, e)
+    metrics.add_span("fanout_wait", time.perf_counter() - t0)
+    return out
+
+
+APP_CSS = r"""
+:root{--bg:#0b0f14;--card:rgba(255,255,255,.06);--text:#e8eef7;--muted:rgba(232,238,247,.68);
+  --border:rgba(255,255,255,.10);--shadow:0 10px 30px rgba(0,0,0,.25);
+  --accent:#6ea8ff;--ok:#69d18d;--radius:16px;--pad:16px;--max:1120px;}
+[data-theme="light"]{--bg:#f6f7fb;--card:#fff;--text:#0f172a;--muted:rgba(15,23,42,.65);
+  --border:rgba(15,23,42,.10);--shadow:0 10px 30px rgba(15,23,42,.08);--accent:#2563eb;--ok:#15803d;}
+*{box-sizing:border-box}
+body{margin:0;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif;
+  background:radial-gradient(1200px 700px at 20% 0%, rgba(110,168,255,.18), transparent 55%),
+             radial-gradient(900px 500px at 80% 10%, rgba(105,209,141,.16), transparent 55%), var(--bg);
+  color:var(--text);}
+.wrap{max-width:var(--max);margin:0 auto;padding:18px;}
+.topbar{position:sticky;top:0;backdrop-filter:blur(10px);
+  background:color-mix(in srgb,var(--bg) 78%,transparent);border-bottom:1px solid var(--border);z-index:10;}
+.nav{display:flex;align-items:center;justify-content:space-between;gap:12px;padding:14px 18px;max-width:var(--max);margin:0 auto;flex-wrap:wrap;}
+.brand{display:flex;align-items:center;gap:10px;font-weight:800;letter-spacing:.4px;}
+.logo{width:34px;height:34px;border-radius:12px;background:linear-gradient(135deg, rgba(110,168,255,.95), rgba(105,209,141,.92));box-shadow:var(--shadow);}
+.links{display:flex;align-items:center;gap:10px;flex-wrap:wrap;}
+a{color:var(--text);text-decoration:none;opacity:.92;}
+a:hover{opacity:1;color:var(--accent)}
+.pill{display:inline-flex;align-items:center;gap:8px;padding:10px 12px;border:1px solid var(--border);border-radius:999px;
+  background:color-mix(in srgb,var(--card) 85%,transparent);}
+.btn{display:inline-flex;align-items:center;justify-content:center;padding:10px 12px;border-radius:999px;border:1px solid var(--border);
+  background:color-mix(in srgb,var(--card) 85%,transparent);color:var(--text);cursor:pointer;}
+.btn:hover{border-color:color-mix(in srgb,var(--accent) 45%,var(--border));}
+.muted{color:var(--muted)}
+.card{background:var(--card);border:1px solid var(--border);border-radius:var(--radius);padding:var(--pad);box-shadow:var(--shadow);margin:14px 0;}
+.grid{display:grid;grid-template-columns:repeat(12,1fr);gap:14px;}
+.col-6{grid-column:span 6}.col-4{grid-column:span 4}.col-8{grid-column:span 8}.col-12{grid-column:span 12}
+@media (max-width:900px){.col-6,.col-4,.col-8{grid-column:span 12}}
+.row{display:flex;gap:12px;flex-wrap:wrap;align-items:center;}
+input,select{padding:12px 12px;border-radius:12px;border:1px solid var(--border);
+  background:color-mix(in srgb,var(--card) 92%,transparent);color:var(--text);outline:none;min-width:180px;}
+table{border-collapse:collapse;width:100%;}
+th,td{border-bottom:1px solid var(--border);padding:12px 10px;text-align:left;}
+.ok{color:var(--ok);font-weight:800;}
+.badge{display:inline-flex;padding:6px 10px;border-radius:999px;border:1px solid var(--border);background:color-mix(in srgb,var(--card) 85%,transparent);}
+.listbox{margin-top:10px;border:1px solid var(--border);border-radius:12px;overflow:hidden;}
+.listbox button{width:100%;text-align:left;padding:10px 12px;border:0;background:color-mix(in srgb,var(--card) 92%,transparent);color:var(--text);cursor:pointer;}
+.listbox button:hover{background:color-mix(in srgb,var(--card) 75%,transparent);}
+.danger{border-color:color-mix(in srgb, red 40%, var(--border));}
+.hiddenhp{position:absolute;left:-9999px;top:-9999px;height:1px;width:1px;opacity:0;}
+.hamburger{display:none}
+@media (max-width:760px){
+  .links{display:none;width:100%;padding-top:10px;}
+  .links.open{display:flex;}
+  .hamburger{display:inline-flex}
+  input,select{min-width:100%;}
+}
+.small{font-size:12px}
+.ayah-cols{display:grid;grid-template-columns:repeat(auto-fit,minmax(240px,1fr));gap:12px}
+.big{font-size:28px;font-weight:900}
+"""
+
+APP_JS = r"""
+(function () {
+  const root = document.documentElement;
+  function updateThemeIcon() {
+    const btn = document.getElementById("themeBtn");
+    if (!btn) return;
+    const t = root.getAttribute("data-theme") || "dark";
+    btn.textContent = (t === "light") ? "☀️" : "🌙";
+  }
+  function setTheme(theme) {
+    root.setAttribute("data-theme", theme);
+    localStorage.setItem("theme", theme);
+    updateThemeIcon();
+  }
+  function initTheme() {
+    const serverTheme = root.getAttribute("data-theme-server") || "auto";
+    const stored = localStorage.getItem("theme");
+    if (stored) root.setAttribute("data-theme", stored);
+    else if (serverTheme === "auto") {
+      const prefersLight = window.matchMedia && window.matchMedia("(prefers-color-scheme: light)").matches;
+      root.setAttribute("data-theme", prefersLight ? "light" : "dark");
+    } else root.setAttribute("data-theme", serverTheme);
+    updateThemeIcon();
+    const btn = document.getElementById("themeBtn");
+    if (btn) btn.addEventListener("click", function () {
+      const current = root.getAttribute("data-theme") || "dark";
+      setTheme(current === "light" ? "dark" : "light");
+    });
+  }
+  function initMenu() {
+    const menuBtn = document.getElementById("menuBtn");
+    const navLinks = document.getElementById("navLinks");
+    if (menuBtn && navLinks) menuBtn.addEventListener("click", () => navLinks.classList.toggle("open"));
+  }
+  document.addEventListener("DOMContentLoaded", () => { initTheme(); initMenu(); });
+})();
+"""
+
+# Statische Assets: Inhalt-Hash im Dateinamen, daher für immer cachebar.
+# Komprimierte Varianten werden einmal beim Start erzeugt.
+ASSET_MAX_AGE = 31536000
+COMPRESS_MIN_SIZE = 512
+COMPRESS_TYPES = {"text/html", "text/css", "text/javascript", "application/json", "text/calendar"}
+ASSETS: dict[str, dict] = {}
+ASSET_URLS: dict[str, str] = {}
+
+
+def _register_asset(name: str, text: str, mimetype: str):
+    raw = text.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    stem, ext = name.rsplit(".", 1)
+    fname = f"{stem}.{digest}.{ext}"
+    enc = {"gzip": gzip.compress(raw, 9)}
+    if brotli is not None:
+        enc["br"] = brotli.compress(raw, quality=11)
+    ASSETS[fname] = {"raw": raw, "mimetype": mimetype, "etag": digest, "enc": enc}
+    ASSET_URLS[name] = fname
+
+
+_register_asset("app.css", APP_CSS, "text/css")
+_register_asset("app.js", APP_JS, "text/javascript")
+
+
+def asset_url(name: str) -> str:
+    return url_for("asset", fname=ASSET_URLS[name])
+
+
+def _pick_encoding(available) -> Optional[str]:
+    accept = request.accept_encodings
+    for enc in ("br", "gzip"):
+        if enc in available and accept[enc]:
+            return enc
+    return None
+
+
+@APP.get("/assets/<fname>")
+def asset(fname: str):
+    a = ASSETS.get(fname)
+    if a is None:
+        abort(404)
+    enc = _pick_encoding(a["enc"])
+    resp = APP.response_class(a["enc"][enc] if enc else a["raw"], mimetype=a["mimetype"])
+    if enc:
+        resp.headers["Content-Encoding"] = enc
+    resp.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(a["etag"])
+    return resp.make_conditional(request)
+
+
+def _gzip_stream(chunks):
+    # pro Chunk Z_SYNC_FLUSH, damit der Browser trotz Kompression sofort etwas bekommt
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield z.flush()
+
+
+@APP.after_request
+def _finish_response(resp):
+    if resp.direct_passthrough or "Content-Encoding" in resp.headers:
+        return resp
+    if resp.status_code != 200 or resp.mimetype not in COMPRESS_TYPES:
+        return resp
+    if resp.is_streamed:
+        resp.vary.add("Accept-Encoding")
+        if _pick_encoding(("gzip",)):
+            resp.response = _gzip_stream(resp.response)
+            resp.headers["Content-Encoding"] = "gzip"
+        return resp
+
+    # HTML-Seiten: ETag über den Inhalt, Browser fragt mit If-None-Match nach -> 304
+    if request.method == "GET" and resp.mimetype == "text/html":
+        resp.add_etag(weak=True)
+        if "Cache-Control" not in resp.headers:
+            resp.headers["Cache-Control"] = "private, no-cache"
+        resp.make_conditional(request)
+        if resp.status_code == 304:
+            return resp
+
+    resp.vary.add("Accept-Encoding")
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return resp
+    enc = _pick_encoding(("br", "gzip") if brotli is not None else ("gzip",))
+    if enc == "br":
+        resp.set_data(brotli.compress(data, quality=5))
+    elif enc == "gzip":
+        resp.set_data(gzip.compress(data, 6))
+    else:
+        return resp
+    resp.headers["Content-Encoding"] = enc
+    return resp
+
+BASE = r"""
+<!doctype html>
+<html lang="{{ lang }}" data-theme-server="{{ theme }}">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <meta name="color-scheme" content="light dark">
+  <title>{{ title }}</title>
+  <link rel="stylesheet" href="{{ asset_url('app.css') }}">
+</head>
+<body>
+  <div class="topbar">
+    <div class="nav">
+      <div class="brand">
+        <div class="logo"></div>
+        <div>
+          <div style="line-height:1.1;">{{ tr(lang,'app_name') }}</div>
+          <div class="muted" style="font-size:12px;margin-top:2px;">{{ tr(lang,'tagline') }}</div>
+        </div>
+      </div>
+
+      <div class="row" style="gap:10px;">
+        <button class="btn hamburger" id="menuBtn" type="button" aria-label="Menu">☰</button>
+        <button class="btn" id="themeBtn" type="button" title="Theme">🌙</button>
+
+        <a class="pill" href="{{ url_for('settings') }}">⚙ {{ tr(lang,'settings') }}</a>
+
+        {% if user %}
+          {% if user_role == 'admin' %}
+            <a class="pill" href="{{ url_for('admin_panel') }}">🛡 {{ tr(lang,'admin') }}</a>
+          {% endif %}
+          <a class="pill" href="{{ url_for('logout') }}">↩ {{ tr(lang,'logout') }}</a>
+        {% else %}
+          <a class="pill" href="{{ url_for('login') }}">🔐 {{ tr(lang,'login') }}</a>
+        {% endif %}
+      </div>
+
+      <div class="links" id="navLinks">
+        <a class="pill" href="{{ url_for('home') }}">{{ tr(lang,'home') }}</a>
+        <a class="pill" href="{{ url_for('prayer_times') }}">{{ tr(lang,'prayer_times') }}</a>
+        <a class="pill" href="{{ url_for('quran') }}">{{ tr(lang,'quran') }}</a>
+        <a class="pill" href="{{ url_for('quran_search') }}">🔎 {{ tr(lang,'search') }}</a>
+        <a class="pill" href="{{ url_for('tracker') }}">{{ tr(lang,'tracker') }}</a>
+        <a class="pill" href="{{ url_for('favorites') }}">{{ tr(lang,'favorites') }}</a>
+      </div>
+    </div>
+  </div>
+
+  <div class="wrap">
+    {% block body %}{{ body|safe }}{% endblock %}
+  </div>
+
+  <script src="{{ asset_url('app.js') }}" defer></script>
+</body>
+</html>
+"""
+
+TEMPLATES: dict[str, str] = {"base.html": BASE}
+TEMPLATES["_macros.html"] = r"""
+{% macro prayer_badge(name, time) -%}
+  <span class='badge'>{{ name }}: <b>{{ time }}</b></span>
+{%- endmacro %}
+
+{% macro mark_done(prayer, done, style) -%}
+  <form method="post" action="{{ url_for('track_done') }}" style="{{ style }}">
+    <input type="hidden" name="prayer" value="{{ prayer }}">
+    <button class="btn" type="submit">{{ '✅' if done else '⬜' }} {{ prayer }}</button>
+  </form>
+{%- endmacro %}
+
+{% macro star_button(verse_key, is_fav, return_to, logged_in, lang) -%}
+  {%- if logged_in -%}
+  <form method="post" action="{{ url_for('favorite_toggle') }}" style="margin:0;">
+    <input type="hidden" name="verse_key" value="{{ verse_key }}">
+    <input type="hidden" name="return_to" value="{{ return_to }}">
+    <button class="btn" type="submit">{{ '⭐' if is_fav else '☆' }}</button>
+  </form>
+  {%- else -%}
+  <a class='pill' href='{{ url_for('login') }}'>{{ tr(lang,'login') }}</a>
+  {%- endif -%}
+{%- endmacro %}
+
+{% macro verse_card(verse_key, text, star) -%}
+  <div class="card">
+    <div class="row" style="justify-content:space-between;">
+      <b>{{ verse_key }}</b>
+      {{ star }}
+    </div>
+    <div style="margin-top:10px;">{{ text }}</div>
+  </div>
+{%- endmacro %}
+
+{% macro ayah_card(ayah, editions, rtl, star) -%}
+  <div class="card" style="margin:10px 0; padding:12px;">
+    <div class="row" style="justify-content:space-between;">
+      <div><b>{{ ayah.numberInSurah }}.</b></div>
+      {{ star }}
+    </div>
+    <div class="ayah-cols" style="margin-top:8px;">
+      {%- for e in editions %}
+      <div{% if e in rtl %} dir="rtl" lang="ar" style="font-size:22px;"{% else %} style="font-size:18px;"{% endif %}>{{ ayah.texts.get(e, '') }}</div>
+      {%- endfor %}
+    </div>
+  </div>
+{%- endmacro %}
+
+{% macro option(value, label, selected) -%}
+  <option value="{{ value }}" {{ 'selected' if selected else '' }}>{{ label }}</option>
+{%- endmacro %}
+"""
+
+TEMPLATES["login.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+<div class="card col-6">
+  <h2 style="margin-top:0;">🔐 {{ tr(lang,'login') }}</h2>
+  <form method="post" action="{{ url_for('login_post') }}">
+    <div class="row"><input name="username" placeholder="{{ tr(lang,'username') }}" required></div>
+    <div class="row" style="margin-top:10px;"><input name="password" type="password" placeholder="{{ tr(lang,'password') }}" required></div>
+    <input type="hidden" name="next" value="{{ next_url }}">
+    <input type="hidden" name="ts" id="tsLogin" value="">
+    <div class="row" style="margin-top:12px;">
+      <button class="btn" type="submit">{{ tr(lang,'login') }}</button>
+      <a class="pill" href="{{ url_for('register') }}">{{ tr(lang,'register') }}</a>
+    </div>
+  </form>
+</div>
+<script>document.getElementById('tsLogin').value = String(Date.now());</script>
+{% endblock %}
+"""
+
+TEMPLATES["register.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+<div class="card col-6">
+  <h2 style="margin-top:0;">🆕 {{ tr(lang,'register') }}</h2>
+  <form method="post" action="{{ url_for('register_post') }}">
+    <div class="row"><input name="username" placeholder="{{ tr(lang,'username') }}" required></div>
+    <div class="row" style="margin-top:10px;"><input name="password" type="password" placeholder="{{ tr(lang,'password') }} (min 8)" required></div>
+    <div class="row" style="margin-top:10px;"><input name="password2" type="password" placeholder="{{ tr(lang,'password2') }}" required></div>
+    <div class="row" style="margin-top:10px;"><input name="invite_code" placeholder="{{ tr(lang,'invite_code') }}" required></div>
+
+    <div class="hiddenhp">
+      <label>Website</label>
+      <input name="website" value="">
+    </div>
+
+    <input type="hidden" name="ts" id="tsReg" value="">
+    <div class="row" style="margin-top:12px;">
+      <button class="btn" type="submit">{{ tr(lang,'register') }}</button>
+      <a class="pill" href="{{ url_for('login') }}">{{ tr(lang,'login') }}</a>
+    </div>
+  </form>
+  <div class="muted small" style="margin-top:10px;">Invite nötig (Admin kann Codes ändern).</div>
+</div>
+<script>document.getElementById('tsReg').value = String(Date.now());</script>
+{% endblock %}
+"""
+
+TEMPLATES["home.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+<div class="grid">
+  <div class="card col-8">
+    {%- if prayer_err %}
+    <div class="muted">{{ tr(lang,'next_prayer') }}</div>
+    <div class="big">—</div>
+    <div><b>{{ tr(lang,'error_prayer_load') }}:</b> {{ prayer_err }}</div>
+    <div style="margin-top:14px;" class="row">
+      <a class="pill" href="{{ url_for('home') }}">↻</a>
+      <a class="pill" href="{{ url_for('settings') }}">⚙ {{ tr(lang,'settings') }}</a>
+    </div>
+    {%- else %}
+    <div class="row" style="justify-content:space-between;">
+      <div>
+        <div class="muted">{{ tr(lang,'next_prayer') }}</div>
+        <div class="big"><span class="ok">{{ next_name }}</span></div>
+        <div class="muted">{{ city }}, {{ country }} • {{ tr(lang,'timezone') }}: <b>{{ tz_name }}</b></div>
+      </div>
+      <div class="badge" style="font-size:18px;">
+        {{ tr(lang,'remaining') }}: <b id="countdown">...</b>
+      </div>
+    </div>
+    <div style="margin-top:12px; display:flex; gap:10px; flex-wrap:wrap;">
+      {%- for p in PRAYERS %}{{ m.prayer_badge(p, timings.get(p, '-')) }}{% endfor -%}
+    </div>
+    <div style="margin-top:14px;" class="row">
+      <a class="pill" href="{{ url_for('prayer_times') }}">{{ tr(lang,'prayer_times') }}</a>
+      <a class="pill" href="{{ url_for('settings') }}">⚙ {{ tr(lang,'settings') }}</a>
+    </div>
+    {%- endif %}
+  </div>
+
+  <div class="card col-4">
+    <div class="muted">{{ tr(lang,'progress_today') }}</div>
+    <div class="big">{{ (done_today|length ~ '/5') if uid else '—' }}</div>
+    <div class="muted small">{{ tr(lang,'today') }}: {{ today }}</div>
+    <div style="margin-top:10px; border:1px solid var(--border); border-radius:12px; overflow:hidden;">
+      <div style="height:10px; width:{{ progress_bar }}%; background: color-mix(in srgb, var(--ok) 65%, transparent);"></div>
+    </div>
+    <div style="margin-top:12px;">
+      <div class="muted small">{{ tr(lang,'streak') }}</div>
+      <div class="big">{{ streak if uid else '—' }}</div>
+      <div class="muted small">{{ tr(lang,'streak_desc') }}</div>
+    </div>
+  </div>
+
+  <div class="card col-6">
+    <h3 style="margin-top:0;">{{ tr(lang,'mark_done') }}</h3>
+    <div class="row">
+      {%- if uid %}
+        {%- for p in PRAYERS %}{{ m.mark_done(p, p in done_today, 'margin:0;') }}{% endfor %}
+      {%- else %}
+        <div class='muted'>{{ tr(lang,'auth_required') }} <a class='pill' href='{{ url_for('login') }}'>{{ tr(lang,'login') }}</a></div>
+      {%- endif %}
+    </div>
+  </div>
+
+  <div class="card col-6">
+    <h3 style="margin-top:0;">{{ tr(lang,'verse_of_day') }}</h3>
+    <div class="muted small">{{ vod.get('ref','-') }}</div>
+    <div style="margin-top:10px; font-size:18px;">{{ vod.get('ar','') }}</div>
+    <div class="muted" style="margin-top:10px;">{{ vod.get('tr','') }}</div>
+  </div>
+</div>
+
+{%- if next_iso %}
+<script>
+  const target = new Date("{{ next_iso }}");
+  function tick() {
+    const now = new Date();
+    let diff = Math.floor((target - now) / 1000);
+    if (diff < 0) diff = 0;
+    const h = Math.floor(diff / 3600);
+    const m = Math.floor((diff % 3600) / 60);
+    const s = diff % 60;
+    const txt = (h>0 ? h + "h " : "") + String(m).padStart(2,"0") + "m " + String(s).padStart(2,"0") + "s";
+    const el = document.getElementById("countdown");
+    if (el) el.textContent = txt;
+  }
+  tick(); setInterval(tick, 1000);
+</script>
+{%- endif %}
+{% endblock %}
+"""
+
+
+TEMPLATES["prayer_times.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">{{ tr(lang,'prayer_times') }}</h2>
+  <div class="muted">{{ city }}, {{ country }} • {{ tr(lang,'timezone') }}: <b>{{ tz }}</b> • {{ tr(lang,'method') }}: <b>{{ method }}</b></div>
+  <div style="margin-top:10px;">
+    <table>
+      <tr><th>Prayer</th><th>{{ tr(lang,'time') }}</th></tr>
+      {%- for p in PRAYERS %}
+      <tr><td>{{ p }}</td><td><b>{{ timings.get(p,'-') }}</b></td></tr>
+      {%- endfor %}
+    </table>
+  </div>
+  <div class="row" style="margin-top:12px;">
+    <a class="pill" href="{{ url_for('prayer_times_month') }}">📅 {{ tr(lang,'month_view') }}</a>
+    <a class="pill" href="{{ url_for('prayer_times_ics') }}">⬇ {{ tr(lang,'calendar_export') }}</a>
+  </div>
+</div>
+{% endblock %}
+"""
+
+TEMPLATES["prayer_month.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">{{ tr(lang,'prayer_times') }} • {{ ym }}</h2>
+  <div class="muted">{{ city }}, {{ country }} • {{ tr(lang,'timezone') }}: <b>{{ tz }}</b> • {{ tr(lang,'method') }}: <b>{{ method }}</b></div>
+  <div class="row" style="margin-top:10px;">
+    <a class="pill" href="{{ url_for('prayer_times_month', m=prev_ym) }}">‹ {{ prev_ym }}</a>
+    <a class="pill" href="{{ url_for('prayer_times_month', m=next_ym) }}">{{ next_ym }} ›</a>
+    <a class="pill" href="{{ url_for('prayer_times_ics', **{'from': ym}) }}">⬇ {{ tr(lang,'calendar_export') }}</a>
+  </div>
+  <div style="margin-top:10px;overflow-x:auto;">
+    <table>
+      <tr><th>{{ tr(lang,'date') }}</th>{% for p in PRAYERS %}<th>{{ p }}</th>{% endfor %}</tr>
+      {%- for d in days %}
+      <tr{% if d.day == today %} style="font-weight:700;"{% endif %}><td>{{ d.day }}</td>{% for p in PRAYERS %}<td>{{ d.timings.get(p) or '-' }}</td>{% endfor %}</tr>
+      {%- endfor %}
+    </table>
+  </div>
+</div>
+{% endblock %}
+"""
+
+TEMPLATES["tracker.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+<div class="grid">
+  <div class="card col-4">
+    <div class="muted">{{ tr(lang,'streak') }}</div>
+    <div class="big">{{ streak }}</div>
+    <div class="muted small">{{ tr(lang,'streak_desc') }}</div>
+  </div>
 
+  <div class="card col-8">
+    <h2 style="margin-top:0;">{{ tr(lang,'tracker') }} · <span class="muted">{{ today }}</span></h2>
+    <div class="muted">{{ tr(lang,'mark_done') }}:</div>
+    <div style="margin-top:6px;">
+      {%- for p in PRAYERS %}{{ m.mark_done(p, p in done_today, 'display:inline-block; margin:6px;') }}{% endfor -%}
+    </div>
+  </div>
 
-BASE = r"""
-<!doctype html>
-<html lang="{{ lang }}" data-theme-server="{{ theme }}">
-<head>
-  <meta charset="utf-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <meta name="color-scheme" content="light dark">
-  <title>{{ title }}</title>
-  <style>
-    :root{--bg:#0b0f14;--card:rgba(255,255,255,.06);--text:#e8eef7;--muted:rgba(232,238,247,.68);
-      --border:rgba(255,255,255,.10);--shadow:0 10px 30px rgba(0,0,0,.25);
-      --accent:#6ea8ff;--ok:#69d18d;--radius:16px;--pad:16px;--max:1120px;}
-    [data-theme="light"]{--bg:#f6f7fb;--card:#fff;--text:#0f172a;--muted:rgba(15,23,42,.65);
-      --border:rgba(15,23,42,.10);--shadow:0 10px 30px rgba(15,23,42,.08);--accent:#2563eb;--ok:#15803d;}
-    *{box-sizing:border-box}
-    body{margin:0;font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Arial,sans-serif;
-      background:radial-gradient(1200px 700px at 20% 0%, rgba(110,168,255,.18), transparent 55%),
-                 radial-gradient(900px 500px at 80% 10%, rgba(105,209,141,.16), transparent 55%), var(--bg);
-      color:var(--text);}
-    .wrap{max-width:var(--max);margin:0 auto;padding:18px;}
-    .topbar{position:sticky;top:0;backdrop-filter:blur(10px);
-      background:color-mix(in srgb,var(--bg) 78%,transparent);border-bottom:1px solid var(--border);z-index:10;}
-    .nav{display:flex;align-items:center;justify-content:space-between;gap:12px;padding:14px 18px;max-width:var(--max);margin:0 auto;flex-wrap:wrap;}
-    .brand{display:flex;align-items:center;gap:10px;font-weight:800;letter-spacing:.4px;}
-    .logo{width:34px;height:34px;border-radius:12px;background:linear-gradient(135deg, rgba(110,168,255,.95), rgba(105,209,141,.92));box-shadow:var(--shadow);}
-    .links{display:flex;align-items:center;gap:10px;flex-wrap:wrap;}
-    a{color:var(--text);text-decoration:none;opacity:.92;}
-    a:hover{opacity:1;color:var(--accent)}
-    .pill{display:inline-flex;align-items:center;gap:8px;padding:10px 12px;border:1px solid var(--border);border-radius:999px;
-      background:color-mix(in srgb,var(--card) 85%,transparent);}
-    .btn{display:inline-flex;align-items:center;justify-content:center;padding:10px 12px;border-radius:999px;border:1px solid var(--border);
-      background:color-mix(in srgb,var(--card) 85%,transparent);color:var(--text);cursor:pointer;}
-    .btn:hover{border-color:color-mix(in srgb,var(--accent) 45%,var(--border));}
-    .muted{color:var(--muted)}
-    .card{background:var(--card);border:1px solid var(--border);border-radius:var(--radius);padding:var(--pad);box-shadow:var(--shadow);margin:14px 0;}
-    .grid{display:grid;grid-template-columns:repeat(12,1fr);gap:14px;}
-    .col-6{grid-column:span 6}.col-4{grid-column:span 4}.col-8{grid-column:span 8}.col-12{grid-column:span 12}
-    @media (max-width:900px){.col-6,.col-4,.col-8{grid-column:span 12}}
-    .row{display:flex;gap:12px;flex-wrap:wrap;align-items:center;}
-    input,select{padding:12px 12px;border-radius:12px;border:1px solid var(--border);
-      background:color-mix(in srgb,var(--card) 92%,transparent);color:var(--text);outline:none;min-width:180px;}
-    table{border-collapse:collapse;width:100%;}
-    th,td{border-bottom:1px solid var(--border);padding:12px 10px;text-align:left;}
-    .ok{color:var(--ok);font-weight:800;}
-    .badge{display:inline-flex;padding:6px 10px;border-radius:999px;border:1px solid var(--border);background:color-mix(in srgb,var(--card) 85%,transparent);}
-    .listbox{margin-top:10px;border:1px solid var(--border);border-radius:12px;overflow:hidden;}
-    .listbox button{width:100%;text-align:left;padding:10px 12px;border:0;background:color-mix(in srgb,var(--card) 92%,transparent);color:var(--text);cursor:pointer;}
-    .listbox button:hover{background:color-mix(in srgb,var(--card) 75%,transparent);}
-    .danger{border-color:color-mix(in srgb, red 40%, var(--border));}
-    .hiddenhp{position:absolute;left:-9999px;top:-9999px;height:1px;width:1px;opacity:0;}
-    .hamburger{display:none}
-    @media (max-width:760px){
-      .links{display:none;width:100%;padding-top:10px;}
-      .links.open{display:flex;}
-      .hamburger{display:inline-flex}
-      input,select{min-width:100%;}
-    }
-    .small{font-size:12px}
-    .big{font-size:28px;font-weight:900}
-  </style>
-</head>
-<body>
-  <div class="topbar">
-    <div class="nav">
-      <div class="brand">
-        <div class="logo"></div>
-        <div>
-          <div style="line-height:1.1;">{{ tr(lang,'app_name') }}</div>
-          <div class="muted" style="font-size:12px;margin-top:2px;">{{ tr(lang,'tagline') }}</div>
-        </div>
-      </div>
+  <div class="card col-12">
+    <h3 style="margin-top:0;">{{ tr(lang,'last_entries') }}</h3>
+    <table>
+      <tr><th>{{ tr(lang,'date') }}</th><th>Prayer</th><th>{{ tr(lang,'city') }}</th><th>{{ tr(lang,'time') }}</th></tr>
+      {%- for r in last %}
+      <tr><td>{{ r['day'] }}</td><td><b>{{ r['prayer'] }}</b></td><td>{{ r['city'] }}</td><td>{{ r['done_at'] }}</td></tr>
+      {%- else %}
+      <tr><td colspan='4' class='muted'>{{ tr(lang,'no_entries') }}</td></tr>
+      {%- endfor %}
+    </table>
+  </div>
+</div>
+{% endblock %}
+"""
 
-      <div class="row" style="gap:10px;">
-        <button class="btn hamburger" id="menuBtn" type="button" aria-label="Menu">☰</button>
-        <button class="btn" id="themeBtn" type="button" title="Theme">🌙</button>
+TEMPLATES["quran.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">{{ tr(lang,'quran') }} – {{ tr(lang,'surahs') }}</h2>
+  <div class="row">
+    <a class="pill" href="{{ url_for('quran_search') }}">🔎 {{ tr(lang,'search') }}</a>
+    {%- if uid %}
+    <a class='pill' href='{{ url_for('favorites') }}'>⭐ {{ tr(lang,'favorites') }}</a>
+    {%- endif %}
+  </div>
+  <ol style="padding-left:18px; margin-top:12px;">
+    {%- for su in surahs %}
+    <li style='margin:6px 0;'><a class='pill' href='{{ url_for('quran_surah', number=su['number']) }}'>{{ tr(lang,'surah') }} {{ su['number'] }}: {{ su['englishName'] }} ({{ su['name'] }})</a></li>
+    {%- endfor %}
+  </ol>
+</div>
+{% endblock %}
+"""
 
-        <a class="pill" href="{{ url_for('settings') }}">⚙ {{ tr(lang,'settings') }}</a>
+TEMPLATES["quran_surah.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+{%- set total = surah['numberOfAyahs'] %}
+{%- set pager %}
+  <div class="row" style="margin-top:10px;">
+    {%- if surah['start'] > 1 %}
+    <a class="pill" href="{{ surah_url(start=[surah['start'] - count, 1]|max) }}">← {{ tr(lang,'prev') }}</a>
+    {%- endif %}
+    <span class="muted">{{ tr(lang,'verses') }} {{ surah['start'] }}–{{ surah['end'] }} / {{ total }}</span>
+    {%- if surah['end'] < total %}
+    <a class="pill" href="{{ surah_url(start=surah['end'] + 1) }}">{{ tr(lang,'next') }} →</a>
+    {%- endif %}
+    {%- if surah['start'] > 1 or surah['end'] < total %}
+    <a class="pill" href="{{ surah_url(start=1, count=total) }}">{{ tr(lang,'all_verses') }}</a>
+    {%- endif %}
+  </div>
+{%- endset %}
+<div class="card">
+  <h2 style="margin-top:0;">{{ tr(lang,'surah') }} {{ surah['number'] }}: {{ surah['englishName'] }} ({{ surah['name'] }})</h2>
+  <div class="row">
+    <a class="pill" href="{{ url_for('quran_surah', number=surah['number'], tr='') }}">{{ tr(lang,'arabic') }}</a>
+    <a class="pill" href="{{ url_for('quran_surah', number=surah['number'], edition=tr_edition, tr='') }}">{{ tr(lang,'translation') }}</a>
+    <a class="pill" href="{{ url_for('quran_surah', number=surah['number']) }}">{{ tr(lang,'side_by_side') }}</a>
+    <a class="pill" href="{{ url_for('quran_search') }}">🔎 {{ tr(lang,'search') }}</a>
+    <a class="pill" href="{{ url_for('quran') }}">← {{ tr(lang,'back') }}</a>
+  </div>
+  {{ pager }}
+</div>
+{%- set return_to = surah_url(start=surah['start']) %}
+{%- for a in surah['ayahs'] %}
+{%- set verse_key = surah['number'] ~ ':' ~ a['numberInSurah'] %}
+{{ m.ayah_card(a, surah['editions'], rtl, m.star_button(verse_key, verse_key in favs, return_to, uid, lang)) }}
+{%- endfor %}
+<div class="card">{{ pager }}</div>
+{% endblock %}
+"""
 
-        {% if user %}
-          {% if user_role == 'admin' %}
-            <a class="pill" href="{{ url_for('admin_panel') }}">🛡 {{ tr(lang,'admin') }}</a>
-          {% endif %}
-          <a class="pill" href="{{ url_for('logout') }}">↩ {{ tr(lang,'logout') }}</a>
-        {% else %}
-          <a class="pill" href="{{ url_for('login') }}">🔐 {{ tr(lang,'login') }}</a>
-        {% endif %}
+TEMPLATES["quran_search.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">{{ tr(lang,'quran_search') }}</h2>
+  <form method="get" class="row">
+    <input name="q" value="{{ q }}" placeholder="{{ tr(lang,'search_placeholder') }}">
+    <select name="api_lang">
+      {{ m.option('de', 'DE', api_lang == 'de') }}
+      {{ m.option('en', 'EN', api_lang == 'en') }}
+      {{ m.option('ar', 'AR', api_lang == 'ar') }}
+    </select>
+    <button class="btn" type="submit">{{ tr(lang,'search') }}</button>
+  </form>
+</div>
+{%- if err %}
+<div class='card danger'><b>{{ tr(lang,'error') }}:</b> {{ err }}</div>
+{%- endif %}
+{%- if q and not err %}
+  {%- for verse_key, text in candidates %}
+  {{ m.verse_card(verse_key, text, m.star_button(verse_key, verse_key in favs, url_for('quran_search', q=q, api_lang=api_lang, page=page), uid, lang)) }}
+  {%- else %}
+  <div class='card muted'>{{ tr(lang,'no_results') }}</div>
+  {%- endfor %}
+  {%- if candidates %}
+  <div class='card row'>
+    {%- if page > 1 %}<a class='pill' href='{{ url_for('quran_search', q=q, api_lang=api_lang, page=page - 1) }}'>← {{ tr(lang,'prev') }}</a>{% endif %}
+    <span class='muted'>{{ total }} {{ tr(lang,'results') }} • {{ page }}/{{ pages }}</span>
+    {%- if page < pages %}<a class='pill' href='{{ url_for('quran_search', q=q, api_lang=api_lang, page=page + 1) }}'>{{ tr(lang,'next') }} →</a>{% endif %}
+  </div>
+  {%- endif %}
+{%- endif %}
+{% endblock %}
+"""
+
+TEMPLATES["favorites.html"] = r"""
+{% extends "base.html" %}
+{% block body %}
+{%- if not rows %}
+<div class='card'><h2>⭐ {{ tr(lang,'favorites') }}</h2><p class='muted'>{{ tr(lang,'no_favorites') }}</p></div>
+{%- else %}
+<div class='card'><h2 style='margin-top:0;'>⭐ {{ tr(lang,'favorites') }}</h2><p class='muted'>{{ tr(lang,'favorites_tip') }}</p></div>
+{%- for r in rows %}
+<div class="card">
+  <div class="row" style="justify-content:space-between;">
+    <b>{{ r['verse_key'] }}</b>
+    <form method="post" action="{{ url_for('favorite_toggle') }}" style="margin:0;">
+      <input type="hidden" name="verse_key" value="{{ r['verse_key'] }}">
+      <input type="hidden" name="return_to" value="{{ url_for('favorites') }}">
+      <button class="btn" type="submit">⭐ {{ tr(lang,'remove') }}</button>
+    </form>
+  </div>
+  <div class="muted small" style="margin-top:8px;">{{ tr(lang,'added') }}: {{ r['added_at'] }}</div>
+</div>
+{%- endfor %}
+{%- endif %}
+{% endblock %}
+"""
+
+TEMPLATES["settings.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">⚙ {{ tr(lang,'settings') }}</h2>
+  <form method="post" action="{{ url_for('settings_save') }}">
+    <div class="row">
+      <label class="muted">{{ tr(lang,'language') }}</label>
+      <select name="lang">
+        {%- for code, name in langs %}{{ m.option(code, name, code == s['lang']) }}{% endfor -%}
+      </select>
+    </div>
+
+    <div style="margin-top:10px;">
+      <div class="muted">“Sprachen: BS DE EN TR AR FR IT ES … / City Suche tippen”</div>
+      <input id="citySearch" placeholder="{{ tr(lang,'pick_city') }}…" autocomplete="off" style="width:100%; margin-top:10px;">
+      <div id="cityResults" class="listbox" style="display:none;"></div>
+      <input type="hidden" name="city" id="cityValue" value="{{ s['city'] }}">
+      <input type="hidden" name="country" id="countryValue" value="{{ s['country'] }}">
+      <div class="muted small" style="margin-top:10px;">{{ tr(lang,'city') }}: <b id="pickedCity">{{ s['city'] }}</b> • {{ tr(lang,'country') }}: <b id="pickedCountry">{{ s['country'] }}</b></div>
+    </div>
+
+    <div class="row" style="margin-top:12px;">
+      <div>
+        <div class="muted small">{{ tr(lang,'method') }}</div>
+        <select name="method">
+          {{ m.option('3', '3 - Muslim World League', s['method'] == '3') }}
+          {{ m.option('5', '5 - Egypt', s['method'] == '5') }}
+          {{ m.option('13', '13 - Kuwait', s['method'] == '13') }}
+          {{ m.option('2', '2 - ISNA', s['method'] == '2') }}
+          {{ m.option('4', '4 - Umm al-Qura', s['method'] == '4') }}
+        </select>
       </div>
 
-      <div class="links" id="navLinks">
-        <a class="pill" href="{{ url_for('home') }}">{{ tr(lang,'home') }}</a>
-        <a class="pill" href="{{ url_for('prayer_times') }}">{{ tr(lang,'prayer_times') }}</a>
-        <a class="pill" href="{{ url_for('quran') }}">{{ tr(lang,'quran') }}</a>
-        <a class="pill" href="{{ url_for('quran_search') }}">🔎 {{ tr(lang,'search') }}</a>
-        <a class="pill" href="{{ url_for('tracker') }}">{{ tr(lang,'tracker') }}</a>
-        <a class="pill" href="{{ url_for('favorites') }}">{{ tr(lang,'favorites') }}</a>
+      <div>
+        <div class="muted small">{{ tr(lang,'theme') }}</div>
+        <select name="theme">
+          {%- for t in ('auto', 'dark', 'light') %}{{ m.option(t, tr(lang, t), s['theme'] == t) }}{% endfor -%}
+        </select>
       </div>
     </div>
+
+    <div style="margin-top:14px;" class="row">
+      <button class="btn" type="submit">✅ {{ tr(lang,'save') }}</button>
+      <a class="pill" href="{{ url_for('home') }}">← {{ tr(lang,'home') }}</a>
+    </div>
+  </form>
+</div>
+
+<script>
+  const input = document.getElementById("citySearch");
+  const box = document.getElementById("cityResults");
+  const cityValue = document.getElementById("cityValue");
+  const countryValue = document.getElementById("countryValue");
+  const pickedCity = document.getElementById("pickedCity");
+  const pickedCountry = document.getElementById("pickedCountry");
+  let timer = null;
+
+  function hideBox() { box.style.display="none"; box.innerHTML=""; }
+  function showResults(items) {
+    if (!items || items.length===0) { hideBox(); return; }
+    box.innerHTML="";
+    items.forEach(it=>{
+      const b=document.createElement("button");
+      b.type="button";
+      b.textContent=it.label;
+      b.addEventListener("click", ()=>{
+        cityValue.value=it.city;
+        countryValue.value=it.country;
+        pickedCity.textContent=it.city;
+        pickedCountry.textContent=it.country;
+        input.value=it.city + ", " + it.country;
+        hideBox();
+      });
+      box.appendChild(b);
+    });
+    box.style.display="block";
+  }
+  async function doSearch(q){
+    const res=await fetch("/api/city_search?q="+encodeURIComponent(q));
+    const data=await res.json();
+    showResults(data.results||[]);
+  }
+  input.addEventListener("input", ()=>{
+    const q=input.value.trim();
+    if (timer) clearTimeout(timer);
+    if (q.length<2){ hideBox(); return; }
+    timer=setTimeout(()=>doSearch(q), 350);
+  });
+  document.addEventListener("click",(e)=>{
+    if (!box.contains(e.target) && e.target!==input) hideBox();
+  });
+</script>
+{% endblock %}
+"""
+
+TEMPLATES["admin.html"] = r"""
+{% extends "base.html" %}
+{% import "_macros.html" as m %}
+{% block body %}
+<div class="card">
+  <h2 style="margin-top:0;">🛡 {{ tr(lang,'admin_panel') }}</h2>
+
+  <div class="card">
+    <h3 style="margin-top:0;">⚙ {{ tr(lang,'site_settings') }}</h3>
+    <form method="post" action="{{ url_for('admin_site_settings') }}">
+      <div class="row">
+        <label class="muted small">{{ tr(lang,'allow_register') }}</label>
+        <select name="allow_register">
+          {{ m.option('1', tr(lang,'yes'), allow_register == '1') }}
+          {{ m.option('0', tr(lang,'no'), allow_register == '0') }}
+        </select>
+      </div>
+
+      <div class="row" style="margin-top:10px;">
+        <label class="muted small">{{ tr(lang,'invite_codes') }}</label>
+        <input name="invite_codes" value="{{ invite_codes }}" placeholder="code1, code2, code3" style="width:100%;">
+      </div>
+
+      <div class="row" style="margin-top:12px;">
+        <button class="btn" type="submit">{{ tr(lang,'update') }}</button>
+      </div>
+      <div class="muted small" style="margin-top:10px;">Beispiel: <b>i3mad2026, bosna, vip2026</b></div>
+    </form>
   </div>
 
-  <div class="wrap">
-    {{ body|safe }}
+  <div class="card">
+    <h3 style="margin-top:0;">🔐 {{ tr(lang,'change_admin_pass') }}</h3>
+    <form method="post" action="{{ url_for('admin_change_password') }}">
+      <div class="row">
+        <input name="new_password" type="password" placeholder="{{ tr(lang,'new_password') }}" required>
+        <button class="btn" type="submit">{{ tr(lang,'update') }}</button>
+      </div>
+      <div class="muted small" style="margin-top:10px;">Bitte ändere sofort das Startpasswort <b>123456</b>.</div>
+    </form>
   </div>
 
-  <script>
-    (function () {
-      const root = document.documentElement;
-      function updateThemeIcon() {
-        const btn = document.getElementById("themeBtn");
-        if (!btn) return;
-        const t = root.getAttribute("data-theme") || "dark";
-        btn.textContent = (t === "light") ? "☀️" : "🌙";
-      }
-      function setTheme(theme) {
-        root.setAttribute("data-theme", theme);
-        localStorage.setItem("theme", theme);
-        updateThemeIcon();
-      }
-      function initTheme() {
-        const serverTheme = root.getAttribute("data-theme-server") || "auto";
-        const stored = localStorage.getItem("theme");
-        if (stored) root.setAttribute("data-theme", stored);
-        else if (serverTheme === "auto") {
-          const prefersLight = window.matchMedia && window.matchMedia("(prefers-color-scheme: light)").matches;
-          root.setAttribute("data-theme", prefersLight ? "light" : "dark");
-        } else root.setAttribute("data-theme", serverTheme);
-        updateThemeIcon();
-        const btn = document.getElementById("themeBtn");
-        if (btn) btn.addEventListener("click", function () {
-          const current = root.getAttribute("data-theme") || "dark";
-          setTheme(current === "light" ? "dark" : "light");
-        });
-      }
-      function initMenu() {
-        const menuBtn = document.getElementById("menuBtn");
-        const navLinks = document.getElementById("navLinks");
-        if (menuBtn && navLinks) menuBtn.addEventListener("click", () => navLinks.classList.toggle("open"));
-      }
-      document.addEventListener("DOMContentLoaded", () => { initTheme(); initMenu(); });
-    })();
-  </script>
-</body>
-</html>
+  <div class="card">
+    <h3 style="margin-top:0;">🌐 Upstream</h3>
+    <table>
+      <tr><th>Host</th><th>Requests</th><th>Errors</th><th>Rejected</th><th>Ø ms</th><th>Max ms</th><th>Circuit</th></tr>
+      {%- for host, st in upstream_stats %}
+      <tr><td>{{ host }}</td><td>{{ st['requests']|int }}</td><td>{{ st['errors']|int }}</td><td>{{ st['rejected']|int }}</td><td>{{ '%.0f'|format(st['latency_avg'] * 1000) }}</td><td>{{ '%.0f'|format(st['latency_max'] * 1000) }}</td><td>{{ st['circuit'] }}</td></tr>
+      {%- else %}
+      <tr><td colspan='7' class='muted'>—</td></tr>
+      {%- endfor %}
+    </table>
+  </div>
+
+  {%- if sql_top %}
+  <div class="card">
+    <h3 style="margin-top:0;">🗄 SQL (Top {{ sql_top.top|length }})</h3>
+    <table>
+      <tr><th>SQL</th><th>Calls</th><th>Σ ms</th><th>Ø ms</th></tr>
+      {%- for r in sql_top.top %}
+      <tr><td class="small"><code>{{ r.sql }}</code></td><td>{{ r.calls }}</td><td>{{ '%.0f'|format(r.total_ms) }}</td><td>{{ '%.2f'|format(r.avg_ms) }}</td></tr>
+      {%- else %}
+      <tr><td colspan='4' class='muted'>—</td></tr>
+      {%- endfor %}
+    </table>
+    {%- if sql_top.nplus1 %}
+    <h4>N+1</h4>
+    <table>
+      <tr><th>Route</th><th>SQL</th><th>Requests</th></tr>
+      {%- for r in sql_top.nplus1 %}
+      <tr><td>{{ r.route }}</td><td class="small"><code>{{ r.sql }}</code></td><td>{{ r.requests }}</td></tr>
+      {%- endfor %}
+    </table>
+    {%- endif %}
+  </div>
+  {%- endif %}
+
+  <div class="card">
+    <h3 style="margin-top:0;">⏱ Prefetch</h3>
+    <table>
+      <tr><th>{{ tr(lang,'city') }}</th><th>Method</th><th>{{ tr(lang,'timezone') }}</th><th>Day</th><th>OK</th><th>Fails</th><th>Error</th></tr>
+      {%- for r in prefetch %}
+      <tr><td>{{ r['city'] }}, {{ r['country'] }}</td><td>{{ r['method'] }}</td><td>{{ r['tz'] or '—' }}</td><td>{{ r['last_day'] or '—' }}</td>
+        <td class="small">{{ r['last_ok_at']|datetime if r['last_ok_at'] else '—' }}</td><td>{{ r['fails'] }}</td><td class="small">{{ r['last_error'] or '' }}</td></tr>
+      {%- else %}
+      <tr><td colspan='7' class='muted'>—</td></tr>
+      {%- endfor %}
+    </table>
+  </div>
+
+  <h3>👤 {{ tr(lang,'users') }}</h3>
+  <table>
+    <tr>
+      <th>{{ tr(lang,'username') }}</th>
+      <th>{{ tr(lang,'role') }}</th>
+      <th>{{ tr(lang,'status') }}</th>
+      <th>{{ tr(lang,'created') }}</th>
+      <th>Actions</th>
+    </tr>
+    {%- for x in users %}
+    <tr>
+      <td><b>{{ x['username'] }}</b></td>
+      <td>{{ x['role'] }}</td>
+      <td>{{ tr(lang,'blocked') if x['is_blocked'] == 1 else tr(lang,'active') }}</td>
+      <td class="small">{{ x['created_at'] }}</td>
+      <td>
+        {%- if x['username'] == admin_username %}<span class='muted small'>—</span>
+        {%- else %}
+          {%- if x['is_blocked'] == 1 %}<a class='pill' href='{{ url_for('admin_unblock', user_id=x['id']) }}'>{{ tr(lang,'unblock') }}</a>
+          {%- else %}<a class='pill' href='{{ url_for('admin_block', user_id=x['id']) }}'>{{ tr(lang,'block') }}</a>{% endif %}
+          {% if x['role'] == 'admin' %}<a class='pill' href='{{ url_for('admin_make_user', user_id=x['id']) }}'>{{ tr(lang,'make_user') }}</a>
+          {%- else %}<a class='pill' href='{{ url_for('admin_make_admin', user_id=x['id']) }}'>{{ tr(lang,'make_admin') }}</a>{% endif %}
+        {%- endif -%}
+      </td>
+    </tr>
+    {%- endfor %}
+  </table>
+</div>
+{% endblock %}
 """
 
-def render_page(title: str, body_html: str):
+# Templates einmal beim Start parsen & kompilieren, nicht pro Request
+APP.jinja_loader = DictLoader(TEMPLATES)
+APP.jinja_env.globals.update(tr=tr, PRAYERS=PRAYERS, asset_url=asset_url)
+APP.jinja_env.filters["datetime"] = lambda ts: datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+for _name in TEMPLATES:
+    APP.jinja_env.get_template(_name)
+
+
+def render_view(template: str, title: str, stream: bool = False, **ctx):
     u = current_user()
     uid = u["id"] if u else None
     s = get_user_settings(uid)
-    lang = s.get("lang", "en")
-    theme = s.get("theme", "auto")
-    return render_template_string(
-        BASE,
+    ctx.update(
         title=title,
-        body=body_html,
-        lang=lang,
-        theme=theme,
-        tr=tr,
+        lang=s.get("lang", "en"),
+        theme=s.get("theme", "auto"),
         user=(u is not None),
         user_role=(u["role"] if u else "user"),
-        url_for=url_for,
+        uid=uid,
     )
+    tpl = APP.jinja_env.get_template(template)
+    if stream:
+        # chunked: der Browser bekommt den Kopf & die ersten Verse, bevor der Rest gerendert ist
+        chunks = tpl.stream(**ctx)
+        chunks.enable_buffering(8)
+        return Response(stream_with_context(_timed_stream(chunks)), mimetype="text/html")
+    with metrics.span("render"):
+        return tpl.render(**ctx)
+
+
+def _timed_stream(chunks):
+    with metrics.span("render"):
+        yield from chunks
+
+
+def render_page(title: str, body_html: str):
+    return render_view("base.html", title, body=body_html)
 
 USERNAME_RE = re.compile(r"^[a-zA-Z0-9._-]{3,24}$")
 def valid_username(u: str) -> bool:
@@ -855,23 +3488,7 @@ def login():
     lang = s["lang"]
     next_url = request.args.get("next") or url_for("home")
 
-    body = f"""
-    <div class="card col-6">
-      <h2 style="margin-top:0;">🔐 {tr(lang,'login')}</h2>
-      <form method="post" action="{url_for('login_post')}">
-        <div class="row"><input name="username" placeholder="{tr(lang,'username')}" required></div>
-        <div class="row" style="margin-top:10px;"><input name="password" type="password" placeholder="{tr(lang,'password')}" required></div>
-        <input type="hidden" name="next" value="{next_url}">
-        <input type="hidden" name="ts" id="tsLogin" value="">
-        <div class="row" style="margin-top:12px;">
-          <button class="btn" type="submit">{tr(lang,'login')}</button>
-          <a class="pill" href="{url_for('register')}">{tr(lang,'register')}</a>
-        </div>
-      </form>
-    </div>
-    <script>document.getElementById('tsLogin').value = String(Date.now());</script>
-    """
-    return render_page(tr(lang, "login"), body)
+    return render_view("login.html", tr(lang, "login"), next_url=next_url)
 
 
 @APP.post("/login")
@@ -899,20 +3516,19 @@ def login_post():
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE username=?", (username,))
     u = cur.fetchone()
-    conn.close()
 
     if not u or not check_password_hash(u["password_hash"], password) or u["is_blocked"] == 1:
         lockout_fail(username)
         return render_page(tr(lang, "login"), f"<div class='card danger'><b>{tr(lang,'invalid_login')}</b></div>")
 
     lockout_success(username)
-    session["user_id"] = u["id"]
+    set_session_user(u["id"])
     return redirect(next_url)
 
 
 @APP.get("/logout")
 def logout():
-    session.pop("user_id", None)
+    set_session_user(None)
     return redirect(url_for("home"))
 
 
@@ -924,31 +3540,7 @@ def register():
     if not allow:
         return render_page(tr(lang, "register"), f"<div class='card danger'><b>{tr(lang,'register_disabled')}</b></div>")
 
-    body = f"""
-    <div class="card col-6">
-      <h2 style="margin-top:0;">🆕 {tr(lang,'register')}</h2>
-      <form method="post" action="{url_for('register_post')}">
-        <div class="row"><input name="username" placeholder="{tr(lang,'username')}" required></div>
-        <div class="row" style="margin-top:10px;"><input name="password" type="password" placeholder="{tr(lang,'password')} (min 8)" required></div>
-        <div class="row" style="margin-top:10px;"><input name="password2" type="password" placeholder="{tr(lang,'password2')}" required></div>
-        <div class="row" style="margin-top:10px;"><input name="invite_code" placeholder="{tr(lang,'invite_code')}" required></div>
-
-        <div class="hiddenhp">
-          <label>Website</label>
-          <input name="website" value="">
-        </div>
-
-        <input type="hidden" name="ts" id="tsReg" value="">
-        <div class="row" style="margin-top:12px;">
-          <button class="btn" type="submit">{tr(lang,'register')}</button>
-          <a class="pill" href="{url_for('login')}">{tr(lang,'login')}</a>
-        </div>
-      </form>
-      <div class="muted small" style="margin-top:10px;">Invite nötig (Admin kann Codes ändern).</div>
-    </div>
-    <script>document.getElementById('tsReg').value = String(Date.now());</script>
-    """
-    return render_page(tr(lang, "register"), body)
+    return render_view("register.html", tr(lang, "register"))
 
 
 @APP.post("/register")
@@ -993,7 +3585,6 @@ def register_post():
     cur = conn.cursor()
     cur.execute("SELECT 1 FROM users WHERE username=?", (username,))
     if cur.fetchone() is not None:
-        conn.close()
         return render_page(tr(lang, "register"), f"<div class='card danger'><b>{tr(lang,'username_taken')}</b></div>")
 
     cur.execute(
@@ -1004,9 +3595,8 @@ def register_post():
     for k, v in DEFAULT_USER_SETTINGS.items():
         cur.execute("INSERT INTO user_settings(user_id,k,v) VALUES(?,?,?)", (uid, k, v))
     conn.commit()
-    conn.close()
 
-    session["user_id"] = uid
+    set_session_user(uid)
     return redirect(url_for("home"))
 
 
@@ -1018,105 +3608,39 @@ def home():
     lang = s["lang"]
     city, country, method = s["city"], s["country"], s["method"]
 
-    err = None
-    timings = {}
-    tz_name = ""
-    next_name = None
-    next_iso = None
-    try:
-        timings, tz_name, next_name, next_iso = compute_next_prayer(city, country, method)
-    except Exception as e:
-        err = str(e)
+    deadline = time.monotonic() + PAGE_DEADLINE
+    pending = fan_out({
+        "prayer": (compute_next_prayer, city, country, method),
+    })
 
-    vod = verse_of_day(lang)
     done_today = set()
     streak = 0
     if uid:
         done_today = done_today_set(uid)
         streak = compute_streak(uid)
 
-    if err or not next_iso:
-        return render_page(tr(lang, "home"),
-                           f"<div class='card'><b>{tr(lang,'error_prayer_load')}:</b> {err}<br><a class='pill' href='{url_for('settings')}'>⚙ {tr(lang,'settings')}</a></div>")
-
-    pills = "".join([f"<span class='badge'>{p}: <b>{timings.get(p,'-')}</b></span>" for p in PRAYERS])
-    done_count = len(done_today)
-    progress_bar = int((done_count / 5) * 100) if uid else 0
-
-    if uid:
-        mark_html = "".join([f"""
-          <form method="post" action="{url_for('track_done')}" style="margin:0;">
-            <input type="hidden" name="prayer" value="{p}">
-            <button class="btn" type="submit">{'✅' if p in done_today else '⬜'} {p}</button>
-          </form>
-        """ for p in PRAYERS])
-    else:
-        mark_html = f"<div class='muted'>{tr(lang,'auth_required')} <a class='pill' href='{url_for('login')}'>{tr(lang,'login')}</a></div>"
-
-    body = f"""
-    <div class="grid">
-      <div class="card col-8">
-        <div class="row" style="justify-content:space-between;">
-          <div>
-            <div class="muted">{tr(lang,'next_prayer')}</div>
-            <div class="big"><span class="ok">{next_name}</span></div>
-            <div class="muted">{city}, {country} • {tr(lang,'timezone')}: <b>{tz_name}</b></div>
-          </div>
-          <div class="badge" style="font-size:18px;">
-            {tr(lang,'remaining')}: <b id="countdown">...</b>
-          </div>
-        </div>
-        <div style="margin-top:12px; display:flex; gap:10px; flex-wrap:wrap;">{pills}</div>
-        <div style="margin-top:14px;" class="row">
-          <a class="pill" href="{url_for('prayer_times')}">{tr(lang,'prayer_times')}</a>
-          <a class="pill" href="{url_for('settings')}">⚙ {tr(lang,'settings')}</a>
-        </div>
-      </div>
-
-      <div class="card col-4">
-        <div class="muted">{tr(lang,'progress_today')}</div>
-        <div class="big">{(str(done_count)+'/5') if uid else '—'}</div>
-        <div class="muted small">{tr(lang,'today')}: {date.today().isoformat()}</div>
-        <div style="margin-top:10px; border:1px solid var(--border); border-radius:12px; overflow:hidden;">
-          <div style="height:10px; width:{progress_bar}%; background: color-mix(in srgb, var(--ok) 65%, transparent);"></div>
-        </div>
-        <div style="margin-top:12px;">
-          <div class="muted small">{tr(lang,'streak')}</div>
-          <div class="big">{streak if uid else '—'}</div>
-          <div class="muted small">{tr(lang,'streak_desc')}</div>
-        </div>
-      </div>
-
-      <div class="card col-6">
-        <h3 style="margin-top:0;">{tr(lang,'mark_done')}</h3>
-        <div class="row">{mark_html}</div>
-      </div>
-
-      <div class="card col-6">
-        <h3 style="margin-top:0;">{tr(lang,'verse_of_day')}</h3>
-        <div class="muted small">{vod.get('ref','-')}</div>
-        <div style="margin-top:10px; font-size:18px;">{vod.get('ar','')}</div>
-        <div class="muted" style="margin-top:10px;">{vod.get('tr','')}</div>
-      </div>
-    </div>
+    # was die Deadline verpasst oder fehlschlägt, wird zum Platzhalter; der Rest der Seite bleibt
+    results = collect(pending, deadline)
+    timings = {}
+    tz_name = ""
+    next_name = None
+    next_iso = None
+    prayer, err = results["prayer"]
+    if not err:
+        timings, tz_name, next_name, next_iso = prayer
+        if not next_iso:
+            err = ValueError("no prayer times")
+    # nur Speicher/lokaler Store, dafür lohnt kein Pool-Thread
+    vod = verse_of_day(lang)
 
-    <script>
-      const target = new Date("{next_iso}");
-      function tick() {{
-        const now = new Date();
-        let diff = Math.floor((target - now) / 1000);
-        if (diff < 0) diff = 0;
-        const h = Math.floor(diff / 3600);
-        const m = Math.floor((diff % 3600) / 60);
-        const s = diff % 60;
-        const txt = (h>0 ? h + "h " : "") + String(m).padStart(2,"0") + "m " + String(s).padStart(2,"0") + "s";
-        const el = document.getElementById("countdown");
-        if (el) el.textContent = txt;
-      }}
-      tick(); setInterval(tick, 1000);
-    </script>
-    """
-    return render_page(tr(lang, "home"), body)
+    return render_view(
+        "home.html", tr(lang, "home"),
+        city=city, country=country, tz_name=tz_name, timings=timings,
+        next_name=next_name, next_iso=next_iso, prayer_err=str(err) if err else None,
+        done_today=done_today, streak=streak, today=date.today().isoformat(),
+        progress_bar=int((len(done_today) / 5) * 100) if uid else 0,
+        vod=vod,
+    )
 
 
 @APP.get("/gebetszeiten")
@@ -1136,22 +3660,67 @@ def prayer_times():
 
     if err or not timings:
         return render_page(tr(lang, "prayer_times"),
-                           f"<div class='card'><b>{tr(lang,'error_prayer_load')}:</b> {err} <br><a class='pill' href='{url_for('settings')}'>⚙ {tr(lang,'settings')}</a></div>")
-
-    rows = "".join([f"<tr><td>{p}</td><td><b>{timings.get(p,'-')}</b></td></tr>" for p in PRAYERS])
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">{tr(lang,'prayer_times')}</h2>
-      <div class="muted">{city}, {country} • {tr(lang,'timezone')}: <b>{tz}</b> • {tr(lang,'method')}: <b>{method}</b></div>
-      <div style="margin-top:10px;">
-        <table>
-          <tr><th>Prayer</th><th>{tr(lang,'time')}</th></tr>
-          {rows}
-        </table>
-      </div>
-    </div>
-    """
-    return render_page(tr(lang, "prayer_times"), body)
+                           f"<div class='card'><b>{tr(lang,'error_prayer_load')}:</b> {escape(str(err))} <br><a class='pill' href='{url_for('settings')}'>⚙ {tr(lang,'settings')}</a></div>")
+
+    return render_view("prayer_times.html", tr(lang, "prayer_times"),
+                       city=city, country=country, method=method, timings=timings, tz=tz)
+
+
+MONTH_RE = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+def _parse_month(value: Optional[str]) -> tuple[int, int]:
+    m = MONTH_RE.match((value or "").strip())
+    if m and 1 <= int(m.group(2)) <= 12 and 1900 <= int(m.group(1)) <= 2200:
+        return int(m.group(1)), int(m.group(2))
+    today = date.today()
+    return today.year, today.month
+
+
+@APP.get("/gebetszeiten/monat")
+def prayer_times_month():
+    u = current_user()
+    uid = u["id"] if u else None
+    s = get_user_settings(uid)
+    lang = s["lang"]
+    city, country, method = s["city"], s["country"], s["method"]
+    year, month = _parse_month(request.args.get("m"))
+    try:
+        days, tz = prayer_month(city, country, method, year, month)
+    except Exception as e:
+        return render_page(tr(lang, "prayer_times"),
+                           f"<div class='card'><b>{tr(lang,'error_prayer_load')}:</b> {escape(str(e))} <br><a class='pill' href='{url_for('settings')}'>⚙ {tr(lang,'settings')}</a></div>")
+
+    prev_ym, next_ym = (f"{y:04d}-{m:02d}" for y, m in (_month_add(year, month, -1), _month_add(year, month, 1)))
+    return render_view("prayer_month.html", tr(lang, "month_view"),
+                       city=city, country=country, method=method, tz=tz, days=days, today=today_str(),
+                       ym=f"{year:04d}-{month:02d}", prev_ym=prev_ym, next_ym=next_ym)
+
+
+@APP.get("/gebetszeiten/kalender.ics")
+@rate_limit("calendar_export")
+def prayer_times_ics():
+    # ?from=YYYY-MM&months=N (max. ICS_MAX_MONTHS); der erste Monat wird vorab geladen,
+    # damit ein Fehler noch als Status zurückgeht statt als abgebrochene Datei
+    u = current_user()
+    s = get_user_settings(u["id"] if u else None)
+    city, country, method = s["city"], s["country"], s["method"]
+    year, month = _parse_month(request.args.get("from"))
+    try:
+        months = min(max(int(request.args.get("months", "1")), 1), ICS_MAX_MONTHS)
+    except ValueError:
+        months = 1
+    try:
+        first = prayer_month(city, country, method, year, month)
+    except Exception as e:
+        return Response(f"{e}\n", status=503, mimetype="text/plain")
+
+    slug = re.sub(r"[^a-z0-9]+", "-", fold(city)).strip("-") or "city"
+    return Response(
+        stream_with_context(ics_stream(city, country, method, year, month, months, first)),
+        mimetype="text/calendar",
+        headers={"Content-Disposition": f'attachment; filename="prayer-times-{slug}-{year:04d}-{month:02d}.ics"'},
+    )
 
 
 @APP.post("/tracker/done")
@@ -1167,12 +3736,15 @@ def track_done():
 
     conn = db()
     cur = conn.cursor()
+    day = today_str()
     cur.execute(
-        "INSERT INTO prayers(user_id, day, city, country, prayer, done_at) VALUES(?,?,?,?,?,?)",
-        (uid, today_str(), s["city"], s["country"], prayer, datetime.now().strftime("%H:%M:%S")),
+        "INSERT OR IGNORE INTO prayers(user_id, day, city, country, prayer, done_at) VALUES(?,?,?,?,?,?)",
+        (uid, day, s["city"], s["country"], prayer, datetime.now().strftime("%H:%M:%S")),
     )
+    if cur.rowcount == 1:
+        record_prayer_day(cur, uid, day, prayer)
+        bump_data_version(cur, uid)
     conn.commit()
-    conn.close()
     return redirect(url_for("home"))
 
 
@@ -1184,49 +3756,14 @@ def tracker():
     s = get_user_settings(uid)
     lang = s["lang"]
 
+    done_today = done_today_set(uid)
     conn = db()
     cur = conn.cursor()
-    cur.execute("SELECT prayer FROM prayers WHERE user_id=? AND day=? GROUP BY prayer", (uid, today_str()))
-    done_today = {row["prayer"] for row in cur.fetchall()}
     cur.execute("SELECT day, prayer, city, done_at FROM prayers WHERE user_id=? ORDER BY id DESC LIMIT 20", (uid,))
     last = cur.fetchall()
-    conn.close()
-
-    streak = compute_streak(uid)
-    buttons_html = "".join([f"""
-        <form method="post" action="{url_for('track_done')}" style="display:inline-block; margin:6px;">
-          <input type="hidden" name="prayer" value="{p}">
-          <button class="btn" type="submit">{'✅' if p in done_today else '⬜'} {p}</button>
-        </form>
-    """ for p in PRAYERS])
-
-    last_rows = "".join([f"<tr><td>{r['day']}</td><td><b>{r['prayer']}</b></td><td>{r['city']}</td><td>{r['done_at']}</td></tr>" for r in last]) \
-        or f"<tr><td colspan='4' class='muted'>{tr(lang,'no_entries')}</td></tr>"
-
-    body = f"""
-    <div class="grid">
-      <div class="card col-4">
-        <div class="muted">{tr(lang,'streak')}</div>
-        <div class="big">{streak}</div>
-        <div class="muted small">{tr(lang,'streak_desc')}</div>
-      </div>
-
-      <div class="card col-8">
-        <h2 style="margin-top:0;">{tr(lang,'tracker')} · <span class="muted">{today_str()}</span></h2>
-        <div class="muted">{tr(lang,'mark_done')}:</div>
-        <div style="margin-top:6px;">{buttons_html}</div>
-      </div>
 
-      <div class="card col-12">
-        <h3 style="margin-top:0;">{tr(lang,'last_entries')}</h3>
-        <table>
-          <tr><th>{tr(lang,'date')}</th><th>Prayer</th><th>{tr(lang,'city')}</th><th>{tr(lang,'time')}</th></tr>
-          {last_rows}
-        </table>
-      </div>
-    </div>
-    """
-    return render_page(tr(lang, "tracker"), body)
+    return render_view("tracker.html", tr(lang, "tracker"),
+                       streak=compute_streak(uid), done_today=done_today, last=last, today=today_str())
 
 
 @APP.get("/quran")
@@ -1239,32 +3776,14 @@ def quran():
     err = None
     surahs = []
     try:
-        r = requests.get("https://api.alquran.cloud/v1/surah", timeout=15)
-        r.raise_for_status()
-        surahs = r.json()["data"]
+        surahs = quran_surah_list()
     except Exception as e:
         err = str(e)
 
     if err:
-        return render_page(tr(lang, "quran"), f"<div class='card danger'><b>{tr(lang,'error')}:</b> {err}</div>")
-
-    items = "".join([
-        f"<li style='margin:6px 0;'><a class='pill' href='{url_for('quran_surah', number=su['number'])}'>"
-        f"{tr(lang,'surah')} {su['number']}: {su['englishName']} ({su['name']})</a></li>"
-        for su in surahs
-    ])
+        return render_page(tr(lang, "quran"), f"<div class='card danger'><b>{tr(lang,'error')}:</b> {escape(err)}</div>")
 
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">{tr(lang,'quran')} – {tr(lang,'surahs')}</h2>
-      <div class="row">
-        <a class="pill" href="{url_for('quran_search')}">🔎 {tr(lang,'search')}</a>
-        {"<a class='pill' href='"+url_for('favorites')+"'>⭐ "+tr(lang,'favorites')+"</a>" if uid else ""}
-      </div>
-      <ol style="padding-left:18px; margin-top:12px;">{items}</ol>
-    </div>
-    """
-    return render_page(tr(lang, "quran"), body)
+    return render_view("quran.html", tr(lang, "quran"), surahs=surahs)
 
 
 @APP.get("/quran/<int:number>")
@@ -1274,58 +3793,36 @@ def quran_surah(number: int):
     s = get_user_settings(uid)
     lang = s["lang"]
 
-    edition = request.args.get("edition", "quran-uthmani")
-    url = f"https://api.alquran.cloud/v1/surah/{number}/{edition}"
+    # ?edition= Hauptspalte (Standard Arabisch), ?tr=a,b Übersetzungen daneben (leer = keine)
+    edition = request.args.get("edition", QURAN_ARABIC)
+    tr_param = request.args.get("tr")
+    if tr_param is None:
+        translations = [translation_edition(lang)]
+    else:
+        translations = [e.strip() for e in tr_param.split(",") if e.strip()]
+    editions = list(dict.fromkeys([edition] + translations))[:SURAH_MAX_EDITIONS]
+    start = request.args.get("from", 1, type=int)
+    count = max(request.args.get("count", SURAH_PAGE_SIZE, type=int), 1)
 
     try:
-        r = requests.get(url, timeout=20)
-        r.raise_for_status()
-        surah = r.json()["data"]
+        surah = quran_surah_editions(number, editions, start, count)
     except Exception as e:
-        return render_page("Surah", f"<div class='card danger'><b>{tr(lang,'error')}:</b> {e}</div>")
-
-    favs = get_favorites_set(uid) if uid else set()
-    ayahs_html = ""
-    for a in surah["ayahs"][:60]:
-        verse_key = f"{number}:{a['numberInSurah']}"
-        star = "⭐" if verse_key in favs else "☆"
-        if uid:
-            star_btn = f"""
-              <form method="post" action="{url_for('favorite_toggle')}" style="margin:0;">
-                <input type="hidden" name="verse_key" value="{verse_key}">
-                <input type="hidden" name="return_to" value="{url_for('quran_surah', number=number, edition=edition)}">
-                <button class="btn" type="submit">{star}</button>
-              </form>
-            """
-        else:
-            star_btn = f"<a class='pill' href='{url_for('login')}'>{tr(lang,'login')}</a>"
-
-        ayahs_html += f"""
-        <div class="card" style="margin:10px 0; padding:12px;">
-          <div class="row" style="justify-content:space-between;">
-            <div><b>{a['numberInSurah']}.</b></div>
-            {star_btn}
-          </div>
-          <div style="margin-top:8px; font-size:18px;">{a['text']}</div>
-        </div>
-        """
+        return render_page("Surah", f"<div class='card danger'><b>{tr(lang,'error')}:</b> {escape(str(e))}</div>")
 
-    tr_edition = "en.sahih" if lang != "de" else "de.aburida"
+    def surah_url(start: int, count: int = count) -> str:
+        args = {"from": start, "count": count, "edition": edition}
+        if tr_param is not None:
+            args["tr"] = tr_param
+        return url_for("quran_surah", number=number, **args)
 
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">{tr(lang,'surah')} {surah['number']}: {surah['englishName']} ({surah['name']})</h2>
-      <div class="row">
-        <a class="pill" href="{url_for('quran_surah', number=number, edition='quran-uthmani')}">{tr(lang,'arabic')}</a>
-        <a class="pill" href="{url_for('quran_surah', number=number, edition=tr_edition)}">{tr(lang,'translation')}</a>
-        <a class="pill" href="{url_for('quran_search')}">🔎 {tr(lang,'search')}</a>
-        <a class="pill" href="{url_for('quran')}">← {tr(lang,'back')}</a>
-      </div>
-      <div class="muted" style="margin-top:10px;">{tr(lang,'showing_first_60')}</div>
-    </div>
-    {ayahs_html}
-    """
-    return render_page("Surah", body)
+    favs = get_favorites_set(uid) if uid else set()
+    return render_view(
+        "quran_surah.html", "Surah",
+        stream=len(surah["ayahs"]) >= SURAH_STREAM_MIN,
+        surah=surah, favs=favs, count=count, surah_url=surah_url,
+        rtl={e for e in editions if edition_lang(e) == "ar"},
+        tr_edition=translation_edition(lang),
+    )
 
 
 @APP.get("/quran/suche")
@@ -1337,73 +3834,33 @@ def quran_search():
     q = (request.args.get("q") or "").strip()
     api_lang = (request.args.get("api_lang") or "en").strip().lower()
 
-    results_html = ""
+    try:
+        page = max(int(request.args.get("page") or 1), 1)
+    except ValueError:
+        page = 1
+    edition = QURAN_ARABIC if api_lang == "ar" else translation_edition(api_lang)
+
+    total = 0
+    candidates = []
+    favs = set()
     err = None
 
     if q:
         try:
-            url = "https://alquran-api.pages.dev/api/quran/search"
-            params = {"q": q, "lang": api_lang}
-            r = requests.get(url, params=params, timeout=20)
-            r.raise_for_status()
-            data = r.json()
-            candidates = data.get("results") or data.get("data") or data.get("verses") or []
-            if isinstance(candidates, dict):
-                candidates = candidates.get("results") or []
-
+            found = quran_search_local(q, edition, page)
+            if found is None:
+                page = 1
+                found = quran_search_remote(q, api_lang)
+            total, candidates = found
             favs = get_favorites_set(uid) if uid else set()
-            if not candidates:
-                results_html = f"<div class='card muted'>{tr(lang,'no_results')}</div>"
-            else:
-                blocks = []
-                for item in candidates[:25]:
-                    verse_key = item.get("verseKey") or item.get("verse_key") or item.get("key") or item.get("reference") or "?:?"
-                    text = item.get("text") or item.get("translation") or item.get("content") or ""
-                    text = re.sub(r"</?(?!em\b)[a-zA-Z][^>]*>", "", text or "")
-
-                    star = "⭐" if verse_key in favs else "☆"
-                    if uid:
-                        star_btn = f"""
-                        <form method="post" action="{url_for('favorite_toggle')}" style="margin:0;">
-                          <input type="hidden" name="verse_key" value="{verse_key}">
-                          <input type="hidden" name="return_to" value="{url_for('quran_search', q=q, api_lang=api_lang)}">
-                          <button class="btn" type="submit">{star}</button>
-                        </form>
-                        """
-                    else:
-                        star_btn = f"<a class='pill' href='{url_for('login')}'>{tr(lang,'login')}</a>"
-
-                    blocks.append(f"""
-                      <div class="card">
-                        <div class="row" style="justify-content:space-between;">
-                          <b>{verse_key}</b>
-                          {star_btn}
-                        </div>
-                        <div style="margin-top:10px;">{text}</div>
-                      </div>
-                    """)
-                results_html = "".join(blocks)
-
         except Exception as e:
             err = str(e)
 
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">{tr(lang,'quran_search')}</h2>
-      <form method="get" class="row">
-        <input name="q" value="{q}" placeholder="{tr(lang,'search_placeholder')}">
-        <select name="api_lang">
-          <option value="de" {"selected" if api_lang=="de" else ""}>DE</option>
-          <option value="en" {"selected" if api_lang=="en" else ""}>EN</option>
-          <option value="ar" {"selected" if api_lang=="ar" else ""}>AR</option>
-        </select>
-        <button class="btn" type="submit">{tr(lang,'search')}</button>
-      </form>
-    </div>
-    {f"<div class='card danger'><b>{tr(lang,'error')}:</b> {err}</div>" if err else ""}
-    {results_html}
-    """
-    return render_page(tr(lang, "quran_search"), body)
+    return render_view(
+        "quran_search.html", tr(lang, "quran_search"),
+        q=q, api_lang=api_lang, page=page, err=err, total=total, candidates=candidates, favs=favs,
+        pages=(total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE,
+    )
 
 
 @APP.post("/favorit/toggle")
@@ -1427,32 +3884,7 @@ def favorites():
     s = get_user_settings(uid)
     lang = s["lang"]
 
-    conn = db()
-    cur = conn.cursor()
-    cur.execute("SELECT verse_key, added_at FROM favorites WHERE user_id=? ORDER BY id DESC", (uid,))
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
-        return render_page(tr(lang, "favorites"), f"<div class='card'><h2>⭐ {tr(lang,'favorites')}</h2><p class='muted'>{tr(lang,'no_favorites')}</p></div>")
-
-    items = ""
-    for r in rows:
-        vk = r["verse_key"]
-        items += f"""
-        <div class="card">
-          <div class="row" style="justify-content:space-between;">
-            <b>{vk}</b>
-            <form method="post" action="{url_for('favorite_toggle')}" style="margin:0;">
-              <input type="hidden" name="verse_key" value="{vk}">
-              <input type="hidden" name="return_to" value="{url_for('favorites')}">
-              <button class="btn" type="submit">⭐ {tr(lang,'remove')}</button>
-            </form>
-          </div>
-          <div class="muted small" style="margin-top:8px;">{tr(lang,'added')}: {r["added_at"]}</div>
-        </div>
-        """
-    return render_page(tr(lang, "favorites"), f"<div class='card'><h2 style='margin-top:0;'>⭐ {tr(lang,'favorites')}</h2><p class='muted'>{tr(lang,'favorites_tip')}</p></div>{items}")
+    return render_view("favorites.html", tr(lang, "favorites"), rows=list_favorites(uid))
 
 
 @APP.get("/settings")
@@ -1462,102 +3894,7 @@ def settings():
     s = get_user_settings(uid)
     lang = s["lang"]
 
-    lang_options = "".join([f"<option value='{code}' {'selected' if code==s['lang'] else ''}>{name}</option>" for code, name in LANGS])
-    theme_options = "".join([
-        f"<option value='auto' {'selected' if s['theme']=='auto' else ''}>{tr(lang,'auto')}</option>",
-        f"<option value='dark' {'selected' if s['theme']=='dark' else ''}>{tr(lang,'dark')}</option>",
-        f"<option value='light' {'selected' if s['theme']=='light' else ''}>{tr(lang,'light')}</option>",
-    ])
-
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">⚙ {tr(lang,'settings')}</h2>
-      <form method="post" action="{url_for('settings_save')}">
-        <div class="row">
-          <label class="muted">{tr(lang,'language')}</label>
-          <select name="lang">{lang_options}</select>
-        </div>
-
-        <div style="margin-top:10px;">
-          <div class="muted">“Sprachen: BS DE EN TR AR FR IT ES … / City Suche tippen”</div>
-          <input id="citySearch" placeholder="{tr(lang,'pick_city')}…" autocomplete="off" style="width:100%; margin-top:10px;">
-          <div id="cityResults" class="listbox" style="display:none;"></div>
-          <input type="hidden" name="city" id="cityValue" value="{s['city']}">
-          <input type="hidden" name="country" id="countryValue" value="{s['country']}">
-          <div class="muted small" style="margin-top:10px;">{tr(lang,'city')}: <b id="pickedCity">{s['city']}</b> • {tr(lang,'country')}: <b id="pickedCountry">{s['country']}</b></div>
-        </div>
-
-        <div class="row" style="margin-top:12px;">
-          <div>
-            <div class="muted small">{tr(lang,'method')}</div>
-            <select name="method">
-              <option value="3" {"selected" if s['method']=="3" else ""}>3 - Muslim World League</option>
-              <option value="5" {"selected" if s['method']=="5" else ""}>5 - Egypt</option>
-              <option value="13" {"selected" if s['method']=="13" else ""}>13 - Kuwait</option>
-              <option value="2" {"selected" if s['method']=="2" else ""}>2 - ISNA</option>
-              <option value="4" {"selected" if s['method']=="4" else ""}>4 - Umm al-Qura</option>
-            </select>
-          </div>
-
-          <div>
-            <div class="muted small">{tr(lang,'theme')}</div>
-            <select name="theme">{theme_options}</select>
-          </div>
-        </div>
-
-        <div style="margin-top:14px;" class="row">
-          <button class="btn" type="submit">✅ {tr(lang,'save')}</button>
-          <a class="pill" href="{url_for('home')}">← {tr(lang,'home')}</a>
-        </div>
-      </form>
-    </div>
-
-    <script>
-      const input = document.getElementById("citySearch");
-      const box = document.getElementById("cityResults");
-      const cityValue = document.getElementById("cityValue");
-      const countryValue = document.getElementById("countryValue");
-      const pickedCity = document.getElementById("pickedCity");
-      const pickedCountry = document.getElementById("pickedCountry");
-      let timer = null;
-
-      function hideBox() { box.style.display="none"; box.innerHTML=""; }
-      function showResults(items) {
-        if (!items || items.length===0) { hideBox(); return; }
-        box.innerHTML="";
-        items.forEach(it=>{
-          const b=document.createElement("button");
-          b.type="button";
-          b.textContent=it.label;
-          b.addEventListener("click", ()=>{
-            cityValue.value=it.city;
-            countryValue.value=it.country;
-            pickedCity.textContent=it.city;
-            pickedCountry.textContent=it.country;
-            input.value=it.city + ", " + it.country;
-            hideBox();
-          });
-          box.appendChild(b);
-        });
-        box.style.display="block";
-      }
-      async function doSearch(q){
-        const res=await fetch("/api/city_search?q="+encodeURIComponent(q));
-        const data=await res.json();
-        showResults(data.results||[]);
-      }
-      input.addEventListener("input", ()=>{
-        const q=input.value.trim();
-        if (timer) clearTimeout(timer);
-        if (q.length<2){ hideBox(); return; }
-        timer=setTimeout(()=>doSearch(q), 350);
-      });
-      document.addEventListener("click",(e)=>{
-        if (!box.contains(e.target) && e.target!==input) hideBox();
-      });
-    </script>
-    """
-    return render_page(tr(lang, "settings"), body)
+    return render_view("settings.html", tr(lang, "settings"), s=s, langs=LANGS)
 
 
 @APP.post("/settings/save")
@@ -1593,11 +3930,117 @@ def settings_save():
 def api_city_search():
     q = (request.args.get("q") or "").strip()
     try:
-        return jsonify({"results": search_city_nominatim(q)})
+        return jsonify({"results": search_city(q)})
     except Exception:
         return jsonify({"results": []})
 
 
+# JSON-API für die Mobile-App: dieselben Daten wie /, /gebetszeiten, /tracker und /favoriten,
+# ohne Layout. Der ETag kommt aus Einstellungen, Tag, nächstem Gebet und users.data_version,
+# steht also fest, bevor die Antwort gebaut wird; bei If-None-Match -> 304 ohne weitere Abfragen.
+API_VERSION = 1
+
+
+def api_error(status: int, message: str):
+    resp = jsonify({"error": message})
+    resp.status_code = status
+    return resp
+
+
+def api_conditional(etag_parts: tuple, build):
+    etag = hashlib.sha1(repr((API_VERSION,) + etag_parts).encode("utf-8")).hexdigest()[:24]
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = jsonify(build())
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.vary.add("Cookie")
+    return resp
+
+
+def _api_prayer(s: dict) -> tuple[Optional[dict], Optional[str]]:
+    try:
+        timings, tz_name, next_name, next_iso = compute_next_prayer(s["city"], s["country"], s["method"])
+    except Exception as e:
+        return None, str(e)
+    return {
+        "city": s["city"], "country": s["country"], "method": s["method"], "timezone": tz_name,
+        "timings": {p: timings.get(p) for p in PRAYERS},
+        "next": {"name": next_name, "at": next_iso} if next_name else None,
+    }, None
+
+
+def _api_user_data(uid: int, parts: tuple[str, ...]) -> dict:
+    out = {}
+    if "tracker" in parts:
+        done = done_today_set(uid)
+        out["tracker"] = {"day": today_str(), "done_today": [p for p in PRAYERS if p in done], "streak": compute_streak(uid)}
+    if "favorites" in parts:
+        out["favorites"] = [{"verse_key": r["verse_key"], "added_at": r["added_at"]} for r in list_favorites(uid)]
+    return out
+
+
+@APP.get("/api/v1/prayer-times")
+def api_prayer_times():
+    u = current_user()
+    s = get_user_settings(u["id"] if u else None)
+    prayer, err = _api_prayer(s)
+    if err:
+        return api_error(503, err)
+    key = ("prayer", prayer["city"], prayer["country"], prayer["method"], prayer["timings"], prayer["next"])
+    return api_conditional(key, lambda: {"prayer": prayer})
+
+
+@APP.get("/api/v1/tracker")
+def api_tracker():
+    u = current_user()
+    if not u:
+        return api_error(401, "login required")
+    key = ("tracker", u["id"], u["data_version"], today_str())
+    return api_conditional(key, lambda: _api_user_data(u["id"], ("tracker",)))
+
+
+@APP.get("/api/v1/favorites")
+def api_favorites():
+    u = current_user()
+    if not u:
+        return api_error(401, "login required")
+    key = ("favorites", u["id"], u["data_version"])
+    return api_conditional(key, lambda: _api_user_data(u["id"], ("favorites",)))
+
+
+@APP.get("/api/v1/dashboard")
+def api_dashboard():
+    # alles für den Startbildschirm in einem Request; anonym nur die Gebetszeiten
+    u = current_user()
+    uid = u["id"] if u else None
+    prayer, err = _api_prayer(get_user_settings(uid))
+    key = ("dashboard", uid, u["data_version"] if u else None, today_str(),
+           prayer and (prayer["city"], prayer["country"], prayer["method"], prayer["timings"], prayer["next"]), err)
+
+    def build():
+        out = {"prayer": prayer, "prayer_error": err}
+        if uid:
+            out.update(_api_user_data(uid, ("tracker", "favorites")))
+        return out
+
+    return api_conditional(key, build)
+
+
+def sql_top_statements(n: int = SQL_TOP_N) -> dict:
+    # Top-N nach Gesamtzeit, über alle Worker summiert (aus den Metrik-Snapshots)
+    calls = {lbl["sql"]: v for lbl, v in metrics.counters("sql_statement_calls_total")}
+    secs = {lbl["sql"]: v for lbl, v in metrics.counters("sql_statement_seconds_total")}
+    top = sorted(secs.items(), key=lambda kv: kv[1], reverse=True)[:n]
+    nplus1 = sorted(metrics.counters("sql_nplus1_total"), key=lambda x: x[1], reverse=True)[:n]
+    return {
+        "top": [{"sql": sql, "calls": int(calls.get(sql, 0)), "total_ms": t * 1000,
+                 "avg_ms": t * 1000 / calls[sql] if calls.get(sql) else 0.0} for sql, t in top],
+        "nplus1": [{"route": lbl["route"], "sql": lbl["sql"], "requests": int(v)} for lbl, v in nplus1],
+    }
+
+
 @APP.get("/admin")
 @admin_required
 def admin_panel():
@@ -1613,85 +4056,27 @@ def admin_panel():
     cur = conn.cursor()
     cur.execute("SELECT id, username, role, is_blocked, created_at FROM users ORDER BY created_at ASC")
     users = cur.fetchall()
-    conn.close()
-
-    rows = ""
-    for x in users:
-        is_me = (x["username"] == ADMIN_USERNAME)
-        status = tr(lang, "blocked") if x["is_blocked"] == 1 else tr(lang, "active")
-        actions = []
-        if not is_me:
-            if x["is_blocked"] == 1:
-                actions.append(f"<a class='pill' href='{url_for('admin_unblock', user_id=x['id'])}'>{tr(lang,'unblock')}</a>")
-            else:
-                actions.append(f"<a class='pill' href='{url_for('admin_block', user_id=x['id'])}'>{tr(lang,'block')}</a>")
-            if x["role"] == "admin":
-                actions.append(f"<a class='pill' href='{url_for('admin_make_user', user_id=x['id'])}'>{tr(lang,'make_user')}</a>")
-            else:
-                actions.append(f"<a class='pill' href='{url_for('admin_make_admin', user_id=x['id'])}'>{tr(lang,'make_admin')}</a>")
-
-        rows += f"""
-        <tr>
-          <td><b>{x['username']}</b></td>
-          <td>{x['role']}</td>
-          <td>{status}</td>
-          <td class="small">{x['created_at']}</td>
-          <td>{" ".join(actions) if actions else "<span class='muted small'>—</span>"}</td>
-        </tr>
-        """
-
-    body = f"""
-    <div class="card">
-      <h2 style="margin-top:0;">🛡 {tr(lang,'admin_panel')}</h2>
-
-      <div class="card">
-        <h3 style="margin-top:0;">⚙ {tr(lang,'site_settings')}</h3>
-        <form method="post" action="{url_for('admin_site_settings')}">
-          <div class="row">
-            <label class="muted small">{tr(lang,'allow_register')}</label>
-            <select name="allow_register">
-              <option value="1" {"selected" if allow_register=="1" else ""}>{tr(lang,'yes')}</option>
-              <option value="0" {"selected" if allow_register=="0" else ""}>{tr(lang,'no')}</option>
-            </select>
-          </div>
-
-          <div class="row" style="margin-top:10px;">
-            <label class="muted small">{tr(lang,'invite_codes')}</label>
-            <input name="invite_codes" value="{invite_codes}" placeholder="code1, code2, code3" style="width:100%;">
-          </div>
-
-          <div class="row" style="margin-top:12px;">
-            <button class="btn" type="submit">{tr(lang,'update')}</button>
-          </div>
-          <div class="muted small" style="margin-top:10px;">Beispiel: <b>i3mad2026, bosna, vip2026</b></div>
-        </form>
-      </div>
+    cur.execute("SELECT * FROM prefetch_status ORDER BY fails DESC, last_ok_at ASC LIMIT 20")
+    prefetch = cur.fetchall()
+
+    return render_view(
+        "admin.html", tr(lang, "admin_panel"),
+        allow_register=allow_register, invite_codes=invite_codes, users=users,
+        admin_username=ADMIN_USERNAME, upstream_stats=sorted(upstream.stats().items()),
+        prefetch=prefetch, sql_top=sql_top_statements() if SQL_TRACE else None,
+    )
 
-      <div class="card">
-        <h3 style="margin-top:0;">🔐 {tr(lang,'change_admin_pass')}</h3>
-        <form method="post" action="{url_for('admin_change_password')}">
-          <div class="row">
-            <input name="new_password" type="password" placeholder="{tr(lang,'new_password')}" required>
-            <button class="btn" type="submit">{tr(lang,'update')}</button>
-          </div>
-          <div class="muted small" style="margin-top:10px;">Bitte ändere sofort das Startpasswort <b>123456</b>.</div>
-        </form>
-      </div>
 
-      <h3>👤 {tr(lang,'users')}</h3>
-      <table>
-        <tr>
-          <th>{tr(lang,'username')}</th>
-          <th>{tr(lang,'role')}</th>
-          <th>{tr(lang,'status')}</th>
-          <th>{tr(lang,'created')}</th>
-          <th>Actions</th>
-        </tr>
-        {rows}
-      </table>
-    </div>
-    """
-    return render_page(tr(lang, "admin_panel"), body)
+@APP.get("/admin/metrics")
+def admin_metrics():
+    auth = request.headers.get("Authorization", "")
+    if not (METRICS_TOKEN and hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode())):
+        u = current_user()
+        if not u:
+            return redirect(url_for("login", next=request.path))
+        if u["role"] != "admin":
+            abort(403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @APP.post("/admin/site")
@@ -1718,7 +4103,6 @@ def admin_change_password():
     cur = conn.cursor()
     cur.execute("UPDATE users SET password_hash=? WHERE username=?", (generate_password_hash(new_pw), ADMIN_USERNAME))
     conn.commit()
-    conn.close()
     return redirect(url_for("admin_panel"))
 
 
@@ -1729,7 +4113,6 @@ def admin_block(user_id: int):
     cur = conn.cursor()
     cur.execute("UPDATE users SET is_blocked=1 WHERE id=? AND username<>?", (user_id, ADMIN_USERNAME))
     conn.commit()
-    conn.close()
     return redirect(url_for("admin_panel"))
 
 
@@ -1740,7 +4123,6 @@ def admin_unblock(user_id: int):
     cur = conn.cursor()
     cur.execute("UPDATE users SET is_blocked=0 WHERE id=? AND username<>?", (user_id, ADMIN_USERNAME))
     conn.commit()
-    conn.close()
     return redirect(url_for("admin_panel"))
 
 
@@ -1751,7 +4133,6 @@ def admin_make_admin(user_id: int):
     cur = conn.cursor()
     cur.execute("UPDATE users SET role='admin' WHERE id=? AND username<>?", (user_id, ADMIN_USERNAME))
     conn.commit()
-    conn.close()
     return redirect(url_for("admin_panel"))
 
 
@@ -1762,12 +4143,12 @@ def admin_make_user(user_id: int):
     cur = conn.cursor()
     cur.execute("UPDATE users SET role='user' WHERE id=? AND username<>?", (user_id, ADMIN_USERNAME))
     conn.commit()
-    conn.close()
     return redirect(url_for("admin_panel"))
 
 
 # Init DB also for gunicorn import
-init_db()
+with APP.app_context():
+    init_db()
 
 if __name__ == "__main__":
     APP.run(debug=True)
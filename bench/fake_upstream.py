@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+# Lokaler Ersatz für aladhan, alquran.cloud, die Quran-Suche und Nominatim,
+# mit einstellbarer Latenz und Fehlerrate (für bench/loadtest.py).
+#
+#   python bench/fake_upstream.py --port 9100 --latency 80 --jitter 40 --fail-rate 0.02
+#
+# Die App zeigt per Env darauf:
+#   ALADHAN_API=http://127.0.0.1:9100/aladhan QURAN_API=http://127.0.0.1:9100/quran
+#   QURAN_SEARCH_API=http://127.0.0.1:9100/qsearch NOMINATIM_API=http://127.0.0.1:9100/nominatim
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SURAH_AYAHS = [
+    7, 286, 200, 176, 120, 165, 206, 75, 129, 109, 123, 111, 43, 52, 99, 128, 111, 110, 98, 135,
+    112, 78, 118, 64, 77, 227, 93, 88, 69, 60, 34, 30, 73, 54, 45, 83, 182, 88, 75, 85,
+    54, 53, 89, 59, 37, 35, 38, 29, 18, 45, 60, 49, 62, 55, 78, 96, 29, 22, 24, 13,
+    14, 11, 11, 18, 12, 12, 30, 52, 52, 44, 28, 28, 20, 56, 40, 31, 50, 40, 46, 42,
+    29, 19, 36, 25, 22, 17, 19, 26, 30, 20, 15, 21, 11, 8, 8, 19, 5, 8, 8, 11,
+    11, 8, 3, 9, 5, 4, 7, 3, 6, 3, 5, 4, 5, 6,
+]
+SURAH_START = [sum(SURAH_AYAHS[:i]) for i in range(len(SURAH_AYAHS))]
+WORDS = ["mercy", "merciful", "lord", "worlds", "guidance", "patience", "light", "path", "believe", "prayer"]
+
+
+def ayah_text(edition: str, surah: int, n: int) -> str:
+    if edition.startswith("quran-"):
+        return f"بِسْمِ ٱللَّهِ ٱلرَّحْمَـٰنِ ٱلرَّحِيمِ {surah}:{n}"
+    rnd = random.Random(surah * 1000 + n)
+    return f"[{edition}] {surah}:{n} " + " ".join(rnd.choice(WORDS) for _ in range(12))
+
+
+def surah_meta(n: int) -> dict:
+    return {
+        "number": n,
+        "name": f"سورة {n}",
+        "englishName": f"Surah {n}",
+        "englishNameTranslation": f"Chapter {n}",
+        "numberOfAyahs": SURAH_AYAHS[n - 1],
+        "revelationType": "Meccan" if n % 2 else "Medinan",
+    }
+
+
+def surah_data(n: int, edition: str, offset: int = 0, limit: int | None = None) -> dict:
+    count = SURAH_AYAHS[n - 1]
+    last = count if limit is None else min(count, offset + limit)
+    ayahs = [
+        {"number": SURAH_START[n - 1] + i, "numberInSurah": i, "text": ayah_text(edition, n, i)}
+        for i in range(offset + 1, last + 1)
+    ]
+    return dict(surah_meta(n), ayahs=ayahs, edition={"identifier": edition})
+
+
+def ayah_data(number: int, edition: str) -> dict:
+    surah = max(i for i, start in enumerate(SURAH_START) if start < number) + 1
+    n = number - SURAH_START[surah - 1]
+    return {"number": number, "numberInSurah": n, "text": ayah_text(edition, surah, n), "surah": surah_meta(surah)}
+
+
+def timings(city: str, day: date) -> dict:
+    rnd = random.Random(f"{city}|{day}")
+    base = [5 * 60, 12 * 60 + 30, 15 * 60 + 30, 18 * 60 + 10, 19 * 60 + 40]
+    names = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
+    out = {name: f"{(m + rnd.randint(-20, 20)) // 60:02d}:{(m + rnd.randint(-20, 20)) % 60:02d}" for name, m in zip(names, base)}
+    out["Sunrise"] = "07:00"
+    return {
+        "timings": out,
+        "date": {"gregorian": {"date": day.strftime("%d-%m-%Y")}},
+        "meta": {"timezone": "Europe/Vienna", "latitude": 48.16, "longitude": 14.03},
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeUpstream/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        cfg = self.server.cfg
+        delay = max(0.0, random.gauss(cfg.latency, cfg.jitter)) / 1000 if cfg.jitter else cfg.latency / 1000
+        time.sleep(delay)
+        with self.server.lock:
+            self.server.count += 1
+        if random.random() < cfg.fail_rate:
+            return self._send(503, {"code": 503, "status": "Service Unavailable"})
+
+        url = urlsplit(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            payload = self.route(parts, q)
+        except (ValueError, IndexError, KeyError):
+            return self._send(404, {"code": 404, "status": "Not Found"})
+        if payload is None:
+            return self._send(404, {"code": 404, "status": "Not Found"})
+        self._send(200, payload)
+
+    def route(self, parts: list[str], q: dict):
+        if parts[:2] == ["aladhan", "timingsByCity"]:
+            day = datetime.strptime(parts[2], "%d-%m-%Y").date() if len(parts) > 2 else date.today()
+            return {"code": 200, "data": timings(q.get("city", ""), day)}
+
+        if parts[:2] == ["aladhan", "calendarByCity"]:
+            year, month = int(parts[2]), int(parts[3])
+            days = [date(year, month, 1) + timedelta(days=i) for i in range(31)]
+            out = []
+            for day in (d for d in days if d.month == month):
+                t = timings(q.get("city", ""), day)
+                t["timings"] = {k: f"{v} (CET)" for k, v in t["timings"].items()}
+                out.append(t)
+            return {"code": 200, "data": out}
+
+        if parts[:1] == ["quran"]:
+            if parts[1:] == ["surah"]:
+                return {"code": 200, "data": [surah_meta(n) for n in range(1, 115)]}
+            if parts[1] == "surah":
+                n = int(parts[2])
+                if not 1 <= n <= 114:
+                    return None
+                offset, limit = int(q.get("offset", 0)), (int(q["limit"]) if "limit" in q else None)
+                if parts[3] == "editions":
+                    return {"code": 200, "data": [surah_data(n, ed, offset, limit) for ed in parts[4].split(",")]}
+                return {"code": 200, "data": surah_data(n, parts[3], offset, limit)}
+            if parts[1] == "ayah":
+                return {"code": 200, "data": ayah_data(int(parts[2]), parts[3])}
+            if parts[1] == "quran":
+                return {"code": 200, "data": {"surahs": [surah_data(n, parts[2]) for n in range(1, 115)]}}
+
+        if parts == ["qsearch", "search"]:
+            word = (q.get("q") or "").lower()
+            hits = []
+            for i in range(25):
+                rnd = random.Random(f"{word}|{i}")
+                s = rnd.randint(1, 114)
+                n = rnd.randint(1, SURAH_AYAHS[s - 1])
+                hits.append({"verseKey": f"{s}:{n}", "text": ayah_text("en.sahih", s, n).replace(word, f"<em>{word}</em>")})
+            return {"results": hits}
+
+        if parts == ["nominatim", "search"]:
+            name = (q.get("q") or q.get("city") or "Wels").split(",")[0].strip().title()
+            return [{
+                "display_name": f"{name}, Austria",
+                "address": {"city": name, "country": "Austria"},
+                "lat": "48.16",
+                "lon": "14.03",
+            }]
+        return None
+
+
+def make_server(host: str, port: int, latency: float, jitter: float, fail_rate: float) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    srv.request_queue_size = 1024
+    srv.cfg = argparse.Namespace(latency=latency, jitter=jitter, fail_rate=fail_rate)
+    srv.lock = threading.Lock()
+    srv.count = 0
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake upstream APIs for load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", type=float, default=50, help="mittlere Antwortzeit in ms")
+    ap.add_argument("--jitter", type=float, default=0, help="Standardabweichung in ms")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="Anteil 503-Antworten (0..1)")
+    args = ap.parse_args()
+    srv = make_server(args.host, args.port, args.latency, args.jitter, args.fail_rate)
+    print(f"fake upstream on http://{args.host}:{srv.server_address[1]}", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+# Last-Test: startet bench/fake_upstream.py und die App unter gunicorn (temporäre DB),
+# erzeugt gemischten Traffic (anonym / eingeloggt) und schreibt einen JSON-Report
+# mit Durchsatz und p50/p90/p99 pro Route.
+#
+#   python bench/loadtest.py --duration 30 --concurrency 64 --anon 0.6 --latency 80 --out report.json
+#   python bench/loadtest.py --base-url http://127.0.0.1:8000   # gegen eine laufende Instanz
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ADMIN_USERNAME = "i3mad"
+ADMIN_PASSWORD = "123456"
+INVITE_CODE = "i3mad2026"
+SEARCH_WORDS = ["mercy", "merciful", "lord", "guidance", "patience", "light", "prayer"]
+
+# (Route für den Report, Gewicht, Pfad-Generator)
+ANON_MIX = [
+    ("/", 40, lambda: "/"),
+    ("/gebetszeiten", 20, lambda: "/gebetszeiten"),
+    ("/quran/<n>", 25, lambda: f"/quran/{random.randint(1, 114)}"),
+    ("/quran/suche", 15, lambda: f"/quran/suche?q={random.choice(SEARCH_WORDS)}&api_lang=en"),
+]
+USER_MIX = [
+    ("/", 30, lambda: "/"),
+    ("/gebetszeiten", 10, lambda: "/gebetszeiten"),
+    ("/tracker", 15, lambda: "/tracker"),
+    ("/quran/<n>", 20, lambda: f"/quran/{random.randint(1, 114)}"),
+    ("/quran/suche", 10, lambda: f"/quran/suche?q={random.choice(SEARCH_WORDS)}&api_lang=en"),
+    ("/favoriten", 10, lambda: "/favoriten"),
+]
+ADMIN_MIX = USER_MIX + [("/admin", 10, lambda: "/admin")]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url: str, timeout: float = 30):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} not reachable after {timeout:g}s")
+
+
+def start_stack(args, tmp: Path):
+    up_port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, str(ROOT / "bench" / "fake_upstream.py"), "--port", str(up_port),
+         "--latency", str(args.latency), "--jitter", str(args.jitter), "--fail-rate", str(args.fail_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    up = f"http://127.0.0.1:{up_port}"
+    env = dict(
+        os.environ,
+        DB_PATH=str(tmp / "app.db"),
+        SECRET_KEY="loadtest",
+        ALADHAN_API=f"{up}/aladhan",
+        QURAN_API=f"{up}/quran",
+        QURAN_SEARCH_API=f"{up}/qsearch",
+        NOMINATIM_API=f"{up}/nominatim",
+    )
+    if args.worker_class:
+        env["GUNICORN_WORKER_CLASS"] = args.worker_class
+    wait_http(f"{up}/quran/surah")
+
+    if args.import_quran:
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "import-quran"], cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    app_port = free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{app_port}",
+           "--workers", str(args.workers), "--log-level", "warning", "app:APP"]
+    server = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{app_port}"
+    wait_http(f"{base}/settings", timeout=60)
+    return base, [server, fake]
+
+
+def login(base: str, username: str, password: str) -> requests.Session:
+    s = requests.Session()
+    r = s.post(f"{base}/login", data={"username": username, "password": password, "ts": int((time.time() - 5) * 1000)})
+    if "session" not in s.cookies:
+        raise RuntimeError(f"login failed for {username}: HTTP {r.status_code}")
+    return s
+
+
+def register(base: str, username: str, password: str) -> requests.Session:
+    s = requests.Session()
+    s.post(f"{base}/register", data={
+        "username": username, "password": password, "password2": password,
+        "invite_code": INVITE_CODE, "website": "", "ts": int((time.time() - 5) * 1000),
+    })
+    if "session" not in s.cookies:
+        return login(base, username, password)
+    return s
+
+
+def seed_favorites(base: str, s: requests.Session, n: int):
+    # Achtung Rate-Limit "favorite" (60/min pro IP) über alle Sessions zusammen
+    for _ in range(n):
+        surah = random.randint(1, 114)
+        try:
+            s.post(f"{base}/favorit/toggle", data={"verse_key": f"{surah}:1", "return_to": "/favoriten"}, allow_redirects=False)
+        except requests.ConnectionError:
+            pass  # nach 429 schließt gunicorn die Keep-Alive-Verbindung
+
+
+def pick(mix):
+    route, _, make = random.choices(mix, weights=[w for _, w, _ in mix])[0]
+    return route, make()
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+def summarize(samples: list[tuple[str, int, float]], seconds: float) -> dict:
+    out = {}
+    for route in sorted({s[0] for s in samples}):
+        lat = sorted(s[2] for s in samples if s[0] == route)
+        errors = sum(1 for s in samples if s[0] == route and not 200 <= s[1] < 400)
+        out[route] = {
+            "count": len(lat),
+            "errors": errors,
+            "rps": round(len(lat) / seconds, 2),
+            "mean_ms": round(sum(lat) / len(lat) * 1000, 2),
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p90_ms": round(percentile(lat, 90) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2),
+        }
+    return out
+
+
+def run_load(base: str, args) -> dict:
+    random.seed(args.seed)
+    admin = login(base, ADMIN_USERNAME, ADMIN_PASSWORD)
+    users = [admin]
+    run_id = f"{int(time.time()) % 100000}"
+    for i in range(args.users - 1):
+        users.append(register(base, f"lt{run_id}_{i}", "loadtest-pass"))
+    for s in users:
+        seed_favorites(base, s, args.favorites)
+    cookies = [(s.cookies.get_dict(), ADMIN_MIX if s is admin else USER_MIX) for s in users]
+
+    samples: list[tuple[str, int, float]] = []
+    lock = threading.Lock()
+    stop = threading.Event()
+    measuring = threading.Event()
+
+    def client(worker: int):
+        rnd_user = random.Random(args.seed + worker)
+        anon = requests.Session()
+        logged = []
+        for cookie, mix in cookies:
+            s = requests.Session()
+            s.cookies.update(cookie)
+            logged.append((s, mix))
+        local = []
+        while not stop.is_set():
+            if rnd_user.random() < args.anon:
+                sess, mix = anon, ANON_MIX
+            else:
+                sess, mix = rnd_user.choice(logged)
+            route, path = pick(mix)
+            t0 = time.perf_counter()
+            try:
+                r = sess.get(base + path, timeout=args.timeout, headers={"Accept-Encoding": "gzip"})
+                status = r.status_code
+            except requests.RequestException:
+                status = 0
+            if measuring.is_set():
+                local.append((route, status, time.perf_counter() - t0))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    t0 = time.perf_counter()
+    time.sleep(args.duration)
+    measuring.clear()
+    seconds = time.perf_counter() - t0
+    stop.set()
+    for t in threads:
+        t.join(args.timeout + 5)
+
+    lat = sorted(s[2] for s in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not 200 <= s[1] < 400),
+        "rps": round(len(samples) / seconds, 2),
+        "p50_ms": round(percentile(lat, 50) * 1000, 2),
+        "p90_ms": round(percentile(lat, 90) * 1000, 2),
+        "p99_ms": round(percentile(lat, 99) * 1000, 2),
+        "seconds": round(seconds, 2),
+        "routes": summarize(samples, seconds),
+    }
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def print_report(rep: dict):
+    print(f"{'route':<16}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for route, st in rep["routes"].items():
+        print(f"{route:<16}{st['count']:>8}{st['errors']:>6}{st['rps']:>9.1f}{st['p50_ms']:>9.1f}{st['p90_ms']:>9.1f}{st['p99_ms']:>9.1f}{st['max_ms']:>9.1f}")
+    print(f"{'total':<16}{rep['requests']:>8}{rep['errors']:>6}{rep['rps']:>9.1f}{rep['p50_ms']:>9.1f}{rep['p90_ms']:>9.1f}{rep['p99_ms']:>9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="HTTP load test with stubbed upstreams")
+    ap.add_argument("--base-url", help="laufende Instanz testen statt gunicorn + Fake-Upstream zu starten")
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--warmup", type=float, default=3)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--anon", type=float, default=0.5, help="Anteil anonymer Requests (0..1)")
+    ap.add_argument("--users", type=int, default=4, help="eingeloggte Sessions inkl. Admin")
+    ap.add_argument("--favorites", type=int, default=10, help="Favoriten pro Session")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--worker-class", default="")
+    ap.add_argument("--latency", type=float, default=50, help="Fake-Upstream: mittlere Latenz in ms")
+    ap.add_argument("--jitter", type=float, default=20)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--import-quran", action="store_true", help="Quran vorab in die DB importieren")
+    ap.add_argument("--timeout", type=float, default=30)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="loadtest-report.json")
+    args = ap.parse_args()
+
+    procs = []
+    tmp = Path(tempfile.mkdtemp(prefix="islam-app-load-"))
+    try:
+        base = args.base_url.rstrip("/") if args.base_url else None
+        if base is None:
+            base, procs = start_stack(args, tmp)
+        result = run_load(base, args)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    config = {k: v for k, v in vars(args).items() if k != "out"}
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_rev(),
+        "config": config,
+        **result,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print_report(report)
+    print(f"report: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
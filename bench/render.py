@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+# CPU-Zeit pro Seite (ohne Netzwerk): startet die App gegen eine temporäre DB,
+# füllt Gebetszeiten-Cache und Quran-Store mit Testdaten und rendert jede Seite N-mal.
+#
+#   python bench/render.py [N]
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(tempfile.mkdtemp(prefix="islam-app-bench-"))
+
+import app  # noqa: E402
+
+PAGES = [
+    "/",
+    "/gebetszeiten",
+    "/tracker",
+    "/quran",
+    "/quran/2",
+    "/quran/2?count=286",
+    "/quran/suche?q=merciful&api_lang=en",
+    "/favoriten",
+    "/settings",
+    "/admin",
+]
+
+TIMINGS = {"Fajr": "05:30", "Dhuhr": "12:30", "Asr": "15:30", "Maghrib": "18:10", "Isha": "23:59"}
+
+
+def seed():
+    app._fetch_prayer_times_upstream = lambda city, country, method: (dict(TIMINGS), "Europe/Vienna", date.today().isoformat())
+    with app.APP.app_context():
+        conn = app.db()
+        cur = conn.cursor()
+        surahs, number = [], 0
+        for n in range(1, 115):
+            count = 286 if n == 2 else 7
+            ayahs = []
+            for i in range(1, count + 1):
+                number += 1
+                ayahs.append({"number": number, "numberInSurah": i, "text": f"In the name of God, the Entirely Merciful {n}:{i}"})
+            surahs.append({"number": n, "name": f"Surah {n}", "englishName": f"Surah {n}", "ayahs": ayahs})
+        app._store_surahs(cur, surahs)
+        for edition in (app.QURAN_ARABIC, app.QURAN_DEFAULT_TRANSLATION):
+            for su in surahs:
+                app._store_ayahs(cur, edition, su["number"], su["ayahs"])
+        for i in range(40):
+            cur.execute(
+                "INSERT OR IGNORE INTO favorites(user_id, verse_key, added_at) VALUES(1, ?, '2026-01-01 00:00:00')",
+                (f"2:{i + 1}",),
+            )
+        conn.commit()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed()
+    client = app.APP.test_client()
+    client.post("/login", data={"username": app.ADMIN_USERNAME, "password": app.ADMIN_START_PASSWORD})
+    for path in PAGES:
+        r = client.get(path)
+        assert r.status_code == 200, (path, r.status_code)
+
+    print(f"{'page':40} {'cpu ms/req':>10} {'bytes':>8}")
+    for path in PAGES:
+        t0 = time.process_time()
+        for _ in range(n):
+            r = client.get(path)
+            r.get_data()
+        cpu = (time.process_time() - t0) / n * 1000
+        print(f"{path:40} {cpu:10.3f} {len(r.get_data()):8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# gunicorn -c gunicorn.conf.py app:APP
+#
+# Die Seiten warten fast nur auf aladhan, alquran.cloud und Nominatim. Mit gevent
+# (pip install gevent) wird jeder Request ein Greenlet: requests/urllib3, Locks und
+# der Upstream-Pool werden kooperativ, tausende offene Requests teilen sich wenige
+# Prozesse, und der Code (und damit das HTML) bleibt derselbe wie im sync-Modus.
+# gevent ist optional (nicht in requirements.txt); ohne gevent: gthread als Fallback.
+#
+# Achtung: sqlite3 ist C-Code und gibt den gevent-Hub nicht frei. Jede Abfrage, auch das
+# Warten auf busy_timeout bei Schreibsperren, blockiert alle Greenlets des Workers.
+# gevent lohnt sich nur, solange die Seiten auf Upstreams warten und nicht auf SQLite;
+# bei schreiblastigen Seiten (Tracker, Login) lieber gthread (GUNICORN_WORKER_CLASS=gthread).
+import multiprocessing
+import os
+import tempfile
+from pathlib import Path
+
+try:
+    import gevent  # noqa: F401
+    HAVE_GEVENT = True
+except ImportError:
+    HAVE_GEVENT = False
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or ("gevent" if HAVE_GEVENT else "gthread")
+if worker_class == "gevent" and not HAVE_GEVENT:
+    worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 20
+keepalive = 5
+
+if worker_class == "gevent":
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+    # nur mit aktivem gevent: Fan-out-Pool und HTTP-Pools an die Greenlet-Anzahl anpassen
+    # (Env wird an die Worker vererbt); unter gthread bleiben die Standardwerte
+    os.environ.setdefault("UPSTREAM_THREADS", str(worker_connections))
+    os.environ.setdefault("UPSTREAM_POOL_SIZE", str(min(worker_connections, 100)))
+else:
+    threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+# Metriken: jeder Worker schreibt nach METRICS_DIR/<pid>.json, /admin/metrics summiert.
+# Beendete Worker bleiben drin (Counter laufen weiter), beim Neustart des Masters wird geleert.
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"islam-app-metrics-{os.getpid()}"))
+
+
+def on_starting(server):
+    d = Path(os.environ["METRICS_DIR"])
+    d.mkdir(parents=True, exist_ok=True)
+    for p in d.glob("*.json"):
+        p.unlink(missing_ok=True)
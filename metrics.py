@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from functools import wraps
+from pathlib import Path
+
+# Kleine Metrik-Registry (Counter + Histogramme) im Prometheus-Textformat.
+# Jeder gunicorn-Worker schreibt seinen Stand regelmäßig nach METRICS_DIR/<pid>.json,
+# /admin/metrics summiert alle Dateien. Ohne METRICS_DIR nur der eigene Prozess.
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+FLUSH_INTERVAL = 5.0
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_LOCK = threading.Lock()
+_META: dict[str, dict] = {}
+_COUNTERS: dict[tuple, float] = {}
+_HISTS: dict[tuple, list[float]] = {}
+_LAST_FLUSH = {"t": 0.0}
+_FLUSHER: dict[str, int] = {}
+
+
+def describe(name: str, kind: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+    _META[name] = {"kind": kind, "help": help_text, "buckets": list(buckets)}
+
+
+def _key(name: str, labels: dict | None) -> tuple:
+    return (name,) + tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[k] = _COUNTERS.get(k, 0.0) + value
+
+
+def observe(name: str, value: float, labels: dict | None = None):
+    buckets = _META[name]["buckets"]
+    k = _key(name, labels)
+    with _LOCK:
+        h = _HISTS.get(k)
+        if h is None:
+            h = _HISTS[k] = [0.0] * (len(buckets) + 2)  # Buckets..., sum, count
+        for i, le in enumerate(buckets):
+            if value <= le:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def timed(name: str):
+    # Laufzeit einer Funktion als function_duration_seconds{fn=name}
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe("function_duration_seconds", time.perf_counter() - t0, {"fn": name})
+        return wrapper
+    return deco
+
+
+# Spans pro Request (für Server-Timing): name -> [Sekunden, Anzahl]. Die ContextVar hält
+# ein gemeinsames dict, Threads aus fan_out bekommen per spans_context dasselbe Objekt.
+_SPANS: ContextVar[dict | None] = ContextVar("spans", default=None)
+
+
+def start_spans() -> dict:
+    spans: dict[str, list[float]] = {}
+    _SPANS.set(spans)
+    return spans
+
+
+def stop_spans():
+    _SPANS.set(None)
+
+
+def spans_context() -> Context:
+    # frischer Context nur mit den Spans des Requests, ohne Flasks Request-Kontext
+    ctx = Context()
+    ctx.run(_SPANS.set, _SPANS.get())
+    return ctx
+
+
+def add_span(name: str, seconds: float):
+    spans = _SPANS.get()
+    if spans is None:
+        return
+    with _LOCK:
+        cur = spans.get(name)
+        if cur is None:
+            spans[name] = [seconds, 1]
+        else:
+            cur[0] += seconds
+            cur[1] += 1
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - t0)
+
+
+def server_timing(spans: dict, total: float) -> str:
+    # "db;dur=3.1;desc="12x", prayer_upstream;dur=120.4, total;dur=140.0"
+    parts = []
+    with _LOCK:
+        items = sorted(spans.items(), key=lambda kv: kv[1][0], reverse=True)
+    for name, (seconds, n) in items:
+        desc = f';desc="{int(n)}x"' if n > 1 else ""
+        parts.append(f"{name};dur={seconds * 1000:.1f}{desc}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def snapshot() -> dict:
+    with _LOCK:
+        return {
+            "counters": [[list(k), v] for k, v in _COUNTERS.items()],
+            "hists": [[list(k), list(h)] for k, h in _HISTS.items()],
+        }
+
+
+def _flusher():
+    # damit auch ein Worker, der gerade keine Requests bekommt, seinen letzten Stand abliefert
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush(force=True)
+
+
+def flush(force: bool = False):
+    if not METRICS_DIR:
+        return
+    if _FLUSHER.get("pid") != os.getpid():
+        _FLUSHER["pid"] = os.getpid()
+        threading.Thread(target=_flusher, name="metrics-flush", daemon=True).start()
+    now = time.time()
+    if not force and now - _LAST_FLUSH["t"] < FLUSH_INTERVAL:
+        return
+    _LAST_FLUSH["t"] = now
+    path = Path(METRICS_DIR) / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(snapshot()))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+atexit.register(flush, True)
+
+
+def _merged() -> tuple[dict, dict]:
+    snaps = []
+    if METRICS_DIR:
+        flush(force=True)
+        for p in Path(METRICS_DIR).glob("*.json"):
+            try:
+                snaps.append(json.loads(p.read_text()))
+            except (OSError, ValueError):
+                continue
+    else:
+        snaps.append(snapshot())
+    counters: dict[tuple, float] = {}
+    hists: dict[tuple, list[float]] = {}
+    for snap in snaps:
+        for k, v in snap["counters"]:
+            k = (k[0],) + tuple(tuple(x) for x in k[1:])
+            counters[k] = counters.get(k, 0.0) + v
+        for k, h in snap["hists"]:
+            k = (k[0],) + tuple(tuple(x) for x in k[1:])
+            cur = hists.get(k)
+            if cur is None or len(cur) != len(h):
+                hists[k] = list(h)
+            else:
+                hists[k] = [a + b for a, b in zip(cur, h)]
+    return counters, hists
+
+
+def counters(name: str) -> list[tuple[dict, float]]:
+    # summierte Werte eines Counters über alle Worker, z.B. für das Admin-Panel
+    merged, _ = _merged()
+    return [(dict(k[1:]), v) for k, v in merged.items() if k[0] == name]
+
+
+def _labels(pairs, extra: tuple = ()) -> str:
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _num(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render() -> str:
+    counters, hists = _merged()
+    out = []
+    names = sorted({k[0] for k in counters} | {k[0] for k in hists})
+    for name in names:
+        meta = _META.get(name, {"kind": "counter", "help": name, "buckets": list(DEFAULT_BUCKETS)})
+        out.append(f"# HELP {name} {meta['help']}")
+        out.append(f"# TYPE {name} {meta['kind']}")
+        if meta["kind"] == "histogram":
+            for k in sorted(x for x in hists if x[0] == name):
+                h = hists[k]
+                for le, n in zip(meta["buckets"], h):
+                    out.append(f"{name}_bucket{_labels(k[1:], (('le', _num(le)),))} {_num(n)}")
+                out.append(f"{name}_bucket{_labels(k[1:], (('le', '+Inf'),))} {_num(h[-1])}")
+                out.append(f"{name}_sum{_labels(k[1:])} {h[-2]!r}")
+                out.append(f"{name}_count{_labels(k[1:])} {_num(h[-1])}")
+        else:
+            for k in sorted(x for x in counters if x[0] == name):
+                out.append(f"{name}{_labels(k[1:])} {_num(counters[k])}")
+    return "\n".join(out) + "\n"
+
+
+describe("http_request_duration_seconds", "histogram", "Request latency by route, method and status.")
+describe("db_queries_per_request", "histogram", "SQL statements executed per request.", (1, 2, 5, 10, 20, 50, 100, 250))
+describe("db_queries_total", "counter", "SQL statements executed, by route ('background' for CLI, jobs and fan-out threads).")
+describe("upstream_request_duration_seconds", "histogram", "Upstream HTTP latency by host.")
+describe("upstream_requests_total", "counter", "Upstream HTTP calls by host and outcome (ok, error, rejected).")
+describe("function_duration_seconds", "histogram", "Duration of selected functions.")
+describe("sql_statement_calls_total", "counter", "SQL statements by normalized text (only with SQL_TRACE=1).")
+describe("sql_statement_seconds_total", "counter", "Time spent per normalized SQL statement (only with SQL_TRACE=1).")
+describe("sql_nplus1_total", "counter", "Requests that ran the same statement SQL_NPLUS1 times or more, by route and statement.")
+describe("cache_requests_total", "counter", "Cache lookups by cache and result (hit, miss).")
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+# Nimmt aladhan-Antworten (timingsByCity) als Fixtures für tests/test_prayer_engine.py auf.
+#
+#   python tests/record_aladhan.py              # live von api.aladhan.com -> fixtures/aladhan/
+#   python tests/record_aladhan.py --reference  # offline, NOAA/Meeus -> fixtures/reference/
+#
+# Die Referenzwerte sind nur eine zweite Sonnenstandsrechnung in aladhan-Payload-Form; sie
+# prüfen die Astronomie, nicht die Methoden/tune-Eigenheiten von aladhan (z.B. Diyanet).
+
+import argparse
+import json
+import math
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import requests
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+ALADHAN_API = "https://api.aladhan.com/v1"
+PRAYERS = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
+
+# (Datei-Präfix, Stadt, Land, Breite, Länge, Zeitzone, Methode)
+PLACES = [
+    ("wels", "Wels", "Austria", 48.1575, 14.0289, "Europe/Vienna", 3),
+    ("new-york", "New York", "United States", 40.7128, -74.0060, "America/New_York", 2),
+    ("makkah", "Makkah", "Saudi Arabia", 21.4225, 39.8262, "Asia/Riyadh", 4),
+    ("istanbul", "Istanbul", "Turkey", 41.0082, 28.9784, "Europe/Istanbul", 13),
+    ("oslo", "Oslo", "Norway", 59.9139, 10.7522, "Europe/Oslo", 3),
+]
+DAYS = [date(2026, 6, 21), date(2026, 12, 21)]
+
+# nur für --reference: Winkel bzw. Minuten nach Maghrib wie bei aladhan
+REFERENCE_METHODS = {
+    2: {"fajr": 15, "isha": 15},
+    3: {"fajr": 18, "isha": 17},
+    4: {"fajr": 18.5, "isha_min": 90},
+    13: {"fajr": 18, "isha": 17},
+}
+
+
+def record_live(city: str, country: str, method: int, day: date) -> dict:
+    r = requests.get(
+        f"{ALADHAN_API}/timingsByCity/{day:%d-%m-%Y}",
+        params={"city": city, "country": country, "method": method},
+        timeout=20,
+    )
+    r.raise_for_status()
+    payload = r.json()
+    payload["_source"] = f"api.aladhan.com, recorded {datetime.now():%Y-%m-%d}"
+    return payload
+
+
+def _noaa_sun(jd: float) -> tuple[float, float]:
+    # NOAA Solar Calculator (Meeus): Deklination in Grad, Zeitgleichung in Minuten
+    t = (jd - 2451545.0) / 36525
+    l0 = (280.46646 + t * (36000.76983 + t * 0.0003032)) % 360
+    m = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    c = (math.sin(math.radians(m)) * (1.914602 - t * (0.004817 + 0.000014 * t))
+         + math.sin(math.radians(2 * m)) * (0.019993 - 0.000101 * t) + math.sin(math.radians(3 * m)) * 0.000289)
+    omega = 125.04 - 1934.136 * t
+    lam = l0 + c - 0.00569 - 0.00478 * math.sin(math.radians(omega))
+    eps0 = 23 + (26 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    eps = eps0 + 0.00256 * math.cos(math.radians(omega))
+    decl = math.degrees(math.asin(math.sin(math.radians(eps)) * math.sin(math.radians(lam))))
+    y = math.tan(math.radians(eps / 2)) ** 2
+    l0r, mr = math.radians(l0), math.radians(m)
+    eqt = 4 * math.degrees(y * math.sin(2 * l0r) - 2 * e * math.sin(mr) + 4 * e * y * math.sin(mr) * math.cos(2 * l0r)
+                           - 0.5 * y * y * math.sin(4 * l0r) - 1.25 * e * e * math.sin(2 * mr))
+    return decl, eqt
+
+
+def _julian_day(day: date) -> float:
+    return day.toordinal() + 1721424.5
+
+
+def _reference_times(lat: float, lon: float, offset: float, day: date, method: int) -> dict[str, str]:
+    jd0 = _julian_day(day)
+
+    def noon(utc: float) -> float:
+        return 12 - lon / 15 - _noaa_sun(jd0 + utc / 24)[1] / 60
+
+    def at_altitude(alt: float, sign: int) -> float:
+        # zweimal iteriert: Sonnenstand zum jeweiligen Zeitpunkt statt zu Mittag
+        utc = noon(12)
+        for _ in range(3):
+            decl = _noaa_sun(jd0 + utc / 24)[0]
+            cos_h = ((math.sin(math.radians(alt)) - math.sin(math.radians(lat)) * math.sin(math.radians(decl)))
+                     / (math.cos(math.radians(lat)) * math.cos(math.radians(decl))))
+            if not -1 <= cos_h <= 1:
+                return math.nan
+            utc = noon(utc) + sign * math.degrees(math.acos(cos_h)) / 15
+        return utc
+
+    def asr_altitude() -> float:
+        decl = _noaa_sun(jd0 + noon(12) / 24)[0]
+        return math.degrees(math.atan(1 / (1 + math.tan(math.radians(abs(lat - decl))))))
+
+    p = REFERENCE_METHODS[method]
+    dhuhr = noon(12)
+    sunrise, sunset = at_altitude(-0.833, -1), at_altitude(-0.833, 1)
+    asr = at_altitude(asr_altitude(), 1)
+    night = 24 - (sunset - sunrise)
+    fajr = at_altitude(-p["fajr"], -1)
+    # winkelbasierte Regel für hohe Breiten (aladhan latitudeAdjustmentMethod=3)
+    if math.isnan(fajr) or sunrise - fajr > night * p["fajr"] / 60:
+        fajr = sunrise - night * p["fajr"] / 60
+    if "isha_min" in p:
+        isha = sunset + p["isha_min"] / 60
+    else:
+        isha = at_altitude(-p["isha"], 1)
+        if math.isnan(isha) or isha - sunset > night * p["isha"] / 60:
+            isha = sunset + night * p["isha"] / 60
+
+    def fmt(utc: float) -> str:
+        minutes = round((utc + offset) * 60) % (24 * 60)
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    return {"Fajr": fmt(fajr), "Dhuhr": fmt(dhuhr), "Asr": fmt(asr), "Maghrib": fmt(sunset), "Isha": fmt(isha)}
+
+
+def record_reference(lat: float, lon: float, tz: str, method: int, day: date) -> dict:
+    offset = datetime(day.year, day.month, day.day, 12, tzinfo=ZoneInfo(tz)).utcoffset().total_seconds() / 3600
+    return {
+        "_source": "offline reference (NOAA solar equations in tests/record_aladhan.py), not api.aladhan.com",
+        "code": 200,
+        "status": "OK",
+        "data": {
+            "timings": _reference_times(lat, lon, offset, day, method),
+            "date": {"gregorian": {"date": f"{day:%d-%m-%Y}"}},
+            "meta": {"latitude": lat, "longitude": lon, "timezone": tz, "method": {"id": method}},
+        },
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Record aladhan timingsByCity fixtures")
+    ap.add_argument("--reference", action="store_true", help="offline Referenzwerte statt aladhan")
+    args = ap.parse_args()
+
+    out = FIXTURES / ("reference" if args.reference else "aladhan")
+    out.mkdir(parents=True, exist_ok=True)
+    for slug, city, country, lat, lon, tz, method in PLACES:
+        for day in DAYS:
+            if args.reference:
+                payload = record_reference(lat, lon, tz, method, day)
+            else:
+                payload = record_live(city, country, method, day)
+            path = out / f"{slug}-m{method}-{day:%Y%m%d}.json"
+            path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+            print(path.name, {p: payload["data"]["timings"][p] for p in PRAYERS}, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
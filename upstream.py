@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Gemeinsamer HTTP-Client für aladhan, alquran.cloud, Nominatim & Co:
+# eine Session pro Host (Keep-Alive, Pool), wenige Retries mit Backoff und ein
+# Circuit Breaker, der nach mehreren Fehlern in Folge sofort abbricht.
+USER_AGENT = "IslamWebApp/1.0 (public demo)"
+POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "20"))
+RETRIES = 2
+BACKOFF = 0.3
+BREAKER_FAILS = 5
+BREAKER_RESET = 30.0
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+_LOCK = threading.Lock()
+_SESSIONS: dict[str, requests.Session] = {}
+_BREAKERS: dict[str, dict[str, float]] = {}
+_STATS: dict[str, dict[str, float]] = {}
+_LISTENERS: list = []
+
+
+def add_listener(fn):
+    # fn(host, seconds, outcome) mit outcome "ok" | "error" | "rejected"
+    _LISTENERS.append(fn)
+
+
+def _notify(host: str, seconds: float, outcome: str):
+    for fn in _LISTENERS:
+        try:
+            fn(host, seconds, outcome)
+        except Exception:
+            pass
+
+
+def _session(host: str) -> requests.Session:
+    with _LOCK:
+        s = _SESSIONS.get(host)
+        if s is None:
+            retry = Retry(
+                total=RETRIES,
+                connect=RETRIES,
+                read=0,
+                status=RETRIES,
+                backoff_factor=BACKOFF,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+            s = requests.Session()
+            s.headers["User-Agent"] = USER_AGENT
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _SESSIONS[host] = s
+        return s
+
+
+def _stats(host: str) -> dict[str, float]:
+    st = _STATS.get(host)
+    if st is None:
+        st = _STATS[host] = {"requests": 0, "errors": 0, "rejected": 0, "latency_sum": 0.0, "latency_max": 0.0}
+    return st
+
+
+def _breaker_allow(host: str) -> bool:
+    now = time.time()
+    with _LOCK:
+        b = _BREAKERS.setdefault(host, {"fails": 0, "open_until": 0.0, "trial": 0})
+        if not b["open_until"]:
+            return True
+        if now < b["open_until"] or b["trial"]:
+            _stats(host)["rejected"] += 1
+            return False
+        # halb offen: genau ein Probe-Request darf durch
+        b["trial"] = 1
+        return True
+
+
+def _record(host: str, seconds: float, ok: bool):
+    with _LOCK:
+        st = _stats(host)
+        st["requests"] += 1
+        st["latency_sum"] += seconds
+        st["latency_max"] = max(st["latency_max"], seconds)
+        b = _BREAKERS.setdefault(host, {"fails": 0, "open_until": 0.0, "trial": 0})
+        b["trial"] = 0
+        if ok:
+            b["fails"] = 0
+            b["open_until"] = 0.0
+            return
+        st["errors"] += 1
+        b["fails"] += 1
+        if b["fails"] >= BREAKER_FAILS or b["open_until"]:
+            b["open_until"] = time.time() + BREAKER_RESET
+
+
+def get(url: str, params=None, headers=None, timeout: float = 15) -> requests.Response:
+    host = urlsplit(url).netloc
+    if not _breaker_allow(host):
+        _notify(host, 0.0, "rejected")
+        raise CircuitOpenError(f"{host} is unavailable (circuit open)")
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        r = _session(host).get(url, params=params, headers=headers, timeout=timeout)
+        ok = r.status_code < 500
+        return r
+    finally:
+        seconds = time.perf_counter() - t0
+        _record(host, seconds, ok)
+        _notify(host, seconds, "ok" if ok else "error")
+
+
+def stats() -> dict[str, dict[str, float]]:
+    now = time.time()
+    with _LOCK:
+        out = {}
+        for host, st in _STATS.items():
+            b = _BREAKERS.get(host) or {}
+            out[host] = dict(st)
+            out[host]["latency_avg"] = st["latency_sum"] / st["requests"] if st["requests"] else 0.0
+            out[host]["circuit"] = "open" if b.get("open_until", 0) > now else ("half-open" if b.get("open_until") else "closed")
+        return out